@@ -148,6 +148,17 @@ DATACITE_PASSWORD = os.environ['DATACITE_PASSWORD']
 DATACITE_DOI_URL = 'http://search.datacite.org/works'
 DOI_BASE_URL = 'http://arapheno.1001genomes.org'
 
+# response cache for the REST downloads that is shared between the workers (set the path to None to disable it)
+RESPONSE_CACHE_PATH = os.path.join(BASE_DIR, 'response_cache.sqlite3')
+RESPONSE_CACHE_MAX_SIZE = 512 * 1024 * 1024
+# bigger responses are not cached (streamed downloads are only kept in memory up to this size)
+RESPONSE_CACHE_MAX_ENTRY_SIZE = 32 * 1024 * 1024
+
+# folder for the uploaded submissions until they are imported by the process_submissions worker
+SUBMISSION_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+# seconds after which a running import is considered lost (e.g. the worker was killed) and marked as failed
+SUBMISSION_JOB_TIMEOUT = 6 * 60 * 60
+
 
 LOGGING = {
     'version': 1,
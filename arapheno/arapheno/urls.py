@@ -98,9 +98,13 @@ restpatterns = [
 
     url(r'^rest/phenotype/(?P<q>%s)/values/$' % REGEX_PHENOTYPE, rest.phenotype_value),
     url(r'^rest/phenotype/(?P<q>%s)/similar/$' % REGEX_PHENOTYPE, rest.phenotype_similar_list),
+    url(r'^rest/phenotype/(?P<q>%s)/stats/$' % REGEX_PHENOTYPE, rest.phenotype_statistics),
+    url(r'^rest/phenotype/(?P<q>%s)/chart/$' % REGEX_PHENOTYPE, rest.phenotype_chart_data),
+    url(r'^rest/phenotype/(?P<q>%s)/geo/$' % REGEX_PHENOTYPE, rest.phenotype_geography),
 
     url(r'^rest/study/list/$', rest.study_list),
     url(r'^rest/study/(?P<q>%s)/$' % REGEX_STUDY, rest.study_detail),
+    url(r'^rest/study/(?P<q>%s)/geo/$' % REGEX_STUDY, rest.study_geography),
 
     url(r'^rest/study/(?P<q>%s)/phenotypes/$' % REGEX_STUDY, rest.study_all_pheno),
 
@@ -128,12 +132,19 @@ restpatterns = [
 
     url(r'rest/terms/(?P<acronym>%s)/$' % ONTOLOGY_SOURCE_REGEX, rest.ontology_tree_data,name='ontology_tree_root'),
 
-    url(r'rest/terms/(?P<term_id>%s)/$' % ONTOLOGY_REGEX, rest.ontology_tree_data,name='ontology_tree_children')
+    url(r'rest/terms/(?P<term_id>%s)/$' % ONTOLOGY_REGEX, rest.ontology_tree_data,name='ontology_tree_children'),
+
+    url(r'^rest/terms/(?P<term_id>%s)/descendants/$' % ONTOLOGY_REGEX, rest.ontology_term_descendants),
+
+    url(r'^rest/terms/(?P<term_id>%s)/ancestors/$' % ONTOLOGY_REGEX, rest.ontology_term_ancestors),
+
+    url(r'^rest/terms/(?P<term_id>%s)/phenotypes/$' % ONTOLOGY_REGEX, rest.ontology_term_phenotypes),
+
     #url(r'rest/ontology/(?P<pk>%s)/(?P<term_id>%s)' % ID_REGEX )
 
 ]
 #extend restpatterns with suffix options
-restpatterns = format_suffix_patterns(restpatterns, allowed=['json', 'csv', 'plink', 'zip'])
+restpatterns = format_suffix_patterns(restpatterns, allowed=['json', 'csv', 'plink', 'zip', 'npz'])
 '''
 Add REST patterns to urlpatterns
 '''
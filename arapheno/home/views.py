@@ -1,6 +1,5 @@
 from django.shortcuts import render
 from django.http import HttpResponseRedirect
-from django.db.models import Q
 
 from forms import GlobalSearchForm
 
@@ -8,6 +7,7 @@ from phenotypedb.models import Study, Phenotype, Accession, OntologyTerm
 from phenotypedb.tables import PhenotypeTable, StudyTable, AccessionTable, OntologyTermTable
 
 from django_tables2 import RequestConfig
+from utils import search
 
 '''
 Home View of AraPheno
@@ -59,44 +59,40 @@ def faqcite(request):
 Search Result View for Global Search in AraPheno
 '''
 def SearchResults(request,query=None):
+    # the querysets are ordered by relevance unless a column is sorted
+    phenotypes = search.filter_queryset('phenotype',Phenotype.objects.published(),query)
+    studies = search.filter_queryset('study',Study.objects.published().with_counts(),query)
+    accessions = search.filter_queryset('accession',Accession.objects.select_related('summary'),query)
+    ontologies = search.filter_queryset('ontology',OntologyTerm.objects.all(),query)
     if query==None:
-        phenotypes = Phenotype.objects.published().all()
-        studies = Study.objects.published().all()
-        accessions = Accession.objects.all()
-        ontologies = OntologyTerm.objects.all()
         download_url = "/rest/search"
     else:
-        phenotypes = Phenotype.objects.published().filter(Q(name__icontains=query) |
-                                              Q(to_term__id__icontains=query) |
-                                              Q(to_term__name__icontains=query))
-        studies = Study.objects.published().filter(name__icontains=query)
-        accessions = Accession.objects.filter(name__icontains=query)
-        ontologies = OntologyTerm.objects.filter(name__icontains=query)
         download_url = "/rest/search/" + str(query)
+    counts = search.count(query)
     
-    phenotype_table = PhenotypeTable(phenotypes,order_by="-name")
+    phenotype_table = PhenotypeTable(phenotypes)
     RequestConfig(request,paginate={"per_page":10}).configure(phenotype_table)
     
-    study_table = StudyTable(studies,order_by="-name")
+    study_table = StudyTable(studies)
     RequestConfig(request,paginate={"per_page":10}).configure(study_table)
 
-    accession_table = AccessionTable(accessions,order_by="-name")
+    accession_table = AccessionTable(accessions)
     RequestConfig(request,paginate={"per_page":10}).configure(accession_table)
 
-    ontologies_table = OntologyTermTable(ontologies,order_by="-name")
+    ontologies_table = OntologyTermTable(ontologies)
     RequestConfig(request,paginate={"per_page":10}).configure(ontologies_table)
     
     variable_dict = {}
     variable_dict['query'] = query
-    variable_dict['nphenotypes'] = phenotypes.count()
+    variable_dict['nphenotypes'] = counts['phenotype']
     variable_dict['phenotype_table'] = phenotype_table
     variable_dict['accession_table'] = accession_table
     variable_dict['ontologies_table'] = ontologies_table
     variable_dict['study_table'] = study_table
 
-    variable_dict['nstudies'] = studies.count()
-    variable_dict['naccessions'] = accessions.count()
-    variable_dict['nontologies'] = ontologies.count()
+    variable_dict['nstudies'] = counts['study']
+    variable_dict['naccessions'] = counts['accession']
+    variable_dict['nontologies'] = counts['ontology']
     variable_dict['download_url'] = download_url
 
     return render(request,'home/search_results.html',variable_dict)
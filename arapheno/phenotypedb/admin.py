@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.contenttypes.admin import GenericTabularInline
-from phenotypedb.models import Submission, Study, Phenotype, Curation, StudyCuration, PhenotypeCuration
+from phenotypedb.models import Submission, SubmissionJob, Study, Phenotype, Curation, StudyCuration, PhenotypeCuration
 
 class StudyCurationInline(admin.StackedInline):
     model = StudyCuration
@@ -26,12 +26,28 @@ class SubmissionAdmin(admin.ModelAdmin):
 
 
 
+@admin.register(SubmissionJob)
+class SubmissionJobAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'fullname', 'status', 'submission_date', 'start_date', 'end_date', 'message']
+    list_filter = ('status',)
+    readonly_fields = ('filename', 'path', 'start_date', 'end_date')
+
+
 @admin.register(Study)
 class StudyAdmin(admin.ModelAdmin):
     list_display = ['name', 'description', 'count_phenotypes','curation']
     readonly_fields = ('submission', 'species')
     inlines = [StudyCurationInline, ]
 
+    def get_queryset(self, request):
+        return super(StudyAdmin, self).get_queryset(request).with_counts()
+
+    def count_phenotypes(self, study):
+        """Returns number of phenotypes"""
+        return study.phenotype_count
+    count_phenotypes.short_description = '#Phenotypes'
+    count_phenotypes.admin_order_field = 'phenotype_count'
+
 
 @admin.register(Phenotype)
 class PhenotypeAdmin(admin.ModelAdmin):
@@ -5,3 +5,6 @@ from django.apps import AppConfig
 
 class PhenotypedbConfig(AppConfig):
     name = 'phenotypedb'
+
+    def ready(self):
+        import phenotypedb.receivers
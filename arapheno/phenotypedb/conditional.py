@@ -0,0 +1,94 @@
+"""
+Conditional GET requests (ETag / Last-Modified) for the REST endpoints of published studies and phenotypes
+The validators are computed with a single query, so that unchanged resources are answered
+with 304 before the data is loaded and serialized.
+"""
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from phenotypedb.models import Phenotype, Study
+
+
+def study_validators(pk):
+    """
+    Returns the modification dates of a published study and its phenotypes
+    """
+    return Study.objects.published().filter(pk=pk).annotate(Max('phenotype__update_date')).values_list(
+        'update_date', 'submission__update_date', 'submission__publication_date', 'phenotype__update_date__max').first()
+
+
+def phenotype_validators(pk):
+    """
+    Returns the modification dates of a published phenotype and its study
+    """
+    return Phenotype.objects.published().filter(pk=pk).values_list(
+        'update_date', 'study__update_date', 'study__submission__update_date', 'study__submission__publication_date').first()
+
+
+def study_list_validators():
+    """
+    Returns the latest modification dates and the number of the published studies
+    """
+    validators = Study.objects.published().aggregate(Max('update_date'), Max('submission__update_date'),
+                                                     Max('submission__publication_date'),
+                                                     Count('id', distinct=True), Count('phenotype'))
+    return tuple(validators[key] for key in sorted(validators))
+
+
+def phenotype_list_validators():
+    """
+    Returns the latest modification dates and the number of the published phenotypes
+    """
+    validators = Phenotype.objects.published().aggregate(Max('update_date'), Max('study__update_date'),
+                                                         Max('study__submission__update_date'),
+                                                         Max('study__submission__publication_date'), Count('id'))
+    return tuple(validators[key] for key in sorted(validators))
+
+
+def resource_condition(get_validators, pattern=None):
+    """
+    Returns a decorator for REST views that adds ETag and Last-Modified headers and answers
+    conditional GET requests with 304 without calling the view.
+    If a DOI pattern is given, the validators are looked up for the id or doi in the q argument of the view,
+    otherwise get_validators is called without arguments.
+    """
+    def _get_validators(request, q=None, **kwargs):
+        # the etag and the last modified function are called for the same request
+        if not hasattr(request, '_resource_validators'):
+            if pattern is None:
+                request._resource_validators = get_validators()
+            else:
+                pk = get_object_id(pattern, q)
+                request._resource_validators = None if pk is None else get_validators(pk)
+        return request._resource_validators
+
+    def _last_modified(request, *args, **kwargs):
+        validators = _get_validators(request, *args, **kwargs) or ()
+        dates = [validator for validator in validators if isinstance(validator, datetime)]
+        return max(dates) if dates else None
+
+    def _etag(request, *args, **kwargs):
+        validators = _get_validators(request, *args, **kwargs)
+        if validators is None:
+            return None
+        # the representation depends on the format suffix, the query parameters and the Accept header
+        key = [request.path, request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', '')]
+        key.extend(validator.isoformat() if isinstance(validator, datetime) else str(validator) for validator in validators)
+        return hashlib.md5('|'.join(key).encode('utf-8')).hexdigest()
+
+    return condition(etag_func=_etag, last_modified_func=_last_modified)
+
+
+def get_object_id(pattern, q):
+    """
+    Returns the primary key for an id or doi or None if it is invalid
+    """
+    if pattern.match(q):
+        return int(q.split(":")[1])
+    try:
+        return int(q)
+    except (TypeError, ValueError):
+        return None
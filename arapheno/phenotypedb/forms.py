@@ -1,14 +1,13 @@
 """
 Form and ModelForm definitions
 """
-import os,re
+import re
 
 
 from autocomplete_light import shortcuts as autocomplete_light
 from django import forms
-from django.db import transaction
-from phenotypedb.models import Phenotype, Study, Submission, OntologyTerm
-from utils import import_study
+from phenotypedb.models import Phenotype, Study, SubmissionJob, OntologyTerm
+from utils.submission_queue import enqueue_submission
 
 TEXT_WIDGET = forms.TextInput(attrs={'class':'validate'})
 SUPPORTED_EXTENSION = ('.csv', '.plink', '.zip', '.tar.gz')
@@ -16,8 +15,7 @@ SUPPORTED_EXTENSION = ('.csv', '.plink', '.zip', '.tar.gz')
 ONTOLOGY_ID_REGEX = re.compile(r'(.)*\(([\w]{2}:\d*)\)')
 
 def _validate_file(value):
-    extension = os.path.splitext(value.name)[1]
-    if extension not in SUPPORTED_EXTENSION:
+    if not value.name.endswith(SUPPORTED_EXTENSION):
         raise forms.ValidationError(
             "Wrong file extension. Only %s supported" % ','.join(SUPPORTED_EXTENSION),
             params={'value':value})
@@ -58,12 +56,12 @@ class CorrelationWizardForm(forms.Form):
 
 class UploadFileForm(forms.ModelForm):
     """
-    Form for uploading a study
+    Form for uploading a study (the file is stored and queued for the import)
     """
     file = forms.FileField(validators=[_validate_file])
 
     class Meta:
-        model = Submission
+        model = SubmissionJob
         fields = ['firstname', 'lastname', 'email']
         widgets = {
             'email': forms.EmailInput(attrs={'class':'validate', 'required':True}),
@@ -71,15 +69,10 @@ class UploadFileForm(forms.ModelForm):
             'lastname': TEXT_WIDGET
         }
 
-    @transaction.atomic
     def save(self, commit=True):
-        submission = super(UploadFileForm, self).save(commit=False)
-        # import study
-        study = import_study(self.cleaned_data['file'])
-        submission.study = study
-        if commit:
-            submission.save()
-        return submission
+        # the study is imported by the process_submissions worker
+        return enqueue_submission(self.cleaned_data['file'], self.cleaned_data['firstname'],
+                                  self.cleaned_data['lastname'], self.cleaned_data['email'])
 
 
 class StudyUpdateForm(forms.ModelForm):
@@ -0,0 +1,61 @@
+"""
+Command Line function to benchmark the phenotype value download
+"""
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.renderers import JSONRenderer
+from phenotypedb.models import Phenotype
+from phenotypedb.renderer import PhenotypeValueRenderer, PLINKRenderer
+from phenotypedb.serializers import PhenotypeValueSerializer, PhenotypeValueTupleSerializer
+
+
+class Command(BaseCommand):
+    """
+    Command to compare the per-row serializer with the values-tuple path for /rest/phenotype/<id>/values
+    """
+    help = 'Benchmark the phenotype value serializers and check that their output is identical'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--id',
+                            dest='phenotype_id',
+                            type=int,
+                            default=None,
+                            help='Specify a primary key of a phenotype (default: phenotype with most values)')
+        parser.add_argument('--repeat',
+                            dest='repeat',
+                            type=int,
+                            default=5,
+                            help='Number of repetitions')
+
+    def handle(self, *args, **options):
+        phenotype_id = options['phenotype_id']
+        repeat = options['repeat']
+        try:
+            if phenotype_id is None:
+                phenotype = Phenotype.objects.published().annotate(value_count=Count('phenotypevalue')).order_by('-value_count')[0]
+            else:
+                phenotype = Phenotype.objects.get(pk=phenotype_id)
+        except (Phenotype.DoesNotExist, IndexError):
+            raise CommandError('Phenotype %s not found' % phenotype_id)
+
+        def _serializer_data():
+            pheno_acc_infos = phenotype.phenotypevalue_set.prefetch_related('obs_unit__accession')
+            return PhenotypeValueSerializer(pheno_acc_infos, many=True).data
+
+        def _tuple_data():
+            pheno_acc_infos = phenotype.phenotypevalue_set.with_accession_infos()
+            return PhenotypeValueTupleSerializer(pheno_acc_infos, many=True).data
+
+        renderers = [('csv', PhenotypeValueRenderer()), ('json', JSONRenderer()), ('plink', PLINKRenderer())]
+        old_data = _serializer_data()
+        new_data = _tuple_data()
+        self.stdout.write('Phenotype %s (%s values)' % (phenotype.pk, len(new_data)))
+        for fmt, renderer in renderers:
+            if renderer.render(old_data) != renderer.render(new_data):
+                raise CommandError('Output for format %s differs' % fmt)
+            old_time = min(timeit.repeat(lambda: renderer.render(_serializer_data()), number=1, repeat=repeat))
+            new_time = min(timeit.repeat(lambda: renderer.render(_tuple_data()), number=1, repeat=repeat))
+            self.stdout.write(self.style.SUCCESS('%-6s serializer: %.4fs values-tuple: %.4fs speedup: %.1fx' %
+                                                 (fmt, old_time, new_time, old_time / new_time)))
@@ -0,0 +1,98 @@
+"""
+Command Line function to benchmark the PLINK file parser
+"""
+import csv
+import os
+import tempfile
+import timeit
+
+import numpy as np
+import scipy as sp
+
+from django.core.management.base import BaseCommand, CommandError
+from utils.data_io import parse_plink_file
+
+
+def parse_plink_file_csv(f):
+    """
+    The previous csv.reader based parser (only supports space separated files)
+    """
+    if not hasattr(f, 'read'):
+        f = open(f, 'rb')
+    try:
+        accession_ids = []
+        pmatrix = []
+        names = None
+        reader = csv.reader(f, delimiter=' ')
+        for i, line in enumerate(reader):
+            if i == 0:
+                names = map(lambda s: s.replace("_", " "), line[2:])
+            else:
+                accession_ids.append(line[0].strip())
+                pmatrix.append(map(lambda x: sp.nan if x == '' else float(x), line[2:]))
+        return [sp.array(pmatrix), sp.array(accession_ids), names]
+    finally:
+        f.close()
+
+
+class Command(BaseCommand):
+    """
+    Command to compare the csv.reader based PLINK parser with the pandas based parser
+    """
+    help = 'Benchmark the PLINK file parser and check that both parsers return the same data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file',
+                            dest='filename',
+                            default=None,
+                            help='Space separated PLINK file (default: generate a random file)')
+        parser.add_argument('--rows',
+                            dest='rows',
+                            type=int,
+                            default=2000,
+                            help='Number of accessions of the generated file')
+        parser.add_argument('--columns',
+                            dest='columns',
+                            type=int,
+                            default=100,
+                            help='Number of phenotypes of the generated file')
+        parser.add_argument('--repeat',
+                            dest='repeat',
+                            type=int,
+                            default=3,
+                            help='Number of repetitions')
+
+    def handle(self, *args, **options):
+        filename = options['filename']
+        generated = filename is None
+        if generated:
+            filename = self._generate_file(options['rows'], options['columns'])
+        elif not os.path.exists(filename):
+            raise CommandError('File %s not found' % filename)
+        try:
+            old_data = parse_plink_file_csv(filename)
+            new_data = parse_plink_file(filename)
+            if (list(old_data[1]) != list(new_data[1]) or old_data[2] != new_data[2] or
+                    not np.array_equal(np.isnan(old_data[0]), np.isnan(new_data[0])) or
+                    not np.allclose(np.nan_to_num(old_data[0]), np.nan_to_num(new_data[0]))):
+                raise CommandError('Parsed data differs')
+            repeat = options['repeat']
+            old_time = min(timeit.repeat(lambda: parse_plink_file_csv(filename), number=1, repeat=repeat))
+            new_time = min(timeit.repeat(lambda: parse_plink_file(filename), number=1, repeat=repeat))
+            self.stdout.write('%s x %s matrix' % new_data[0].shape)
+            self.stdout.write(self.style.SUCCESS('csv.reader: %.4fs pandas: %.4fs speedup: %.1fx' %
+                                                 (old_time, new_time, old_time / new_time)))
+        finally:
+            if generated:
+                os.unlink(filename)
+
+    def _generate_file(self, rows, columns):
+        values = np.random.normal(size=(rows, columns))
+        missing = np.random.random(size=(rows, columns)) < 0.1
+        handle, filename = tempfile.mkstemp(suffix='.plink')
+        with os.fdopen(handle, 'w') as f:
+            f.write('FID IID %s\n' % ' '.join('trait_%s' % i for i in range(columns)))
+            for i in range(rows):
+                cells = ['' if missing[i, j] else repr(values[i, j]) for j in range(columns)]
+                f.write('%s %s %s\n' % (i + 1, i + 1, ' '.join(cells)))
+        return filename
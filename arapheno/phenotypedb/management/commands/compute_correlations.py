@@ -0,0 +1,39 @@
+"""
+Command Line function to fill the correlation store
+"""
+from django.core.management.base import BaseCommand, CommandError
+from phenotypedb.models import PhenotypeCorrelation
+from utils.correlation import update_correlation_store
+
+
+class Command(BaseCommand):
+    """
+    Command to compute the all-vs-all correlations of the published phenotypes
+    """
+    help = 'Compute the correlations between all published phenotypes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild',
+                            dest='rebuild',
+                            action='store_true',
+                            default=False,
+                            help='Remove the stored correlations and recompute all of them')
+        parser.add_argument('--processes',
+                            dest='processes',
+                            type=int,
+                            default=1,
+                            help='Number of worker processes')
+        parser.add_argument('--block-size',
+                            dest='block_size',
+                            type=int,
+                            default=100,
+                            help='Number of phenotypes that are computed in one block')
+
+    def handle(self, *args, **options):
+        try:
+            if options['rebuild']:
+                PhenotypeCorrelation.objects.all().delete()
+            count = update_correlation_store(processes=options['processes'], block_size=options['block_size'])
+        except Exception as err:
+            raise CommandError('Error computing correlations. Reason: %s' % str(err))
+        self.stdout.write(self.style.SUCCESS('Successfully stored %s correlations' % count))
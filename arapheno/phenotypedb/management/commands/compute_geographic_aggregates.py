@@ -0,0 +1,20 @@
+"""
+Command Line function to backfill the geographic aggregates
+"""
+from django.core.management.base import BaseCommand, CommandError
+from utils.geographic_aggregates import update_all_aggregates
+
+
+class Command(BaseCommand):
+    """
+    Command to compute the geographic distribution of the published studies and phenotypes
+    (new studies are computed automatically when they are published)
+    """
+    help = 'Compute the number of accessions and the mean values per country and grid cell'
+
+    def handle(self, *args, **options):
+        try:
+            count = update_all_aggregates()
+        except Exception as err:
+            raise CommandError('Error computing geographic aggregates. Reason: %s' % str(err))
+        self.stdout.write(self.style.SUCCESS('Successfully computed the geographic aggregates of %s studies' % count))
@@ -0,0 +1,27 @@
+"""
+Command Line function to backfill the phenotype statistics
+"""
+from django.core.management.base import BaseCommand, CommandError
+from utils.phenotype_statistics import update_all_statistics
+
+
+class Command(BaseCommand):
+    """
+    Command to compute the summary statistics of the published phenotypes
+    (new studies are computed automatically when they are published)
+    """
+    help = 'Compute the summary statistics and the Shapiro-Wilk test of the published phenotypes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing',
+                            dest='missing',
+                            action='store_true',
+                            default=False,
+                            help='Only compute the phenotypes without statistics')
+
+    def handle(self, *args, **options):
+        try:
+            count = update_all_statistics(missing_only=options['missing'])
+        except Exception as err:
+            raise CommandError('Error computing phenotype statistics. Reason: %s' % str(err))
+        self.stdout.write(self.style.SUCCESS('Successfully computed the statistics of %s phenotypes' % count))
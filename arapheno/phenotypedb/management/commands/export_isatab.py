@@ -8,12 +8,16 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('id')
+        parser.add_argument('--output',
+                            dest='output',
+                            default=None,
+                            help='Filename of the archive (default: a temporary file)')
 
     def handle(self, *args, **options):
         id = options['id']
         try:
             study = Study.objects.get(pk=id)
-            isatab_filename  = export_isatab(study)
+            isatab_filename  = export_isatab(study, options['output'])
         except Exception as err:
             raise CommandError('Error exporting ISA-TAB file. Reason: %s' % str(err))
         self.stdout.write(self.style.SUCCESS('Successfully exported ISA-TAB archive to "%s"' % (isatab_filename)))
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""
+Command Line function to import the queued study submissions
+"""
+from django.core.management.base import BaseCommand
+from utils.submission_queue import run_worker
+
+
+class Command(BaseCommand):
+    """
+    Worker that imports the uploaded studies of the submission queue
+    """
+    help = 'Import the queued study submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval',
+                            dest='interval',
+                            type=float,
+                            default=5,
+                            help='Seconds to wait before checking an empty queue again')
+        parser.add_argument('--once',
+                            dest='once',
+                            action='store_true',
+                            default=False,
+                            help='Stop when the queue is empty')
+
+    def handle(self, *args, **options):
+        run_worker(interval=options['interval'], once=options['once'])
+        self.stdout.write(self.style.SUCCESS('Submission queue is empty'))
@@ -0,0 +1,19 @@
+"""
+Command Line function to rebuild the precomputed accession summaries
+"""
+from django.core.management.base import BaseCommand, CommandError
+from utils.accession_summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the accession summaries (they are updated automatically when studies are published or deleted)
+    """
+    help = 'Rebuild the numbers of published phenotypes and studies of the accessions'
+
+    def handle(self, *args, **options):
+        try:
+            rebuild_summaries()
+        except Exception as err:
+            raise CommandError('Error rebuilding the accession summaries. Reason: %s' % str(err))
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the accession summaries'))
@@ -0,0 +1,19 @@
+"""
+Command Line function to rebuild the closure table of the ontology terms
+"""
+from django.core.management.base import BaseCommand, CommandError
+from utils.ontology_closure import rebuild_hierarchy
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the ontology closure table and the child counts (they are rebuilt automatically when the ontologies are changed)
+    """
+    help = 'Rebuild the closure table and the child counts of the ontology terms'
+
+    def handle(self, *args, **options):
+        try:
+            rebuild_hierarchy()
+        except Exception as err:
+            raise CommandError('Error rebuilding the ontology closure. Reason: %s' % str(err))
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the ontology closure'))
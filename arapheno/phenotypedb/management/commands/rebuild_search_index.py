@@ -0,0 +1,19 @@
+"""
+Command Line function to rebuild the full-text search index
+"""
+from django.core.management.base import BaseCommand, CommandError
+from utils.search import rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the search index (e.g. after loading fixtures)
+    """
+    help = 'Rebuild the full-text search index'
+
+    def handle(self, *args, **options):
+        try:
+            rebuild_index()
+        except Exception as err:
+            raise CommandError('Error rebuilding the search index. Reason: %s' % str(err))
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the search index'))
@@ -0,0 +1,31 @@
+"""
+Command Line function to show the statistics of the REST response cache or to clear it
+"""
+from django.core.management.base import BaseCommand, CommandError
+from utils import response_cache
+
+
+class Command(BaseCommand):
+    """
+    Command to show the hit/miss counters and the size of the response cache
+    """
+    help = 'Show the statistics of the REST response cache or clear it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear',
+                            dest='clear',
+                            action='store_true',
+                            default=False,
+                            help='Remove all cached responses and reset the counters')
+
+    def handle(self, *args, **options):
+        if not response_cache.is_enabled():
+            raise CommandError('The response cache is disabled (RESPONSE_CACHE_PATH is not set)')
+        if options['clear']:
+            response_cache.clear()
+            self.stdout.write(self.style.SUCCESS('Successfully cleared the response cache'))
+        stats = response_cache.get_stats()
+        requests = stats['hits'] + stats['misses']
+        hit_rate = 100.0 * stats['hits'] / requests if requests else 0.0
+        self.stdout.write('hits: %s\nmisses: %s\nhit rate: %.1f%%\nentries: %s\nsize: %s bytes' %
+                          (stats['hits'], stats['misses'], hit_rate, stats['entries'], stats['size']))
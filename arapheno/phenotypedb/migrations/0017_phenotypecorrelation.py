@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-16 21:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0016_ontologysource_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhenotypeCorrelation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pearson', models.FloatField(blank=True, null=True)),
+                ('spearman', models.FloatField(blank=True, null=True)),
+                ('overlap', models.IntegerField()),
+                ('phenotype_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='phenotypedb.Phenotype')),
+                ('phenotype_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='phenotypedb.Phenotype')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='phenotypecorrelation',
+            unique_together=set([('phenotype_a', 'phenotype_b')]),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, OperationalError
+
+SEARCH_TABLE = 'phenotypedb_searchindex'
+
+CREATE_SQL = """CREATE VIRTUAL TABLE %s USING fts5(entity UNINDEXED, object_id UNINDEXED, name, terms, text,
+tokenize = 'unicode61', prefix = '2 3')""" % SEARCH_TABLE
+
+POPULATE_SQL = [
+    """INSERT INTO {0} (entity, object_id, name, terms, text)
+    SELECT 'phenotype', p.id, p.name,
+        trim(coalesce(t.id || ' ' || t.name, '') || ' ' || coalesce(e.id || ' ' || e.name, '') || ' ' || coalesce(u.id || ' ' || u.name, '')),
+        trim(coalesce(p.scoring, '') || ' ' || coalesce(p.growth_conditions, '') || ' ' || coalesce(p.source, '') || ' ' || coalesce(p.type, ''))
+    FROM phenotypedb_phenotype p
+    INNER JOIN phenotypedb_submission s ON s.study_id = p.study_id AND s.status = 2
+    LEFT JOIN phenotypedb_ontologyterm t ON t.id = p.to_term_id
+    LEFT JOIN phenotypedb_ontologyterm e ON e.id = p.eo_term_id
+    LEFT JOIN phenotypedb_ontologyterm u ON u.id = p.uo_term_id""",
+    """INSERT INTO {0} (entity, object_id, name, terms, text)
+    SELECT 'study', st.id, st.name, '', coalesce(st.description, '')
+    FROM phenotypedb_study st
+    INNER JOIN phenotypedb_submission s ON s.study_id = st.id AND s.status = 2""",
+    """INSERT INTO {0} (entity, object_id, name, terms, text)
+    SELECT 'accession', a.id, a.name, trim(coalesce(a.country, '') || ' ' || coalesce(a.cs_number, '')),
+        trim(coalesce(a.sitename, '') || ' ' || coalesce(a.collector, ''))
+    FROM phenotypedb_accession a""",
+    """INSERT INTO {0} (entity, object_id, name, terms, text)
+    SELECT 'ontology', o.id, o.name, o.id, trim(coalesce(o.definition, '') || ' ' || coalesce(o.comment, ''))
+    FROM phenotypedb_ontologyterm o""",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # the search falls back to icontains lookups if the FTS5 table can't be created
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    cursor = schema_editor.connection.cursor()
+    try:
+        cursor.execute(CREATE_SQL)
+    except OperationalError:
+        return
+    for sql in POPULATE_SQL:
+        cursor.execute(sql.format(SEARCH_TABLE))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.connection.cursor().execute('DROP TABLE IF EXISTS %s' % SEARCH_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0017_phenotypecorrelation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
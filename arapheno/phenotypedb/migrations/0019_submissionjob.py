@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-16 21:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0018_searchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Queued'), (1, 'Running'), (2, 'Finished'), (3, 'Failed')], db_index=True, default=0)),
+                ('firstname', models.CharField(max_length=100)),
+                ('lastname', models.CharField(max_length=200)),
+                ('email', models.CharField(max_length=200)),
+                ('filename', models.CharField(max_length=255)),
+                ('path', models.CharField(max_length=255)),
+                ('message', models.TextField(blank=True, null=True)),
+                ('submission_date', models.DateTimeField(auto_now_add=True)),
+                ('start_date', models.DateTimeField(blank=True, null=True)),
+                ('end_date', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
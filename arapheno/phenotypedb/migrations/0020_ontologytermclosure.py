@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-16 22:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_closure(apps, schema_editor):
+    from utils.ontology_closure import rebuild_closure
+    rebuild_closure(apps.get_model('phenotypedb', 'OntologyTerm'), apps.get_model('phenotypedb', 'OntologyTermClosure'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0019_submissionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OntologyTermClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='phenotypedb.OntologyTerm')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='phenotypedb.OntologyTerm')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='ontologytermclosure',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
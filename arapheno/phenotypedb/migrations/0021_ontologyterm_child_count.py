@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-16 23:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def count_children(apps, schema_editor):
+    from utils.ontology_closure import update_child_counts
+    update_child_counts(apps.get_model('phenotypedb', 'OntologyTerm'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0020_ontologytermclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ontologyterm',
+            name='child_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_children, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-16 23:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_summaries(apps, schema_editor):
+    from utils.accession_summary import rebuild_summaries
+    rebuild_summaries(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0021_ontologyterm_child_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessionSummary',
+            fields=[
+                ('accession', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='phenotypedb.Accession')),
+                ('phenotype_count', models.PositiveIntegerField(default=0)),
+                ('study_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AccessionTermSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=10)),
+                ('phenotype_count', models.PositiveIntegerField(default=0)),
+                ('accession', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_summaries', to='phenotypedb.Accession')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='phenotypedb.OntologyTerm')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='accessiontermsummary',
+            unique_together=set([('accession', 'field', 'term')]),
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
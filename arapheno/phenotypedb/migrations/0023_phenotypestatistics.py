@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-17 00:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0022_accessionsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhenotypeStatistics',
+            fields=[
+                ('phenotype', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='phenotypedb.Phenotype')),
+                ('value_count', models.PositiveIntegerField(default=0)),
+                ('accession_count', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(blank=True, null=True)),
+                ('sd', models.FloatField(blank=True, null=True)),
+                ('min', models.FloatField(blank=True, null=True)),
+                ('q1', models.FloatField(blank=True, null=True)),
+                ('median', models.FloatField(blank=True, null=True)),
+                ('q3', models.FloatField(blank=True, null=True)),
+                ('max', models.FloatField(blank=True, null=True)),
+                ('skewness', models.FloatField(blank=True, null=True)),
+                ('histogram', models.TextField(blank=True)),
+                ('update_date', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-17 00:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0023_phenotypestatistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeographicAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('country', 'Country'), ('grid', 'Grid cell'), ('total', 'Total')], max_length=10)),
+                ('country', models.CharField(blank=True, max_length=255)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('accession_count', models.PositiveIntegerField(default=0)),
+                ('value_mean', models.FloatField(blank=True, null=True)),
+                ('phenotype', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='geographic_aggregates', to='phenotypedb.Phenotype')),
+                ('study', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='geographic_aggregates', to='phenotypedb.Study')),
+            ],
+        ),
+    ]
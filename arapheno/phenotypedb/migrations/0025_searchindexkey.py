@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+SEARCH_TABLE = 'phenotypedb_searchindex'
+SEARCH_KEY_TABLE = 'phenotypedb_searchindexkey'
+
+# maps the objects to the rowids of the search index, because entity and object_id can't be indexed in FTS5
+CREATE_SQL = """CREATE TABLE %s (id INTEGER PRIMARY KEY, entity TEXT NOT NULL, object_id NOT NULL,
+UNIQUE (entity, object_id))""" % SEARCH_KEY_TABLE
+
+POPULATE_SQL = 'INSERT INTO %s (id, entity, object_id) SELECT rowid, entity, object_id FROM %s' % (SEARCH_KEY_TABLE,
+                                                                                                   SEARCH_TABLE)
+
+
+def create_search_index_key(apps, schema_editor):
+    # the key table is only needed if the search index was created
+    if SEARCH_TABLE not in schema_editor.connection.introspection.table_names():
+        return
+    cursor = schema_editor.connection.cursor()
+    cursor.execute(CREATE_SQL)
+    cursor.execute(POPULATE_SQL)
+
+
+def drop_search_index_key(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.connection.cursor().execute('DROP TABLE IF EXISTS %s' % SEARCH_KEY_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phenotypedb', '0024_geographicaggregate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index_key, drop_search_index_key),
+    ]
@@ -3,17 +3,21 @@ Models that are used in the database and application
 """
 from __future__ import unicode_literals
 
+import json
 import uuid
-from datetime import datetime
 
 import pandas as pd
 
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
 from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.conf import settings
 
+from phenotypedb.signals import submission_status_changed
+
 SUBMITTED = 0
 IN_CURATION = 1
 PUBLISHED = 2
@@ -72,11 +76,31 @@ class PhenotypeCuration(Curation):
         return u"%s: %s" % (self.phenotype.name, "correct" if self.correct else "incorrect")
 
 
+# correlated subqueries for StudyQuerySet.with_counts (a join over the phenotypes and the observation units
+# would multiply the rows of both)
+STUDY_COUNT_SQL = {
+    'phenotype_count': 'SELECT COUNT(*) FROM phenotypedb_phenotype WHERE study_id = phenotypedb_study.id',
+    'obs_unit_count': 'SELECT COUNT(*) FROM phenotypedb_observationunit WHERE study_id = phenotypedb_study.id',
+    'value_count': """SELECT COUNT(*) FROM phenotypedb_phenotypevalue AS v
+                      INNER JOIN phenotypedb_phenotype AS p ON p.id = v.phenotype_id
+                      WHERE p.study_id = phenotypedb_study.id""",
+    'accession_count': """SELECT COUNT(DISTINCT accession_id) FROM phenotypedb_observationunit
+                          WHERE study_id = phenotypedb_study.id""",
+}
+
+
 class StudyQuerySet(models.QuerySet):
     """
     Custom QuerySet for Study
     """
 
+    def with_counts(self):
+        """
+        Returns the studies annotated with the number of phenotypes, observation units, values and accessions
+        (phenotype_count, obs_unit_count, value_count, accession_count) that can be used for sorting
+        """
+        return self.annotate(**dict((name, RawSQL(sql, ())) for name, sql in STUDY_COUNT_SQL.items()))
+
     def published(self):
         """
         Returns the published studies
@@ -145,11 +169,13 @@ class Study(models.Model):
 
     @property
     def count_phenotypes(self):
-        """Returns number of phenotypes"""
+        """Returns number of phenotypes (annotated by StudyQuerySet.with_counts)"""
+        if hasattr(self, 'phenotype_count'):
+            return self.phenotype_count
         return self.phenotype_set.count()
 
     def save(self, *args, **kwargs):
-        self.update_date = datetime.now()
+        self.update_date = timezone.now()
         super(Study, self).save(*args, **kwargs)
 
 
@@ -195,6 +221,24 @@ class Submission(models.Model):
     lastname = models.CharField(max_length=200) #last name of author
     email = models.CharField(max_length=200) #last name of author
 
+    _saved_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Submission, cls).from_db(db, field_names, values)
+        # remember the status in the database to detect status changes on save
+        instance._saved_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        previous_status = self._saved_status
+        if self.status == PUBLISHED and self.publication_date is None:
+            self.publication_date = timezone.now()
+        super(Submission, self).save(*args, **kwargs)
+        self._saved_status = self.status
+        if previous_status != self.status:
+            submission_status_changed.send(sender=Submission, submission=self,
+                                           previous_status=previous_status)
 
     @property
     def fullname(self):
@@ -262,6 +306,56 @@ class Submission(models.Model):
     def __unicode__(self):
         return u'%s by %s %s' % (self.study.name, self.firstname, self.lastname)
 
+JOB_QUEUED = 0
+JOB_RUNNING = 1
+JOB_FINISHED = 2
+JOB_FAILED = 3
+
+JOB_STATUS_CHOICES = (
+    (JOB_QUEUED, 'Queued'),
+    (JOB_RUNNING, 'Running'),
+    (JOB_FINISHED, 'Finished'),
+    (JOB_FAILED, 'Failed')
+)
+
+
+class SubmissionJob(models.Model):
+    """
+    Uploaded study file that is waiting to be imported by the process_submissions worker
+    The Submission that is created by the import gets the id of the job
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.PositiveSmallIntegerField(choices=JOB_STATUS_CHOICES, default=JOB_QUEUED, db_index=True)
+    firstname = models.CharField(max_length=100) #firstname of author
+    lastname = models.CharField(max_length=200) #last name of author
+    email = models.CharField(max_length=200) #email of author
+    filename = models.CharField(max_length=255) #name of the uploaded file
+    path = models.CharField(max_length=255) #location of the stored upload
+    message = models.TextField(blank=True, null=True) #progress or error message
+    submission_date = models.DateTimeField(auto_now_add=True)
+    start_date = models.DateTimeField(null=True, blank=True)
+    end_date = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def fullname(self):
+        """Returns name of the user"""
+        return '%s %s' % (self.firstname,self.lastname)
+
+    def status_text(self):
+        """Returns the text version of the numeric status"""
+        return JOB_STATUS_CHOICES[self.status][1]
+
+    @property
+    def queue_position(self):
+        """Returns the number of queued jobs that were submitted before this one"""
+        if self.status != JOB_QUEUED:
+            return None
+        return SubmissionJob.objects.filter(status=JOB_QUEUED, submission_date__lt=self.submission_date).count()
+
+    def __unicode__(self):
+        return u'%s by %s %s (%s)' % (self.filename, self.firstname, self.lastname, self.status_text())
+
+
 class Accession(models.Model):
     """
     Accession models
@@ -279,8 +373,15 @@ class Accession(models.Model):
 
     @property
     def count_phenotypes(self):
-        """Returns number of phenotypes"""
-        return self.observationunit_set.values('phenotypevalue__phenotype').distinct().count()
+        """Returns number of published phenotypes (from the precomputed summary)"""
+        return self.get_summary().phenotype_count
+
+    def get_summary(self):
+        """Returns the precomputed summary (an empty one if the accession has no published values)"""
+        try:
+            return self.summary
+        except AccessionSummary.DoesNotExist:
+            return AccessionSummary(accession=self)
 
     @property
     def cs_number_url(self):
@@ -293,6 +394,35 @@ class Accession(models.Model):
         return u"%s (Accession)" % (mark_safe(self.name))
 
 
+class AccessionSummary(models.Model):
+    """
+    Precomputed numbers of published phenotypes and studies of an accession
+    Updated by utils.accession_summary when studies are published, unpublished or deleted
+    """
+    accession = models.OneToOneField('Accession', primary_key=True, related_name='summary')
+    phenotype_count = models.PositiveIntegerField(default=0) #number of published phenotypes with values
+    study_count = models.PositiveIntegerField(default=0) #number of published studies with values
+
+    def __unicode__(self):
+        return u"%s: %s phenotypes in %s studies" % (self.accession_id, self.phenotype_count, self.study_count)
+
+
+class AccessionTermSummary(models.Model):
+    """
+    Precomputed number of published phenotypes of an accession per ontology term
+    """
+    accession = models.ForeignKey('Accession', related_name='term_summaries')
+    field = models.CharField(max_length=10) #phenotype field of the term (to_term, eo_term or uo_term)
+    term = models.ForeignKey('OntologyTerm', related_name='+')
+    phenotype_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('accession', 'field', 'term')
+
+    def __unicode__(self):
+        return u"%s: %s phenotypes with %s" % (self.accession_id, self.phenotype_count, self.term_id)
+
+
 class ObservationUnit(models.Model):
     """
     Observational unit model
@@ -302,6 +432,36 @@ class ObservationUnit(models.Model):
     study = models.ForeignKey('Study')
 
 
+class PhenotypeValueQuerySet(models.QuerySet):
+    """
+    Custom QuerySet for PhenotypeValue queries
+    """
+    ACCESSION_INFO_FIELDS = ('phenotype__name', 'obs_unit__accession_id', 'obs_unit__accession__name',
+                             'obs_unit__accession__cs_number', 'obs_unit__accession__longitude',
+                             'obs_unit__accession__latitude', 'obs_unit__accession__country',
+                             'value', 'obs_unit_id')
+
+    def with_accession_infos(self):
+        """
+        Returns the values together with the accession information as tuples
+        (see ACCESSION_INFO_FIELDS) using a single joined query
+        """
+        return self.order_by('pk').values_list(*self.ACCESSION_INFO_FIELDS)
+
+    ACCESSION_AGGREGATE_FIELDS = ('obs_unit__accession_id', 'obs_unit__accession__name',
+                                  'obs_unit__accession__longitude', 'obs_unit__accession__latitude',
+                                  'obs_unit__accession__country')
+
+    def with_accession_aggregates(self):
+        """
+        Returns the mean and the number of the values of every accession together with the accession information
+        as tuples (ACCESSION_AGGREGATE_FIELDS followed by the mean and the number) using a single grouped query
+        """
+        return self.values(*self.ACCESSION_AGGREGATE_FIELDS).annotate(
+            value_mean=models.Avg('value'), value_count=models.Count('pk')).order_by('obs_unit__accession_id').values_list(
+            *(self.ACCESSION_AGGREGATE_FIELDS + ('value_mean', 'value_count')))
+
+
 class PhenotypeValue(models.Model):
     """
     PhenotypeValue model
@@ -310,17 +470,63 @@ class PhenotypeValue(models.Model):
     value = models.FloatField()
     phenotype = models.ForeignKey('Phenotype')
     obs_unit = models.ForeignKey('ObservationUnit')
+    objects = PhenotypeValueQuerySet.as_manager()
+
+
+# phenotype fields for the terms of the ontology sources
+ONTOLOGY_SOURCE_FIELDS = {'PTO': 'to_term', 'PECO': 'eo_term', 'UO': 'uo_term'}
+
 
 class PhenotypeQuerySet(models.QuerySet):
     """
     Custom QuerySet for Phenotype querires
     """
+    LIST_INFO_FIELDS = ('id', 'name', 'scoring', 'source', 'type', 'growth_conditions', 'integration_date',
+                        'number_replicates', 'study__name', 'species__genus', 'species__species', 'species__ncbi_id',
+                        'to_term_id', 'to_term__name', 'to_term__comment', 'to_term__definition',
+                        'to_term__source__acronym', 'to_term__source__name', 'to_term__source__url',
+                        'eo_term_id', 'eo_term__name', 'eo_term__comment', 'eo_term__definition',
+                        'eo_term__source__acronym', 'eo_term__source__name', 'eo_term__source__url',
+                        'uo_term_id', 'uo_term__name', 'uo_term__comment', 'uo_term__definition',
+                        'uo_term__source__acronym', 'uo_term__source__name', 'uo_term__source__url')
+
+    def with_list_infos(self, *fields):
+        """
+        Returns the phenotypes together with the study, species and ontology information as tuples
+        (the additional fields followed by LIST_INFO_FIELDS) using a single joined query
+        """
+        queryset = self if self.ordered else self.order_by('pk')
+        return queryset.values_list(*(fields + self.LIST_INFO_FIELDS))
+
     def published(self):
         """
         Returns the published phenotypes
         """
         return self.filter(study__submission__status=PUBLISHED)
 
+    def with_ontology_term(self, term):
+        """
+        Returns the phenotypes that are annotated with the term or one of its descendants
+        (using the closure table, the term field depends on the ontology source of the term)
+        """
+        try:
+            field = ONTOLOGY_SOURCE_FIELDS[term.source.acronym]
+        except KeyError:
+            raise Exception('term %s unknown' % term.source.acronym)
+        return self.filter(**{'%s__ancestor_links__ancestor_id' % field: term.pk})
+
+    def with_accession_values(self, accession_id):
+        """
+        Returns the phenotypes with values of an accession, each annotated with the mean (value_mean),
+        number (value_count), sum of squares (value_sum_squares), minimum and maximum of these values
+        using a single grouped query (sqlite has no aggregate for the standard deviation)
+        """
+        value = models.F('phenotypevalue__value')
+        return self.filter(phenotypevalue__obs_unit__accession_id=accession_id).annotate(
+            value_mean=models.Avg('phenotypevalue__value'), value_count=models.Count('phenotypevalue'),
+            value_sum_squares=models.Sum(value * value, output_field=models.FloatField()),
+            value_min=models.Min('phenotypevalue__value'), value_max=models.Max('phenotypevalue__value'))
+
     def curation(self):
         """
         Returns the phenotypes that are being curated
@@ -362,7 +568,9 @@ class Phenotype(models.Model):
     objects = PhenotypeQuerySet.as_manager()
     update_date = models.DateTimeField(default=None, null=True, blank=True)
 
-
+    def save(self, *args, **kwargs):
+        self.update_date = timezone.now()
+        super(Phenotype, self).save(*args, **kwargs)
 
     def get_absolute_url(self):
         """returns the submission page or phenotype page"""
@@ -404,6 +612,60 @@ class Phenotype(models.Model):
             return u"%s (Phenotype, TO: %s ( %s ))" % (mark_safe(self.name), mark_safe(self.to_term.name), mark_safe(self.to_term.id))
 
 
+class PhenotypeStatistics(models.Model):
+    """
+    Precomputed summary statistics of the values of a phenotype
+    Updated by utils.phenotype_statistics when a study is published or values change
+    (the Shapiro-Wilk test is stored in Phenotype.shapiro_test_statistic and Phenotype.shapiro_p_value)
+    """
+    phenotype = models.OneToOneField('Phenotype', primary_key=True, related_name='statistics')
+    value_count = models.PositiveIntegerField(default=0) #number of values
+    accession_count = models.PositiveIntegerField(default=0) #number of accessions with values
+    mean = models.FloatField(blank=True, null=True)
+    sd = models.FloatField(blank=True, null=True) #sample standard deviation
+    min = models.FloatField(blank=True, null=True)
+    q1 = models.FloatField(blank=True, null=True) #25% quantile
+    median = models.FloatField(blank=True, null=True)
+    q3 = models.FloatField(blank=True, null=True) #75% quantile
+    max = models.FloatField(blank=True, null=True)
+    skewness = models.FloatField(blank=True, null=True)
+    histogram = models.TextField(blank=True) #JSON with the bin edges and counts
+    update_date = models.DateTimeField(auto_now=True)
+
+    def get_histogram(self):
+        """Returns the histogram as a dict with the bin edges and counts"""
+        return json.loads(self.histogram) if self.histogram else None
+
+    def __unicode__(self):
+        return u"%s: %s values" % (self.phenotype_id, self.value_count)
+
+
+GEO_COUNTRY = 'country'
+GEO_GRID = 'grid'
+GEO_TOTAL = 'total'
+GEO_KIND_CHOICES = ((GEO_COUNTRY, 'Country'), (GEO_GRID, 'Grid cell'), (GEO_TOTAL, 'Total'))
+
+
+class GeographicAggregate(models.Model):
+    """
+    Precomputed number of accessions and mean value per country or per latitude/longitude grid cell
+    of a phenotype or of a study (studies have no mean value)
+    Every computed phenotype or study has a total row (also without any accessions)
+    Updated by utils.geographic_aggregates when a study is published or computed when they are first requested
+    """
+    phenotype = models.ForeignKey('Phenotype', null=True, blank=True, related_name='geographic_aggregates')
+    study = models.ForeignKey('Study', null=True, blank=True, related_name='geographic_aggregates')
+    kind = models.CharField(max_length=10, choices=GEO_KIND_CHOICES)
+    country = models.CharField(max_length=255, blank=True) #country of the accessions (only for countries)
+    latitude = models.FloatField(null=True, blank=True) #south-west corner of the grid cell (only for grid cells)
+    longitude = models.FloatField(null=True, blank=True)
+    accession_count = models.PositiveIntegerField(default=0)
+    value_mean = models.FloatField(null=True, blank=True) #mean of the accession means (only for phenotypes)
+
+    def __unicode__(self):
+        return u"%s %s: %s accessions" % (self.kind, self.country or (self.latitude, self.longitude), self.accession_count)
+
+
 class PhenotypeMetaDynamic(models.Model):
     """
     Dynamic Phenotype Meta-Information Model
@@ -463,6 +725,14 @@ class OntologyTermQuerySet(models.QuerySet):
     def uo_terms(self):
         """Retrieve Unit-Ontology terms."""
         return self.filter(source_id=3)
+    def descendants_of(self, term_id, include_self=True):
+        """Retrieve the descendants of a term using the closure table."""
+        terms = self.filter(ancestor_links__ancestor_id=term_id)
+        return terms if include_self else terms.exclude(pk=term_id)
+    def ancestors_of(self, term_id, include_self=True):
+        """Retrieve the ancestors of a term using the closure table."""
+        terms = self.filter(descendant_links__descendant_id=term_id)
+        return terms if include_self else terms.exclude(pk=term_id)
 
 
 class OntologyTerm(models.Model):
@@ -473,6 +743,7 @@ class OntologyTerm(models.Model):
     comment = models.TextField(blank=True, null=True)
     source = models.ForeignKey('OntologySource')
     children = models.ManyToManyField('self', related_name='parents', symmetrical=False)
+    child_count = models.PositiveIntegerField(default=0) #number of children (updated with the closure table)
 
     objects = OntologyTermQuerySet.as_manager()
 
@@ -484,6 +755,42 @@ class OntologyTerm(models.Model):
         return 'https://bioportal.bioontology.org/ontologies/%s?p=classes&conceptid=http://purl.obolibrary.org/obo/%s' % (self.source.acronym, self.id.replace(':', '_'))
 
 
+class OntologyTermClosure(models.Model):
+    """
+    Closure table of OntologyTerm.children
+    Contains a row for every term and each of its ancestors (and the term itself with depth 0),
+    so that all descendants or ancestors of a term are retrieved with a single indexed join.
+    The table is rebuilt by utils.ontology_closure whenever the ontologies change
+    """
+    ancestor = models.ForeignKey('OntologyTerm', related_name='descendant_links')
+    descendant = models.ForeignKey('OntologyTerm', related_name='ancestor_links')
+    depth = models.PositiveIntegerField() #length of the shortest path from the ancestor to the descendant
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+
+    def __unicode__(self):
+        return u"%s > %s (%s)" % (self.ancestor_id, self.descendant_id, self.depth)
+
+
+class PhenotypeCorrelation(models.Model):
+    """
+    Precomputed pairwise-complete correlation between two published phenotypes
+    (phenotype_a_id <= phenotype_b_id, only pairs that share accessions are stored)
+    """
+    phenotype_a = models.ForeignKey('Phenotype', related_name='+')
+    phenotype_b = models.ForeignKey('Phenotype', related_name='+')
+    pearson = models.FloatField(null=True, blank=True) #Pearson correlation coefficient
+    spearman = models.FloatField(null=True, blank=True) #Spearman rank correlation coefficient
+    overlap = models.IntegerField() #number of accessions with values for both phenotypes
+
+    class Meta:
+        unique_together = ('phenotype_a', 'phenotype_b')
+
+    def __unicode__(self):
+        return u"%s - %s (r=%s)" % (self.phenotype_a_id, self.phenotype_b_id, self.pearson)
+
+
 '''class OntologyTerm2Term(models.Model):
     """OntologyTerm Many To Many table """
     parent = models.ForeignKey("OntologyTerm",related_name="parent")
@@ -0,0 +1,223 @@
+"""
+Keyset (cursor) pagination for the REST endpoints and the django-tables2 tables
+"""
+import base64
+import json
+import operator
+
+from django.db import connections
+from django.db.models import Q
+from django.utils import six
+from django_tables2 import RequestConfig
+from django_tables2.rows import BoundRows
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+# field types whose values can be stored in the cursor of a table page
+KEYSET_FIELD_TYPES = ('AutoField', 'BigIntegerField', 'CharField', 'FloatField', 'IntegerField',
+                      'PositiveIntegerField', 'PositiveSmallIntegerField', 'SmallIntegerField', 'TextField')
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Opt-in cursor pagination for the REST list endpoints (?cursor=&limit=)
+    The links to the next and previous page are returned in the Link header,
+    so that the body has the same format as the unpaginated response (also for CSV)
+    """
+    ordering = 'pk'
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'limit'
+
+    def is_requested(self, request):
+        """
+        Checks if the client asked for a paginated response
+        """
+        return self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def _get_position_from_instance(self, instance, ordering):
+        # rows of values_list querysets have to start with the primary key
+        if isinstance(instance, tuple):
+            return six.text_type(instance[0])
+        return super(KeysetPagination, self)._get_position_from_instance(instance, ordering)
+
+    def get_paginated_response(self, data):
+        links = ['<%s>; rel="%s"' % (url, rel) for rel, url in (('next', self.get_next_link()),
+                                                                 ('prev', self.get_previous_link())) if url]
+        return Response(data, headers={'Link': ', '.join(links)} if links else None)
+
+
+class KeysetPage(object):
+    """
+    Page of a KeysetPaginator (provides the attributes of a django Page that are used by the table template)
+    The page numbers of the previous and next page are the cursors of these pages
+    """
+
+    def __init__(self, object_list, number, previous_cursor, next_cursor):
+        self.object_list = object_list
+        self.number = number
+        self.previous_page_number = previous_cursor
+        self.next_page_number = next_cursor
+
+    def has_previous(self):
+        return self.previous_page_number is not None
+
+    def has_next(self):
+        return self.next_page_number is not None
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator(object):
+    """
+    Paginates an ordered queryset by seeking to the values of the last row of the previous page
+    instead of using an OFFSET, so every page costs the same as the first one. The rows are not counted.
+    Orderings on related or unsupported columns fall back to an offset that is stored in the cursor.
+    """
+    # the number of pages is unknown because the rows are not counted
+    num_pages = None
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = self._get_ordering(queryset)
+
+    def page(self, cursor=None):
+        """
+        Returns the page of the cursor (first page if the cursor is invalid or for another ordering)
+        """
+        position = self._decode_cursor(cursor)
+        if position is None:
+            return self._get_page(1, None, 0, False)
+        page = self._get_page(position['n'], position.get('k'), position.get('o', 0), position.get('r', False))
+        if page is None or len(page) == 0:
+            return self._get_page(1, None, 0, False)
+        return page
+
+    def _get_page(self, number, key, offset, reverse):
+        queryset = self.queryset
+        if self.ordering is not None and key is not None:
+            if reverse:
+                queryset = queryset.order_by(*[_reverse(field) for field in self.ordering])
+            else:
+                queryset = queryset.order_by(*self.ordering)
+            queryset = queryset.filter(self._seek(key, reverse))
+            offset = 0
+        elif self.ordering is not None:
+            queryset = queryset.order_by(*self.ordering)
+        records = list(queryset[offset:offset + self.per_page + 1])
+        has_more = len(records) > self.per_page
+        records = records[:self.per_page]
+        if reverse:
+            if not has_more:
+                return None
+            records.reverse()
+        if len(records) == 0:
+            return KeysetPage(records, number, None, None)
+        has_previous = number > 1
+        has_next = has_more or reverse
+        if self.ordering is not None:
+            previous_cursor = self._encode_cursor(n=number - 1, k=self._get_key(records[0]), r=True) if has_previous else None
+            next_cursor = self._encode_cursor(n=number + 1, k=self._get_key(records[-1])) if has_next else None
+        else:
+            previous_cursor = self._encode_cursor(n=number - 1, o=max(offset - self.per_page, 0)) if has_previous else None
+            next_cursor = self._encode_cursor(n=number + 1, o=offset + self.per_page) if has_next else None
+        return KeysetPage(records, number, previous_cursor, next_cursor)
+
+    def _seek(self, key, reverse):
+        """
+        Returns the filter for the rows that come after the key in the ordering
+        """
+        ordering = [_reverse(field) for field in self.ordering] if reverse else self.ordering
+        nulls_largest = connections[self.queryset.db].features.nulls_order_largest
+        conditions = []
+        equal = Q()
+        for field, value in zip(ordering, key):
+            name = field.lstrip('-')
+            larger = not field.startswith('-')
+            if value is None:
+                if larger != nulls_largest:
+                    conditions.append(equal & Q(**{name + '__isnull': False}))
+                equal &= Q(**{name + '__isnull': True})
+            else:
+                after = Q(**{'%s__%s' % (name, 'gt' if larger else 'lt'): value})
+                if larger == nulls_largest:
+                    after |= Q(**{name + '__isnull': True})
+                conditions.append(equal & after)
+                equal &= Q(**{name: value})
+        return reduce(operator.or_, conditions)
+
+    def _get_key(self, record):
+        return [getattr(record, field.lstrip('-')) for field in self.ordering]
+
+    def _encode_cursor(self, **position):
+        position['s'] = self.ordering
+        return base64.urlsafe_b64encode(json.dumps(position))
+
+    def _decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        except (TypeError, ValueError, UnicodeEncodeError):
+            return None
+        if not isinstance(position, dict) or position.get('s') != self.ordering:
+            return None
+        try:
+            position['n'] = max(int(position.get('n', 1)), 1)
+            position['o'] = max(int(position.get('o', 0)), 0)
+        except (TypeError, ValueError):
+            return None
+        if position.get('k') is not None and len(position['k']) != len(self.ordering or []):
+            return None
+        return position
+
+    @staticmethod
+    def _get_ordering(queryset):
+        """
+        Returns the ordering of the queryset with the primary key as tie-breaker
+        or None if the ordering can't be used for keyset pagination
+        """
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        fields = dict((field.name, field) for field in queryset.model._meta.concrete_fields)
+        for field in ordering:
+            if not isinstance(field, basestring):
+                return None
+            name = field.lstrip('-')
+            if name == 'pk':
+                continue
+            if name not in fields or fields[name].get_internal_type() not in KEYSET_FIELD_TYPES:
+                return None
+        if not any(field.lstrip('-') in ('pk', queryset.model._meta.pk.name) for field in ordering):
+            ordering.append('-pk' if ordering and ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+
+class KeysetRequestConfig(RequestConfig):
+    """
+    RequestConfig that paginates the table with a KeysetPaginator
+    The cursor is passed in the page parameter of the table
+    """
+
+    def configure(self, table):
+        order_by = self.request.GET.getlist(table.prefixed_order_by_field)
+        if order_by:
+            table.order_by = order_by
+        if self.paginate:
+            per_page = self.paginate.get('per_page', table._meta.per_page) if hasattr(self.paginate, 'items') else table._meta.per_page
+            table.paginator = KeysetPaginator(table.data.data, per_page)
+            page = table.paginator.page(self.request.GET.get(table.prefixed_page_field))
+            page.object_list = BoundRows(page.object_list, table)
+            table.page = page
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else '-' + field
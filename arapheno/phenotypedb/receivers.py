@@ -0,0 +1,180 @@
+"""
+Receivers that keep the precomputed data up to date
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from phenotypedb.models import Accession, OntologyTerm, Phenotype, PhenotypeValue, Study, Submission, PUBLISHED
+from phenotypedb.signals import submission_status_changed
+from utils import accession_summary, geographic_aggregates, ontology_closure, phenotype_statistics, response_cache, search
+
+
+@receiver(submission_status_changed, sender=Submission)
+def update_search_index_on_status_change(sender, submission, previous_status, **kwargs):
+    """
+    Adds the study and its phenotypes to the search index when it is published
+    and removes them when it is unpublished
+    """
+    study = submission.study
+    phenotypes = study.phenotype_set.select_related('to_term', 'eo_term', 'uo_term')
+    if submission.status == PUBLISHED:
+        search.index_objects('study', [study])
+        search.index_objects('phenotype', phenotypes)
+    elif previous_status == PUBLISHED:
+        search.remove_objects('study', [study.pk])
+        search.remove_objects('phenotype', phenotypes.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Study)
+@receiver(post_save, sender=Phenotype)
+def update_search_index_on_save(sender, instance, raw=False, **kwargs):
+    """
+    Updates the search index entry of a published study or phenotype
+    """
+    if raw:
+        return
+    entity = 'study' if sender == Study else 'phenotype'
+    if search.get_queryset(entity).filter(pk=instance.pk).exists():
+        search.index_objects(entity, [instance])
+
+
+@receiver(post_save, sender=Accession)
+@receiver(post_save, sender=OntologyTerm)
+def update_search_index_on_save_all(sender, instance, raw=False, **kwargs):
+    """
+    Updates the search index entry of an accession or ontology term
+    """
+    if raw:
+        return
+    search.index_objects('accession' if sender == Accession else 'ontology', [instance])
+
+
+@receiver(post_delete, sender=Study)
+@receiver(post_delete, sender=Phenotype)
+@receiver(post_delete, sender=Accession)
+@receiver(post_delete, sender=OntologyTerm)
+def remove_from_search_index(sender, instance, **kwargs):
+    """
+    Removes a deleted object from the search index
+    """
+    entity = {Study:'study', Phenotype:'phenotype', Accession:'accession', OntologyTerm:'ontology'}[sender]
+    search.remove_objects(entity, [instance.pk])
+
+
+def _invalidate_response_cache(study_id, phenotype_ids):
+    tags = ['list', 'study:%s' % study_id] + ['phenotype:%s' % pk for pk in phenotype_ids]
+    # invalidate after the commit, otherwise another worker could cache the old data again
+    transaction.on_commit(lambda: response_cache.invalidate(tags))
+
+
+@receiver(submission_status_changed, sender=Submission)
+def invalidate_response_cache_on_status_change(sender, submission, previous_status, **kwargs):
+    """
+    Removes the cached responses of a study and its phenotypes when it is published or unpublished
+    """
+    if not response_cache.is_enabled():
+        return
+    study = submission.study
+    _invalidate_response_cache(study.pk, list(study.phenotype_set.values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=Study)
+@receiver(post_delete, sender=Study)
+def invalidate_response_cache_on_study_change(sender, instance, **kwargs):
+    """
+    Removes the cached responses of a changed study and its phenotypes
+    """
+    if not response_cache.is_enabled():
+        return
+    # the phenotypes of a deleted study are invalidated by their own post_delete signal
+    phenotype_ids = [] if kwargs.get('signal') is post_delete else list(instance.phenotype_set.values_list('pk', flat=True))
+    _invalidate_response_cache(instance.pk, phenotype_ids)
+
+
+@receiver(post_save, sender=Phenotype)
+@receiver(post_delete, sender=Phenotype)
+def invalidate_response_cache_on_phenotype_change(sender, instance, **kwargs):
+    """
+    Removes the cached responses of a changed phenotype and its study
+    """
+    if not response_cache.is_enabled():
+        return
+    _invalidate_response_cache(instance.study_id, [instance.pk])
+
+
+@receiver(m2m_changed, sender=OntologyTerm.children.through)
+def update_ontology_closure_on_children_change(sender, action, **kwargs):
+    """
+    Rebuilds the ontology closure table and the child counts when the hierarchy of the terms changes
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        ontology_closure.schedule_rebuild()
+
+
+@receiver(post_save, sender=OntologyTerm)
+@receiver(post_delete, sender=OntologyTerm)
+def update_ontology_closure_on_term_change(sender, instance, created=False, **kwargs):
+    """
+    Rebuilds the ontology closure table and the child counts when a term is added or deleted
+    """
+    if created or kwargs.get('signal') is post_delete:
+        ontology_closure.schedule_rebuild()
+
+
+@receiver(submission_status_changed, sender=Submission)
+def update_accession_summaries_on_status_change(sender, submission, previous_status, **kwargs):
+    """
+    Updates the summaries of the accessions of a study when it is published or unpublished
+    """
+    if PUBLISHED in (submission.status, previous_status):
+        accession_summary.schedule_update(accession_summary.get_study_accession_ids(submission.study_id))
+
+
+@receiver(pre_delete, sender=Study)
+def update_accession_summaries_on_study_delete(sender, instance, **kwargs):
+    """
+    Updates the summaries of the accessions of a deleted published study
+    """
+    if Submission.objects.filter(study=instance, status=PUBLISHED).exists():
+        accession_summary.schedule_update(accession_summary.get_study_accession_ids(instance.pk))
+
+
+@receiver(post_save, sender=Phenotype)
+@receiver(pre_delete, sender=Phenotype)
+def update_accession_summaries_on_phenotype_change(sender, instance, raw=False, **kwargs):
+    """
+    Updates the summaries of the accessions of a changed or deleted published phenotype (e.g. its ontology terms)
+    """
+    if raw or instance.pk is None:
+        return
+    if Submission.objects.filter(study_id=instance.study_id, status=PUBLISHED).exists():
+        accession_summary.schedule_update(accession_summary.get_phenotype_accession_ids(instance.pk))
+
+
+@receiver(submission_status_changed, sender=Submission)
+def update_phenotype_statistics_on_publish(sender, submission, previous_status, **kwargs):
+    """
+    Computes the statistics of the phenotypes of a newly published study
+    """
+    if submission.status == PUBLISHED:
+        phenotype_statistics.schedule_update(submission.study.phenotype_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=PhenotypeValue)
+def update_phenotype_statistics_on_value_change(sender, instance, raw=False, **kwargs):
+    """
+    Recomputes the statistics of a phenotype when one of its values is changed
+    (no post_delete receiver, it would prevent the fast deletion of the values of a study)
+    """
+    if not raw:
+        phenotype_statistics.schedule_update([instance.phenotype_id])
+
+
+@receiver(submission_status_changed, sender=Submission)
+def update_geographic_aggregates_on_publish(sender, submission, previous_status, **kwargs):
+    """
+    Computes the geographic distribution of a newly published study and its phenotypes
+    """
+    if submission.status == PUBLISHED:
+        geographic_aggregates.schedule_update(submission.study_id)
@@ -1,5 +1,42 @@
+import csv
+from io import BytesIO
+from itertools import izip
+
+import numpy as np
+import pandas as pd
+from six import StringIO, text_type
 from rest_framework_csv.renderers import CSVRenderer
 from rest_framework import renderers
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+
+# number of rows that are joined at once by the PLINK renderers
+PLINK_CHUNK_SIZE = 10000
+
+
+class PhenotypeMatrix(object):
+    """
+    Column-wise phenotype matrix of a study
+    headers are the column names (in the order in which the per-row dicts used to be built)
+    and columns the corresponding lists of values
+    """
+
+    def __init__(self, headers, columns):
+        self.headers = headers
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def get_column(self, header, default=None):
+        """Returns the values of a column or default if the column does not exist"""
+        try:
+            return self.columns[self.headers.index(header)]
+        except ValueError:
+            return default
+
+    def to_records(self):
+        """Returns the matrix as a list of dicts (one per row)"""
+        return [dict(izip(self.headers, row)) for row in izip(*self.columns)]
 
 '''
 Renderer class for alternative ordering of the CSV output
@@ -16,7 +53,7 @@ class PhenotypeListRenderer(CSVRenderer):
               'uo_source_acronym','uo_source_name','uo_source_url']
 
 class StudyListRenderer(CSVRenderer):
-    header = ['name','description','phenotype_count']
+    header = ['name','description','phenotype_count','obs_unit_count','value_count','accession_count']
         
         
 class PhenotypeValueRenderer(CSVRenderer):
@@ -26,11 +63,39 @@ class PhenotypeValueRenderer(CSVRenderer):
 class PhenotypeMatrixRenderer(CSVRenderer):
 
     def render(self, data, media_type=None, renderer_context={}, writer_opts=None):
+        if isinstance(data, PhenotypeMatrix):
+            return self._render_matrix(data, renderer_context, writer_opts)
         if type(data) == list and len(data) > 0:
             renderer_context['header'] = self._get_sorted_headers(data[0].keys())
         return super(PhenotypeMatrixRenderer, self).render(data, media_type, renderer_context,writer_opts)
 
 
+    def _render_matrix(self, matrix, renderer_context, writer_opts):
+        """
+        Writes the matrix column-wise without building a dict per row.
+        Produces the same output as rendering matrix.to_records()
+        """
+        if len(matrix) == 0:
+            return ''
+        writer_opts = renderer_context.get('writer_opts', writer_opts or self.writer_opts or {})
+        labels = self.labels or {}
+        # same column order as the keys of the per-row dicts
+        headers = self._get_sorted_headers(dict.fromkeys(matrix.headers).keys())
+        empty_column = [None] * len(matrix)
+        columns = []
+        for header in headers:
+            column = matrix.get_column(header, empty_column)
+            # phenotype columns only contain floats or ''
+            if header == 'accession_name':
+                column = map(_encode, column)
+            columns.append(column)
+        csv_buffer = StringIO()
+        csv_writer = csv.writer(csv_buffer, **writer_opts)
+        csv_writer.writerow([_encode(labels.get(header, header)) for header in headers])
+        csv_writer.writerows(izip(*columns))
+        return csv_buffer.getvalue()
+
+
     def _get_sorted_headers(self,headers):
         headers.remove('obs_unit_id')
         headers.remove('accession_id')
@@ -40,45 +105,139 @@ class PhenotypeMatrixRenderer(CSVRenderer):
         headers.insert(0,'obs_unit_id')
         return headers
 
+class PhenotypeMatrixJSONRenderer(renderers.JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, PhenotypeMatrix):
+            if self.get_indent(accepted_media_type, renderer_context or {}) is None:
+                return self._render_matrix(data)
+            data = data.to_records()
+        return super(PhenotypeMatrixJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+
+    def _render_matrix(self, matrix):
+        """
+        Writes the matrix column-wise without building a dict per row.
+        Produces the same output as rendering matrix.to_records()
+        """
+        item_separator, key_separator = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        encoder = self.encoder_class(ensure_ascii=self.ensure_ascii, separators=(item_separator, key_separator))
+        columns = dict(izip(matrix.headers, matrix.columns))
+        # same key order as the per-row dicts
+        items = []
+        for header in dict.fromkeys(matrix.headers).keys():
+            key = encoder.encode(header) + key_separator
+            items.append([key + value for value in map(encoder.encode, columns[header])])
+        rows = [u'{' + item_separator.join(row) + u'}' for row in izip(*items)]
+        ret = u'[' + item_separator.join(rows) + u']'
+        ret = ret.replace(u'\u2028', u'\\u2028').replace(u'\u2029', u'\\u2029')
+        return ret.encode('utf-8')
+
+
+class PhenotypeMatrixNPZRenderer(renderers.BaseRenderer):
+    """
+    Renders the phenotype matrix of a study as a compressed numpy archive with the arrays
+    obs_unit_id, accession_id, accession_name, phenotype_name and values (obs units x phenotypes, NaN if missing).
+    The values are float64 by default and float32 with ?dtype=float32
+    """
+    media_type = 'application/x-npz'
+    format = 'npz'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, PhenotypeMatrix):
+            return ''
+        dtype = _get_dtype(renderer_context)
+        phenotype_names = _get_phenotype_headers(data)
+        values = np.empty((len(data), len(phenotype_names)), dtype=dtype)
+        for i, header in enumerate(phenotype_names):
+            values[:, i] = _to_float(data.get_column(header))
+        return _savez(obs_unit_id=np.array(data.get_column('obs_unit_id'), dtype=np.int64),
+                      accession_id=np.array(data.get_column('accession_id'), dtype=np.int64),
+                      accession_name=_to_text(data.get_column('accession_name')),
+                      phenotype_name=_to_text(phenotype_names),
+                      values=values)
+
+
+class PhenotypeValueNPZRenderer(renderers.BaseRenderer):
+    """
+    Renders the values of a phenotype as a compressed numpy archive with the arrays
+    obs_unit_id, accession_id, accession_name and phenotype_value (float64 by default and float32 with ?dtype=float32)
+    """
+    media_type = 'application/x-npz'
+    format = 'npz'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            return ''
+        return _savez(obs_unit_id=np.array([row['obs_unit_id'] for row in data], dtype=np.int64),
+                      accession_id=np.array([row['accession_id'] for row in data], dtype=np.int64),
+                      accession_name=_to_text([row['accession_name'] for row in data]),
+                      phenotype_value=_to_float([row['phenotype_value'] for row in data]).astype(_get_dtype(renderer_context)))
+
+
 class AccessionListRenderer(CSVRenderer):
     header = ['pk','name','country','latitude','longitude',
               'collector','collection_date','cs_number','species']
 
 
-class PLINKMatrixRenderer(PhenotypeMatrixRenderer):
+class PLINKMatrixRenderer(renderers.BaseRenderer):
+    """
+    Renders the phenotype matrix of a study in PLINK format (FID = accession id, IID = observation unit id)
+    """
     media_type = "application/plink"
     format = "plink"
-    writer_opts = {'delimiter':' '}
-    labels = {'obs_unit_id':'IID','accession_id':'FID'}
 
+    def render(self, data, media_type=None, renderer_context=None):
+        return b''.join(self.stream(data))
 
-    def _get_sorted_headers(self,headers):
-        headers.remove('obs_unit_id')
-        headers.remove('accession_id')
-        headers.remove('accession_name')
-        headers.insert(0,'obs_unit_id')
-        headers.insert(0,'accession_id')
-        for i,header in enumerate(headers):
-            headers[i] = header.replace(' ','_')
-        return headers
+    def stream(self, data):
+        """
+        Yields the PLINK file in chunks of PLINK_CHUNK_SIZE rows
+        """
+        if isinstance(data, list) and len(data) > 0:
+            headers = list(data[0].keys())
+            data = PhenotypeMatrix(headers, [[row.get(header) for row in data] for header in headers])
+        if not isinstance(data, PhenotypeMatrix) or len(data) == 0:
+            yield b"No Data Found"
+            return
+        phenotype_names = _get_phenotype_headers(data)
+        columns = [data.get_column('accession_id'), data.get_column('obs_unit_id')]
+        columns.extend(data.get_column(name) for name in phenotype_names)
+        for chunk in _stream_plink(phenotype_names, columns):
+            yield chunk
 
 
 '''
 Custom File Renderer
 '''
 class PLINKRenderer(renderers.BaseRenderer):
+    """
+    Renders the values of a phenotype in PLINK format (FID = IID = accession id)
+    """
     media_type = "application/plink"
     format = "plink"
 
     def render(self,data,media_type=None,renderer_context=None):
-        if data is None:
-            return "No Data Found"
-        plink = "FID IID \"" + data[0]['phenotype_name'].replace(' ','_') + "\"\n"
-        for element in data:
-            if not ("accession_id" in element):
-                return "Wrong Data Format"
-            plink += str(element['accession_id']) + " " + str(element['accession_id']) + " " + str(element['phenotype_value']) + "\n"
-        return plink
+        return b''.join(self.stream(data))
+
+    def stream(self, data):
+        """
+        Yields the PLINK file in chunks of PLINK_CHUNK_SIZE rows
+        """
+        if not data:
+            yield b"No Data Found"
+            return
+        if any("accession_id" not in element for element in data):
+            yield b"Wrong Data Format"
+            return
+        accession_ids = [element['accession_id'] for element in data]
+        values = [element['phenotype_value'] for element in data]
+        for chunk in _stream_plink([data[0]['phenotype_name']], [accession_ids, accession_ids, values]):
+            yield chunk
 
 class IsaTabRenderer(CSVRenderer):
 
@@ -131,4 +290,57 @@ class IsaTabFileRenderer(renderers.BaseRenderer):
     format = "isatab"
 
     def render(self,data,media_type=None,renderer_context=None):
-        pass
\ No newline at end of file
+        pass
+
+
+def _get_phenotype_headers(matrix):
+    return [header for header in matrix.headers if header not in ('obs_unit_id', 'accession_id', 'accession_name')]
+
+
+def _get_dtype(renderer_context):
+    request = (renderer_context or {}).get('request')
+    if request is not None and request.query_params.get('dtype') == 'float32':
+        return np.float32
+    return np.float64
+
+
+def _to_float(values):
+    # missing values are '' in the matrix and None in the serialized values
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').values.astype(np.float64)
+
+
+def _to_text(values):
+    return np.array([u'' if value is None else text_type(value) for value in values], dtype=np.unicode_)
+
+
+def _savez(**arrays):
+    npz_buffer = BytesIO()
+    np.savez_compressed(npz_buffer, **arrays)
+    return npz_buffer.getvalue()
+
+
+def _stream_plink(phenotype_names, columns):
+    """
+    Yields the header and the rows (FID, IID and the values of the phenotypes) joined in chunks of PLINK_CHUNK_SIZE rows
+    """
+    yield _encode(u' '.join([u'FID', u'IID'] + [_escape_plink_name(name) for name in phenotype_names]) + u'\n')
+    for start in range(0, len(columns[0]), PLINK_CHUNK_SIZE):
+        ids = [map(text_type, column[start:start + PLINK_CHUNK_SIZE]) for column in columns[:2]]
+        values = [map(_format_plink_value, column[start:start + PLINK_CHUNK_SIZE]) for column in columns[2:]]
+        yield _encode(u''.join(u' '.join(row) + u'\n' for row in izip(*(ids + values))))
+
+
+def _escape_plink_name(name):
+    # PLINK columns are separated by whitespace and quotes are not supported
+    return u'_'.join(text_type(name).replace(u'"', u'').split())
+
+
+def _format_plink_value(value):
+    if value is None or value == '' or value != value:
+        return u'NA'
+    # repr keeps the full precision of floats
+    return text_type(repr(value) if isinstance(value, float) else value)
+
+
+def _encode(value):
+    return value.encode('utf-8') if isinstance(value, text_type) else value
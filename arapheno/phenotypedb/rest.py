@@ -1,7 +1,5 @@
 from django.http import HttpResponse
-from django.db.models import Q
-from django.http import FileResponse
-from django.core.mail import EmailMessage
+from django.http import StreamingHttpResponse
 
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, renderer_classes, parser_classes
@@ -12,22 +10,33 @@ from rest_framework.renderers import JSONRenderer
 from rest_framework.parsers import JSONParser, FileUploadParser, MultiPartParser, FormParser
 from rest_framework.views import APIView
 
-from phenotypedb.models import Phenotype, Study, PhenotypeValue, Accession, Submission, OntologyTerm, OntologySource
-from phenotypedb.serializers import PhenotypeListSerializer, StudyListSerializer, OntologyTermListSerializer
-from phenotypedb.serializers import PhenotypeValueSerializer, ReducedPhenotypeValueSerializer
-from phenotypedb.serializers import AccessionListSerializer, SubmissionDetailSerializer, AccessionPhenotypesSerializer
+from phenotypedb.models import Phenotype, Study, PhenotypeValue, Accession, Submission, SubmissionJob, OntologyTerm, OntologySource
+from phenotypedb.models import PhenotypeStatistics
+from phenotypedb.serializers import PhenotypeListSerializer, PhenotypeListTupleSerializer, StudyListSerializer, OntologyTermListSerializer
+from phenotypedb.serializers import PhenotypeValueTupleSerializer, ReducedPhenotypeValueSerializer
+from phenotypedb.serializers import AccessionListSerializer, SubmissionDetailSerializer, SubmissionJobSerializer, AccessionPhenotypesSerializer
+from phenotypedb.serializers import PhenotypeStatisticsSerializer
 
 from phenotypedb.forms import UploadFileForm
 from phenotypedb.renderer import PhenotypeListRenderer, StudyListRenderer, PhenotypeValueRenderer, PhenotypeMatrixRenderer, IsaTabFileRenderer, AccessionListRenderer
-from phenotypedb.renderer import PLINKRenderer, PLINKMatrixRenderer
+from phenotypedb.renderer import PLINKRenderer, PLINKMatrixRenderer, PhenotypeMatrix, PhenotypeMatrixJSONRenderer
+from phenotypedb.renderer import PhenotypeMatrixNPZRenderer, PhenotypeValueNPZRenderer
 from phenotypedb.parsers import AccessionTextParser
-from utils.isa_tab import export_isatab
+from phenotypedb.pagination import KeysetPagination
+from phenotypedb.conditional import resource_condition, study_validators, phenotype_validators
+from phenotypedb.conditional import study_list_validators, phenotype_list_validators, get_object_id
+from utils.isa_tab import stream_isatab
+from utils import search as search_index
+from utils import ontology_tree
+from utils.phenotype_statistics import get_statistics
+from utils.geographic_aggregates import get_geography
+from utils.response_cache import cached_response
+from utils.correlation import load_phenotype_matrix, get_stored_correlations, pairwise_complete_correlations, to_json_matrix
 from django.views.decorators.csrf import csrf_exempt
 import scipy as sp
-import scipy.stats as stats
 from django.conf import settings
 
-import re,os,array
+import re,array
 
 DOI_REGEX_STUDY = r"%s\/study:[\d]+" % settings.DATACITE_PREFIX
 DOI_REGEX_PHENOTYPE = r"%s\/phenotype:[\d]+" % settings.DATACITE_PREFIX
@@ -35,6 +44,27 @@ DOI_REGEX_PHENOTYPE = r"%s\/phenotype:[\d]+" % settings.DATACITE_PREFIX
 DOI_PATTERN_STUDY = re.compile(DOI_REGEX_STUDY)
 DOI_PATTERN_PHENOTYPE = re.compile(DOI_REGEX_PHENOTYPE)
 
+SEARCH_LIMIT = 100
+SEARCH_MAX_LIMIT = 1000
+
+study_condition = resource_condition(study_validators, DOI_PATTERN_STUDY)
+phenotype_condition = resource_condition(phenotype_validators, DOI_PATTERN_PHENOTYPE)
+study_list_condition = resource_condition(study_list_validators)
+phenotype_list_condition = resource_condition(phenotype_list_validators)
+
+
+def _get_cache_tags(entity, pattern):
+    def _get_tags(q=None, **kwargs):
+        if pattern is None:
+            return [entity]
+        pk = get_object_id(pattern, q)
+        return None if pk is None else ['%s:%s' % (entity, pk)]
+    return _get_tags
+
+study_cache = cached_response(_get_cache_tags('study', DOI_PATTERN_STUDY))
+phenotype_cache = cached_response(_get_cache_tags('phenotype', DOI_PATTERN_PHENOTYPE))
+list_cache = cached_response(_get_cache_tags('list', None))
+
 '''
 Search Endpoint
 '''
@@ -51,6 +81,17 @@ def search(request,query_term=None,format=None):
           type: string
           paramType: path
 
+        - name: limit
+          description: maximum number of results per entity (default 100, max 1000)
+          required: false
+          type: integer
+          paramType: query
+        - name: offset
+          description: number of results per entity to skip
+          required: false
+          type: integer
+          paramType: query
+
     serializer: PhenotypeListSerializer
     omit_serializer: false
 
@@ -59,31 +100,39 @@ def search(request,query_term=None,format=None):
         - application/json
     """
     if request.method == "GET":
-        if query_term==None:
-            studies = Study.objects.published().all()
-            phenotypes = Phenotype.objects.published().all()
-            accessions = Accession.objects.all()
-            ontologies = OntologyTerm.objects.all()
-        else:
-            studies = Study.objects.published().filter(name__icontains=query_term)
-            phenotypes = Phenotype.objects.published().filter(Q(name__icontains=query_term) |
-                                                  Q(to_term__id__icontains=query_term) |
-                                                  Q(to_term__name__icontains=query_term))
-            accessions = Accession.objects.filter(name__icontains=query_term)
-            ontologies = OntologyTerm.objects.filter(name__icontains=query_term)
+        try:
+            limit = min(int(request.query_params.get('limit',SEARCH_LIMIT)),SEARCH_MAX_LIMIT)
+            offset = max(int(request.query_params.get('offset',0)),0)
+        except ValueError:
+            return Response('limit and offset must be integers',status.HTTP_400_BAD_REQUEST)
+        phenotype_ids = search_index.search_ids('phenotype',query_term,limit,offset)
+        phenotype_rows = {}
+        #necessary because sqlite has a limit of 999 SQL variables
+        for i in range(0, len(phenotype_ids), 500):
+            for row in Phenotype.objects.filter(pk__in=phenotype_ids[i:i+500]).with_list_infos():
+                phenotype_rows[row[0]] = row
+        phenotypes = [phenotype_rows[pk] for pk in phenotype_ids if pk in phenotype_rows]
+        studies = search_index.search('study',query_term,limit,offset)
+        accessions = search_index.search('accession',query_term,limit,offset)
+        ontologies = search_index.search('ontology',query_term,limit,offset)
 
         study_serializer = StudyListSerializer(studies,many=True)
-        phenotype_serializer = PhenotypeListSerializer(phenotypes,many=True)
+        phenotype_serializer = PhenotypeListTupleSerializer(phenotypes,many=True)
         accession_serializer = AccessionListSerializer(accessions,many=True)
         ontology_serializer = OntologyTermListSerializer(ontologies,many=True)
         return Response({'phenotype_search_results':phenotype_serializer.data,
                          'study_search_results':study_serializer.data,
                          'accession_search_results':accession_serializer.data,
-                         'ontology_search_results':ontology_serializer.data})
+                         'ontology_search_results':ontology_serializer.data,
+                         'counts':search_index.count(query_term),
+                         'limit':limit,
+                         'offset':offset})
 
 '''
 List all phenotypes
 '''
+@phenotype_list_condition
+@list_cache
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
 @renderer_classes((PhenotypeListRenderer,JSONRenderer))
@@ -91,6 +140,18 @@ def phenotype_list(request,format=None):
     """
     List all available phenotypes
     ---
+    parameters:
+        - name: cursor
+          description: cursor of the page (returned in the Link header of the previous page)
+          required: false
+          type: string
+          paramType: query
+        - name: limit
+          description: number of results per page (default 100, max 1000), enables the pagination
+          required: false
+          type: integer
+          paramType: query
+
     serializer: PhenotypeListSerializer
     omit_serializer: false
 
@@ -98,16 +159,17 @@ def phenotype_list(request,format=None):
         - text/csv
         - application/json
     """
-    phenotypes = Phenotype.objects.published().all()
+    phenotypes = Phenotype.objects.published().with_list_infos()
 
     if request.method == "GET":
-        serializer = PhenotypeListSerializer(phenotypes,many=True)
-        return Response(serializer.data)
+        return _list_response(request,phenotypes,PhenotypeListTupleSerializer)
 
 
 '''
 List all similar phenotypes
 '''
+@phenotype_list_condition
+@list_cache
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
 @renderer_classes((PhenotypeListRenderer,JSONRenderer))
@@ -129,16 +191,18 @@ def phenotype_similar_list(request,q,format=None):
     except:
         return HttpResponse(status=404)
     to_term = phenotype.to_term.id
-    phenotypes = Phenotype.objects.published().filter(to_term__id=to_term)
+    phenotypes = Phenotype.objects.published().filter(to_term__id=to_term).with_list_infos()
 
     if request.method == "GET":
-        serializer = PhenotypeListSerializer(phenotypes,many=True)
+        serializer = PhenotypeListTupleSerializer(phenotypes,many=True)
         return Response(serializer.data)
 
 
 '''
 Detail information about phenotype
 '''
+@phenotype_condition
+@phenotype_cache
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
 @renderer_classes((PhenotypeListRenderer,JSONRenderer))
@@ -177,9 +241,11 @@ def phenotype_detail(request,q,format=None):
 '''
 Get all phenotype values
 '''
+@phenotype_condition
+@phenotype_cache
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
-@renderer_classes((PhenotypeValueRenderer,JSONRenderer,PLINKRenderer,))
+@renderer_classes((PhenotypeValueRenderer,JSONRenderer,PLINKRenderer,PhenotypeValueNPZRenderer))
 def phenotype_value(request,q,format=None):
     """
     List of the phenotype values
@@ -190,6 +256,11 @@ def phenotype_value(request,q,format=None):
           required: true
           type: string
           paramType: path
+        - name: dtype
+          description: type of the values in the npz format (float64 or float32, default float64)
+          required: false
+          type: string
+          paramType: query
 
     serializer: PhenotypeValueSerializer
     omit_serializer: false
@@ -197,6 +268,82 @@ def phenotype_value(request,q,format=None):
     produces:
         - text/csv
         - application/json
+        - application/plink
+        - application/x-npz
+    """
+    doi = _is_doi(DOI_PATTERN_PHENOTYPE, q)
+    try:
+        id = doi if doi else int(q)
+        phenotype = Phenotype.objects.published().get(pk=id)
+    except:
+        return HttpResponse(status=404)
+
+    if request.method == "GET":
+        pheno_acc_infos = phenotype.phenotypevalue_set.with_accession_infos()
+        value_serializer = PhenotypeValueTupleSerializer(pheno_acc_infos,many=True)
+        return _streaming_response(request,value_serializer.data)
+
+'''
+Chart data of the phenotype detail page
+'''
+@phenotype_condition
+@phenotype_cache
+@api_view(['GET'])
+@permission_classes((IsAuthenticatedOrReadOnly,))
+@renderer_classes((JSONRenderer,))
+def phenotype_chart_data(request,q,format=None):
+    """
+    Histogram bins, accessions per country and the mean value of every accession for the charts of the phenotype
+    ---
+    parameters:
+        - name: q
+          description: the id or doi of the phenotype
+          required: true
+          type: string
+          paramType: path
+
+    produces:
+        - application/json
+    """
+    doi = _is_doi(DOI_PATTERN_PHENOTYPE, q)
+    try:
+        id = doi if doi else int(q)
+        phenotype = Phenotype.objects.published().get(pk=id)
+    except:
+        return HttpResponse(status=404)
+
+    if request.method == "GET":
+        accessions = list(phenotype.phenotypevalue_set.with_accession_aggregates())
+        countries = [country[:2] for country in get_geography(phenotype=phenotype)['countries']]
+        # the statistics are computed by the receivers, a GET doesn't write them
+        statistics = PhenotypeStatistics.objects.filter(phenotype=phenotype).first()
+        return Response({'histogram':statistics.get_histogram() if statistics else None,
+                         'countries':countries,
+                         'accession_columns':['id','name','longitude','latitude','country','mean','n'],
+                         'accessions':accessions})
+
+
+'''
+Geographic distribution of the phenotype
+'''
+@phenotype_condition
+@phenotype_cache
+@api_view(['GET'])
+@permission_classes((IsAuthenticatedOrReadOnly,))
+@renderer_classes((JSONRenderer,))
+def phenotype_geography(request,q,format=None):
+    """
+    Number of accessions and mean value per country and per grid cell (precomputed when the study is published)
+    ---
+    parameters:
+        - name: q
+          description: the id or doi of the phenotype
+          required: true
+          type: string
+          paramType: path
+
+    produces:
+        - application/json
     """
     doi = _is_doi(DOI_PATTERN_PHENOTYPE, q)
     try:
@@ -206,13 +353,84 @@ def phenotype_value(request,q,format=None):
         return HttpResponse(status=404)
 
     if request.method == "GET":
-        pheno_acc_infos = phenotype.phenotypevalue_set.prefetch_related('obs_unit__accession')
-        value_serializer = PhenotypeValueSerializer(pheno_acc_infos,many=True)
-        return Response(value_serializer.data)
+        return Response(get_geography(phenotype=phenotype))
+
+
+'''
+Summary statistics of the phenotype values
+'''
+@phenotype_condition
+@phenotype_cache
+@api_view(['GET'])
+@permission_classes((IsAuthenticatedOrReadOnly,))
+@renderer_classes((JSONRenderer,))
+def phenotype_statistics(request,q,format=None):
+    """
+    Summary statistics of the phenotype values (precomputed when the study is published)
+    ---
+    parameters:
+        - name: q
+          description: the id or doi of the phenotype
+          required: true
+          type: string
+          paramType: path
+
+    serializer: PhenotypeStatisticsSerializer
+    omit_serializer: false
+
+    produces:
+        - application/json
+    """
+    doi = _is_doi(DOI_PATTERN_PHENOTYPE, q)
+    try:
+        id = doi if doi else int(q)
+        phenotype = Phenotype.objects.published().get(pk=id)
+    except:
+        return HttpResponse(status=404)
+
+    if request.method == "GET":
+        serializer = PhenotypeStatisticsSerializer(get_statistics(phenotype),many=False)
+        return Response(serializer.data)
+
+
+'''
+Geographic distribution of the study
+'''
+@study_condition
+@study_cache
+@api_view(['GET'])
+@permission_classes((IsAuthenticatedOrReadOnly,))
+@renderer_classes((JSONRenderer,))
+def study_geography(request,q,format=None):
+    """
+    Number of accessions per country and per grid cell (precomputed when the study is published)
+    ---
+    parameters:
+        - name: q
+          description: the id or doi of the study
+          required: true
+          type: string
+          paramType: path
+
+    produces:
+        - application/json
+    """
+    doi = _is_doi(DOI_PATTERN_STUDY, q)
+    try:
+        id = doi if doi else int(q)
+        study = Study.objects.published().get(pk=id)
+    except:
+        return HttpResponse(status=404)
+
+    if request.method == "GET":
+        return Response(get_geography(study=study))
+
 
 '''
 List all studies
 '''
+@study_list_condition
+@list_cache
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
 @renderer_classes((StudyListRenderer,JSONRenderer))
@@ -220,6 +438,17 @@ def study_list(request,format=None):
     """
     List all available studies
     ---
+    parameters:
+        - name: cursor
+          description: cursor of the page (returned in the Link header of the previous page)
+          required: false
+          type: string
+          paramType: query
+        - name: limit
+          description: number of results per page (default 100, max 1000), enables the pagination
+          required: false
+          type: integer
+          paramType: query
 
     serializer: StudyListSerializer
     omit_serializer: false
@@ -228,15 +457,16 @@ def study_list(request,format=None):
         - text/csv
         - application/json
     """
-    studies = Study.objects.published().all()
+    studies = Study.objects.published().with_counts()
     if request.method == "GET":
-        serializer = StudyListSerializer(studies,many=True)
-        return Response(serializer.data)
+        return _list_response(request,studies,StudyListSerializer)
 
 
 '''
 Get detailed information about study
 '''
+@study_condition
+@study_cache
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
 @renderer_classes((StudyListRenderer,JSONRenderer))
@@ -256,7 +486,7 @@ def study_detail(request,q,format=None):
 
     try:
         id = doi if doi else int(q)
-        study = Study.objects.published().get(pk=id)
+        study = Study.objects.published().with_counts().get(pk=id)
     except:
         return HttpResponse(status=404)
 
@@ -268,6 +498,8 @@ def study_detail(request,q,format=None):
 '''
 List all phenotypes for study id/doi
 '''
+@study_condition
+@study_cache
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
 @renderer_classes((PhenotypeListRenderer,JSONRenderer,))
@@ -291,15 +523,17 @@ def study_all_pheno(request,q=None,format=None):
         return HttpResponse(status=404)
 
     if request.method == "GET":
-        serializer = PhenotypeListSerializer(study.phenotype_set.all(),many=True)
+        serializer = PhenotypeListTupleSerializer(study.phenotype_set.with_list_infos(),many=True)
         return Response(serializer.data)
 
 '''
 List phenotype value matrix for entire study
 '''
+@study_condition
+@study_cache
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
-@renderer_classes((PhenotypeMatrixRenderer,PLINKMatrixRenderer,JSONRenderer))
+@renderer_classes((PhenotypeMatrixRenderer,PLINKMatrixRenderer,PhenotypeMatrixJSONRenderer,PhenotypeMatrixNPZRenderer))
 def study_phenotype_value_matrix(request,q,format=None):
     """
     Phenotype value matrix for entire study
@@ -310,11 +544,17 @@ def study_phenotype_value_matrix(request,q,format=None):
           required: true
           type: string
           paramType: path
+        - name: dtype
+          description: type of the values in the npz format (float64 or float32, default float64)
+          required: false
+          type: string
+          paramType: query
 
     produces:
         - text/csv
         - application/json
         - application/plink
+        - application/x-npz
     """
     doi = _is_doi(DOI_PATTERN_STUDY, q)
     try:
@@ -325,8 +565,8 @@ def study_phenotype_value_matrix(request,q,format=None):
 
     if request.method == "GET":
         df,df_pivot = study.get_matrix_and_accession_map()
-        data = _convert_dataframe_to_list(df,df_pivot)
-        return Response(data)
+        data = _convert_dataframe_to_matrix(df,df_pivot)
+        return _streaming_response(request,data)
 
 '''
 Corrleation Matrix for selected phenotypes
@@ -337,6 +577,8 @@ Corrleation Matrix for selected phenotypes
 def phenotype_correlations(request,q=None):
     """
     Return data for phenotype-phenotype correlations and between phenotype accession overlap
+    The replicates are averaged per accession and the correlations are computed over the accessions
+    that have values for both phenotypes
     ---
 
     produces:
@@ -344,73 +586,48 @@ def phenotype_correlations(request,q=None):
     """
     #id string to list
     pids = map(int,q.split(","))
-    pheno_dict = {}
-    for i,pid in enumerate(pids):
-        try:
-            phenotype = Phenotype.objects.published().get(pk=pid)
-        except:
+    phenotypes = Phenotype.objects.published().select_related('study').in_bulk(pids)
+    for pid in pids:
+        if pid not in phenotypes:
             return Response({'message':'FAILED','not_found':pid})
-        pheno_acc_infos = phenotype.phenotypevalue_set.prefetch_related('obs_unit__accession')
-        values = sp.array(pheno_acc_infos.values_list('value',flat=True))
-        samples = sp.array(pheno_acc_infos.values_list('obs_unit__accession__id',flat=True))
-        name = str(phenotype.name.replace("<i>","").replace("</i>","") + " (" + str(phenotype.study.name) + ")")
-        pheno_dict[str(phenotype.name) + "_" + str(phenotype.study.name) + "_" + str(i)] = {'samples':samples,
-                                                                                            'y':values,
-                                                                                            'name':name,
-                                                                                            'id':str(phenotype.id)}
-                                                                                            #str(phenotype.name) + "_" + str(phenotype.study.name) + "_" + str(i)}
-    #compute correlation matrix
-    corr_mat = sp.ones((len(pheno_dict),len(pheno_dict))) * sp.nan
-    spear_mat = sp.ones((len(pheno_dict),len(pheno_dict))) * sp.nan
-    pheno_keys = pheno_dict.keys()
+    phenotypes = [phenotypes[pid] for pid in pids]
+    names = [str(phenotype.name.replace("<i>","").replace("</i>","") + " (" + str(phenotype.study.name) + ")") for phenotype in phenotypes]
+
+    #accession x phenotype matrix (one query) and pairwise-complete correlations
+    matrix = load_phenotype_matrix(pids)
+    correlations = get_stored_correlations(pids)
+    if correlations is None:
+        correlations = pairwise_complete_correlations(matrix.values)
+    corr_mat, spear_mat, overlap = correlations
+    counts = overlap.diagonal()
+    accession_ids = matrix.index.values
+
     axes_data = []
     scatter_data = []
     sample_data = []
-    slabels = {}
-    for i,pheno1 in enumerate(pheno_keys):
-        axes_data.append({"label":pheno_dict[pheno1]['name'],
+    for i,phenotype in enumerate(phenotypes):
+        axes_data.append({"label":names[i],
                           "index":str(i),
-                          "pheno_id":str(pheno_dict[pheno1]['id'])})
-        samples1 = pheno_dict[pheno1]['samples']
-        y1 = pheno_dict[pheno1]['y']
-        #store scatter data
-        scatter_data.append({"label":pheno_dict[pheno1]['name'],
-                             "pheno_id":str(pheno_dict[pheno1]['id']),
-                             "samples": samples1.tolist(),
-                             "values":y1.tolist()})
-
-        for j,pheno2 in enumerate(pheno_keys):
-            samples2 = pheno_dict[pheno2]['samples']
-            y2 = pheno_dict[pheno2]['y']
-            #match accessions
-            ind = (sp.reshape(samples1,(samples1.shape[0],1))==samples2).nonzero()
-            y_tmp = y1[ind[0]]
-            y2 = y2[ind[1]]
-            if y1.shape[0]>0 and y2.shape[0]>0:
-                corr_mat[i][j] = stats.pearsonr(y_tmp.flatten(),y2.flatten())[0]
-                spear_mat[i][j] = stats.spearmanr(y_tmp.flatten(),y2.flatten())[0]
-            #compute sample intersections
-            if pheno1==pheno2:
-                continue
-            if pheno1 + "_" + pheno2 in slabels:
-                continue
-            if pheno2 + "_" + pheno1 in slabels:
-                continue
-            slabels[pheno1 + "_" + pheno2] = True
-            A = samples1.shape[0]
-            B = samples2.shape[0]
-            C = sp.intersect1d(samples1,samples2).shape[0]
-            sample_data.append({"labelA":pheno_dict[pheno1]['name'],
-                                "labelA_id":pheno_dict[pheno1]['id'],
-                                "labelB":pheno_dict[pheno2]['name'],
-                                "labelB_id":pheno_dict[pheno2]['id'],
-                                "A":A, "B":B, "C":C})
+                          "pheno_id":str(phenotype.id)})
+        values = matrix.values[:,i]
+        has_value = ~sp.isnan(values)
+        scatter_data.append({"label":names[i],
+                             "pheno_id":str(phenotype.id),
+                             "samples":accession_ids[has_value].tolist(),
+                             "values":values[has_value].tolist()})
+        #sample intersections
+        for j in range(i+1,len(phenotypes)):
+            sample_data.append({"labelA":names[i],
+                                "labelA_id":str(phenotype.id),
+                                "labelB":names[j],
+                                "labelB_id":str(phenotypes[j].id),
+                                "A":int(counts[i]), "B":int(counts[j]), "C":int(overlap[i,j])})
     data = {}
     data['axes_data'] = axes_data
     data['scatter_data'] = scatter_data
     data['sample_data'] = sample_data
-    data['corr_mat'] = str(corr_mat.tolist()).replace("nan","NaN")
-    data['spear_mat'] = str(spear_mat.tolist()).replace("nan","NaN")
+    data['corr_mat'] = to_json_matrix(corr_mat)
+    data['spear_mat'] = to_json_matrix(spear_mat)
 
     if request.method == "GET":
         return Response(data)
@@ -419,6 +636,8 @@ def phenotype_correlations(request,q=None):
 '''
 Returns ISA-TAB archive
 '''
+# not stored in the response cache, which would buffer the whole archive
+@study_condition
 @api_view(['GET'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
 @renderer_classes((IsaTabFileRenderer,JSONRenderer))
@@ -443,13 +662,9 @@ def study_isatab(request,q,format=None):
     except:
         return HttpResponse(status=404)
 
-    isa_tab_file = export_isatab(study)
-    zip_file = open(isa_tab_file, 'rb')
-    response = FileResponse(zip_file,content_type='application/zip')
-    #response = HttpResponse(FileWrapper(zip_file), content_type='application/zip',content_transfer_encoding='binary')
+    response = StreamingHttpResponse(stream_isatab(study),content_type='application/zip')
     response.setdefault('Content-Transfer-Encoding','binary')
     response['Content-Disposition'] = 'attachment; filename="isatab_study_%s.zip"' % study.id
-    os.unlink(isa_tab_file)
     return response
 
 
@@ -463,6 +678,17 @@ def accession_list(request,format=None):
     """
     List all accessions
     ---
+    parameters:
+        - name: cursor
+          description: cursor of the page (returned in the Link header of the previous page)
+          required: false
+          type: string
+          paramType: query
+        - name: limit
+          description: number of results per page (default 100, max 1000), enables the pagination
+          required: false
+          type: integer
+          paramType: query
 
     serializer: AccessionListSerializer
     omit_serializer: false
@@ -473,8 +699,7 @@ def accession_list(request,format=None):
     """
     accessions = Accession.objects.all().prefetch_related('species')
     if request.method == "GET":
-        serializer = AccessionListSerializer(accessions,many=True)
-        return Response(serializer.data)
+        return _list_response(request,accessions,AccessionListSerializer)
 
 '''
 Get detailed information about study
@@ -509,6 +734,17 @@ def accession_phenotypes(request,pk,format=None):
     """
     List all phenotypes for an accession
     ---
+    parameters:
+        - name: cursor
+          description: cursor of the page (returned in the Link header of the previous page)
+          required: false
+          type: string
+          paramType: query
+        - name: limit
+          description: number of results per page (default 100, max 1000), enables the pagination
+          required: false
+          type: integer
+          paramType: query
 
     serializer: PhenotypeListSerializer
     omit_serializer: false
@@ -517,11 +753,10 @@ def accession_phenotypes(request,pk,format=None):
         - text/csv
         - application/json
     """
-    phenotypes = Phenotype.objects.published().filter(phenotypevalue__obs_unit__accession_id=pk)
+    phenotypes = Phenotype.objects.published().filter(phenotypevalue__obs_unit__accession_id=pk).with_list_infos()
 
     if request.method == "GET":
-        serializer = PhenotypeListSerializer(phenotypes,many=True)
-        return Response(serializer.data)
+        return _list_response(request,phenotypes,PhenotypeListTupleSerializer)
 
 @api_view(['POST'])
 @permission_classes((AllowAny,))
@@ -542,8 +777,17 @@ def accessions_phenotypes(request,format=None):
         - application/json
     """
     acc_phenotype_list = {}
+    accession_ids = {}
     for id in set(request.data):
-        acc_phenotype_list[id] = Phenotype.objects.published().filter(phenotypevalue__obs_unit__accession_id=id)
+        acc_phenotype_list[id] = []
+        accession_ids.setdefault(int(id),[]).append(id)
+    ids = accession_ids.keys()
+    #necessary because sqlite has a limit of 999 SQL variables
+    for i in range(0, len(ids), 500):
+        phenotypes = Phenotype.objects.published().filter(phenotypevalue__obs_unit__accession_id__in=ids[i:i+500])
+        for row in phenotypes.with_list_infos('phenotypevalue__obs_unit__accession_id'):
+            for id in accession_ids[row[0]]:
+                acc_phenotype_list[id].append(row[1:])
     if request.method == "POST":
         serializer = AccessionPhenotypesSerializer(acc_phenotype_list)
         return Response(serializer.data)
@@ -560,26 +804,116 @@ def ontology_tree_data(request,acronym=None,term_id=None,format=None):
         - application/json
     """
     if term_id is not None:
-        term = OntologyTerm.objects.get(pk=term_id)
-        data = [{'text':t.name,'id':t.id, 'children': True if t.children.count() > 0 else False} for t in term.children.all()]
+        data = ontology_tree.get_child_nodes(term_id)
     else:
         source = OntologySource.objects.get(acronym=acronym)
-        roots = source.ontologyterm_set.filter(parents=None)
-        data = [{'text':term.name,'id':term.id,'children':True if term.children.count() > 0 else False} for term in roots]
+        data = ontology_tree.get_root_nodes(source.pk)
     return Response(data)
 
 
 
+'''
+Descendants and ancestors of an ontology term
+'''
+@api_view(['GET'])
+@permission_classes((IsAuthenticatedOrReadOnly,))
+@renderer_classes((JSONRenderer,))
+def ontology_term_descendants(request,term_id,format=None):
+    """
+    List all descendants of an ontology term (children, their children, etc.)
+    ---
+    parameters:
+        - name: term_id
+          description: the id of the ontology term
+          required: true
+          type: string
+          paramType: path
+
+    serializer: OntologyTermListSerializer
+    omit_serializer: false
+
+    produces:
+        - application/json
+    """
+    return _ontology_term_response(OntologyTerm.objects.descendants_of(term_id,include_self=False),term_id)
+
+
+@api_view(['GET'])
+@permission_classes((IsAuthenticatedOrReadOnly,))
+@renderer_classes((JSONRenderer,))
+def ontology_term_ancestors(request,term_id,format=None):
+    """
+    List all ancestors of an ontology term (parents, their parents, etc.)
+    ---
+    parameters:
+        - name: term_id
+          description: the id of the ontology term
+          required: true
+          type: string
+          paramType: path
+
+    serializer: OntologyTermListSerializer
+    omit_serializer: false
+
+    produces:
+        - application/json
+    """
+    return _ontology_term_response(OntologyTerm.objects.ancestors_of(term_id,include_self=False),term_id)
+
+
+'''
+List all phenotypes of an ontology term
+'''
+@api_view(['GET'])
+@permission_classes((IsAuthenticatedOrReadOnly,))
+@renderer_classes((PhenotypeListRenderer,JSONRenderer))
+def ontology_term_phenotypes(request,term_id,format=None):
+    """
+    List all published phenotypes that are annotated with the ontology term or one of its descendants
+    ---
+    parameters:
+        - name: term_id
+          description: the id of the ontology term
+          required: true
+          type: string
+          paramType: path
+        - name: cursor
+          description: cursor of the page (returned in the Link header of the previous page)
+          required: false
+          type: string
+          paramType: query
+        - name: limit
+          description: number of results per page (default 100, max 1000), enables the pagination
+          required: false
+          type: integer
+          paramType: query
+
+    serializer: PhenotypeListSerializer
+    omit_serializer: false
+
+    produces:
+        - text/csv
+        - application/json
+    """
+    try:
+        term = OntologyTerm.objects.select_related('source').get(pk=term_id)
+    except OntologyTerm.DoesNotExist:
+        return HttpResponse(status=404)
+    phenotypes = Phenotype.objects.published().with_ontology_term(term).with_list_infos()
+    return _list_response(request,phenotypes,PhenotypeListTupleSerializer)
+
+
+
 @api_view(['POST'])
 @permission_classes((AllowAny,))
 @renderer_classes((JSONRenderer,))
 @parser_classes((FormParser, MultiPartParser))
 def submit_study(request,format=None):
     """
-    Submit a study
+    Submit a study (the file is imported in the background, the progress is available at rest_url)
     ---
 
-    serializer: SubmissionDetailSerializer
+    serializer: SubmissionJobSerializer
     omit_serializer: false
 
     produces:
@@ -589,21 +923,9 @@ def submit_study(request,format=None):
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
             try:
-                submission = form.save()
-                email = EmailMessage(
-                    'Study submitted to AraPheno',
-                    submission.get_email_text(),
-                    'uemit.seren@gmi.oeaw.ac.at',
-                    [submission.email],
-                    [settings.ADMINS[0][1]],
-                    reply_to=['uemit.seren@gmi.oeaw.ac.at']
-                )
-                email.send(True)
-                serializer = SubmissionDetailSerializer(submission,many=False,context={'request': request})
-
-                return Response(serializer.data, status.HTTP_201_CREATED)
-            except Accession.DoesNotExist as err:
-                return Response('Unknown accession with ID: %s' % err.args[-1],status.HTTP_400_BAD_REQUEST)
+                job = form.save()
+                serializer = SubmissionJobSerializer(job,many=False,context={'request': request})
+                return Response(serializer.data, status.HTTP_202_ACCEPTED)
             except Exception as err:
                 return Response(str(err),status.HTTP_400_BAD_REQUEST)
         else:
@@ -629,6 +951,13 @@ def submission_infos(request,pk,format=None):
             submission = Submission.objects.get(pk=pk)
             serializer = SubmissionDetailSerializer(submission,many=False,context={'request': request})
             return Response(serializer.data)
+        except Submission.DoesNotExist:
+            pass
+        # the study of a queued or failed submission has not been imported
+        try:
+            job = SubmissionJob.objects.get(pk=pk)
+            serializer = SubmissionJobSerializer(job,many=False,context={'request': request})
+            return Response(serializer.data)
         except Exception as err:
             return HttpResponse(str(err),status=404)
 
@@ -660,20 +989,42 @@ def delete_submission(request,pk,format=None):
 
 
 
-def _convert_dataframe_to_list(df, df_pivot):
-    df_pivot = df_pivot.fillna('')
-    data = []
-    headers = df_pivot.columns.tolist()
-    for obs_unit_id,row in df_pivot.iterrows():
-        info = df.ix[obs_unit_id]
-        accession_id = info.accession_id
-        accession_name = info.accession_name
-        csv_row = {'obs_unit_id':obs_unit_id,'accession_id':accession_id,'accession_name':accession_name}
-        for i,value in enumerate(row.values):
-            csv_row[headers[i]] = value
-        data.append(csv_row)
-    return data
+def _ontology_term_response(terms, term_id):
+    if not OntologyTerm.objects.filter(pk=term_id).exists():
+        return HttpResponse(status=404)
+    serializer = OntologyTermListSerializer(terms.select_related('source').order_by('pk'),many=True)
+    return Response(serializer.data)
+
+
+def _list_response(request, queryset, serializer_class):
+    paginator = KeysetPagination()
+    if paginator.is_requested(request):
+        page = paginator.paginate_queryset(queryset,request)
+        serializer = serializer_class(page,many=True)
+        return paginator.get_paginated_response(serializer.data)
+    serializer = serializer_class(queryset,many=True)
+    return Response(serializer.data)
+
 
+def _convert_dataframe_to_matrix(df, df_pivot):
+    info = df.reindex(df_pivot.index)
+    headers = ['obs_unit_id','accession_id','accession_name'] + df_pivot.columns.tolist()
+    columns = [df_pivot.index.tolist(),info.accession_id.tolist(),info.accession_name.tolist()]
+    for header in df_pivot.columns:
+        values = df_pivot[header]
+        columns.append(values.astype(object).where(values.notnull(),'').tolist())
+    return PhenotypeMatrix(headers,columns)
+
+
+
+def _streaming_response(request, data):
+    """
+    Streams the data if the negotiated renderer can write it in chunks (PLINK), otherwise returns a normal Response
+    """
+    renderer = request.accepted_renderer
+    if not hasattr(renderer, 'stream'):
+        return Response(data)
+    return StreamingHttpResponse(renderer.stream(data),content_type='%s; charset=utf-8' % renderer.media_type)
 
 
 def _is_doi(pattern, term):
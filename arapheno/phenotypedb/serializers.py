@@ -1,7 +1,10 @@
+from collections import OrderedDict
+from itertools import izip
+
 from rest_framework import serializers
 
-from phenotypedb.models import Phenotype,PhenotypeValue,Study, Accession, OntologyTerm, OntologySource
-from phenotypedb.models import ObservationUnit, Submission, StudyCuration, PhenotypeCuration, Curation
+from phenotypedb.models import Phenotype,PhenotypeValue,Study, Accession, OntologyTerm, OntologySource, PhenotypeQuerySet
+from phenotypedb.models import PhenotypeStatistics, ObservationUnit, Submission, SubmissionJob, StudyCuration, PhenotypeCuration, Curation
 
 '''
 Phenotype List Serializer Class (read-only: might be extended to also allow integration of new data)
@@ -156,6 +159,33 @@ class PhenotypeListSerializer(serializers.ModelSerializer):
             return ""
 
 
+'''
+Phenotype List Serializer Class operating on the tuples returned by
+PhenotypeQuerySet.with_list_infos() (same output as PhenotypeListSerializer)
+'''
+class PhenotypeListTupleSerializer(serializers.BaseSerializer):
+    fields_order = PhenotypeListSerializer.Meta.fields
+    term_fields = (('name','name'),('comment','comment'),('definition','definition'),
+                   ('source_acronym','source__acronym'),('source_name','source__name'),('source_url','source__url'))
+    integration_date = serializers.DateTimeField()
+
+    def to_representation(self, obj):
+        row = dict(izip(PhenotypeQuerySet.LIST_INFO_FIELDS, obj))
+        data = {'species': row['species__genus'] + " " + row['species__species'] + " (NCBI: " + str(row['species__ncbi_id']) + ")",
+                'phenotype_id': row['id'],
+                'doi': Phenotype(id=row['id']).doi,
+                'study': row['study__name'],
+                'integration_date': self.integration_date.to_representation(row['integration_date'])}
+        for field in ('name','scoring','source','type','growth_conditions','number_replicates'):
+            data[field] = row[field]
+        for prefix in ('to','eo','uo'):
+            term_id = row['%s_term_id' % prefix]
+            data['%s_term' % prefix] = term_id
+            for field, lookup in self.term_fields:
+                data['%s_%s' % (prefix, field)] = "" if term_id is None else row['%s_term__%s' % (prefix, lookup)]
+        return OrderedDict((field, data[field]) for field in self.fields_order)
+
+
 class AccessionPhenotypesSerializer(serializers.Serializer):
 
     def __init__(self, *args, **kwargs):
@@ -164,7 +194,7 @@ class AccessionPhenotypesSerializer(serializers.Serializer):
     def to_representation(self, obj):
         data = {}
         for acc_id,phen_data in obj.iteritems():
-            data[acc_id] = PhenotypeListSerializer(phen_data,many=True).data
+            data[acc_id] = PhenotypeListTupleSerializer(phen_data,many=True).data
         return data
 
 
@@ -242,21 +272,46 @@ class PhenotypeValueSerializer(serializers.ModelSerializer):
             return ""
 
 
+'''
+Phenotype Value Serializer Class operating on the tuples returned by
+PhenotypeValueQuerySet.with_accession_infos() (same output as PhenotypeValueSerializer)
+'''
+class PhenotypeValueTupleSerializer(serializers.BaseSerializer):
+    fields_order = PhenotypeValueSerializer.Meta.fields
+
+    def to_representation(self, obj):
+        return OrderedDict(izip(self.fields_order, obj))
+
+
 '''
 Study List Serializer Class (read-only: might be extended to also allow integration of new data)
 '''
 class StudyListSerializer(serializers.ModelSerializer):
-    phenotype_count = serializers.SerializerMethodField()
+    # annotated by StudyQuerySet.with_counts
+    phenotype_count = serializers.IntegerField(read_only=True)
+    obs_unit_count = serializers.IntegerField(read_only=True)
+    value_count = serializers.IntegerField(read_only=True)
+    accession_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Study
-        fields = ('name','description','phenotype_count')
+        fields = ('name','description','phenotype_count','obs_unit_count','value_count','accession_count')
 
-    def get_phenotype_count(self,obj):
-        try:
-            return obj.phenotype_set.count()
-        except:
-            return ""
+'''
+Phenotype Statistics Serializer Class
+'''
+class PhenotypeStatisticsSerializer(serializers.ModelSerializer):
+    histogram = serializers.SerializerMethodField()
+    shapiro_test_statistic = serializers.FloatField(source='phenotype.shapiro_test_statistic',read_only=True)
+    shapiro_p_value = serializers.FloatField(source='phenotype.shapiro_p_value',read_only=True)
+
+    class Meta:
+        model = PhenotypeStatistics
+        fields = ('phenotype','value_count','accession_count','mean','sd','min','q1','median','q3','max','skewness',
+                  'histogram','shapiro_test_statistic','shapiro_p_value','update_date')
+
+    def get_histogram(self,obj):
+        return obj.get_histogram()
 
 '''
 Reduced Phenotype Value Serializer Class
@@ -342,6 +397,18 @@ class SubmissionDetailSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('pk','firstname','submission_date','update_date','curation_date','lastname','email','status','rest_url','html_url','study')
 
 
+class SubmissionJobSerializer(serializers.HyperlinkedModelSerializer):
+    rest_url = serializers.HyperlinkedIdentityField(view_name='submission_infos')
+    html_url = serializers.HyperlinkedIdentityField(view_name='submission_study_result')
+    status = serializers.CharField(source='status_text', read_only=True)
+    queue_position = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SubmissionJob
+        fields = ('pk','firstname','lastname','email','filename','status','queue_position','message',
+                  'submission_date','start_date','end_date','rest_url','html_url')
+
+
 class OntologySourceSerializer(serializers.ModelSerializer):
 
      class Meta:
@@ -0,0 +1,7 @@
+"""
+Signals sent by the phenotypedb models
+"""
+from django.dispatch import Signal
+
+# sent after a Submission was saved with a different status (e.g. when it is published)
+submission_status_changed = Signal(providing_args=['submission', 'previous_status'])
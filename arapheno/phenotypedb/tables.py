@@ -51,18 +51,24 @@ class PhenotypeTable(ReducedPhenotypeTable):
 class AccessionPhenotypeTable(PhenotypeTable):
     """
     Table that is displayed in the accession detial view
+    The values of the accession are aggregated by PhenotypeQuerySet.with_accession_values
     """
-    value = tables.Column(empty_values=(),verbose_name='Value (mean)')
+    value = tables.Column(accessor="value_mean", verbose_name='Value (mean)', order_by="value_mean")
+    n = tables.Column(accessor="value_count", verbose_name='N', order_by="value_count")
+    sd = tables.Column(empty_values=(), verbose_name='SD', orderable=False)
+    range = tables.Column(empty_values=(), verbose_name='Range', orderable=False)
 
-    def __init__(self, accession_id, *args, **kwargs):
-        super(AccessionPhenotypeTable, self).__init__(*args, **kwargs)
-        self.accession_id = accession_id
+    def render_value(self, value):
+        return str(value)
 
-    def render_value(self,record):
-        values = record.get_values_for_acc(self.accession_id)
-        if not values:
+    def render_sd(self, record):
+        if record.value_count < 2:
             return "N/A"
-        return str(np.mean(values))
+        variance = (record.value_sum_squares - record.value_count * record.value_mean ** 2) / (record.value_count - 1)
+        return str(np.sqrt(max(variance, 0)))
+
+    def render_range(self, record):
+        return "%s - %s" % (record.value_min, record.value_max)
 
 
 class StudyTable(tables.Table):
@@ -71,7 +77,8 @@ class StudyTable(tables.Table):
     """
     name = tables.LinkColumn("study_detail", args=[A('id')], text=lambda record: record.name, verbose_name="Study Name", order_by="name")
     description = tables.Column(accessor="description", verbose_name="Description", order_by="description")
-    phenotypes = tables.Column(accessor="count_phenotypes", verbose_name="#Phenotypes", order_by="phenotype")
+    phenotypes = tables.Column(accessor="phenotype_count", verbose_name="#Phenotypes", order_by="phenotype_count")
+    accessions = tables.Column(accessor="accession_count", verbose_name="#Accessions", order_by="accession_count")
 
     class Meta:
         attrs = {"class": "striped"}
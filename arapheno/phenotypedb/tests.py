@@ -1,3 +1,1055 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from datetime import timedelta
+from io import BytesIO
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from scipy.stats import pearsonr, shapiro, spearmanr
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import urlencode
+from rest_framework.renderers import JSONRenderer
+
+from phenotypedb.models import Species, Study, Submission, Phenotype, PhenotypeValue, ObservationUnit, Accession
+from phenotypedb.models import OntologySource, OntologyTerm, OntologyTermClosure, SubmissionJob, PUBLISHED, JOB_FINISHED
+from phenotypedb.models import JOB_FAILED, JOB_RUNNING
+from phenotypedb.models import PhenotypeStatistics
+from phenotypedb.pagination import KeysetPaginator
+from phenotypedb.renderer import PhenotypeMatrix, PhenotypeMatrixJSONRenderer, PhenotypeMatrixRenderer
+from phenotypedb.serializers import PhenotypeListSerializer, PhenotypeListTupleSerializer, StudyListSerializer
+from phenotypedb.tables import AccessionPhenotypeTable
+from utils import accession_summary, correlation, geographic_aggregates, isa_tab, ontology_closure, ontology_tree
+from utils import phenotype_statistics, response_cache, search, save_plink
+from utils.data_io import parse_plink_file
+from utils.isa_tab import save_isatab
+from utils.submission_queue import claim_next_job, run_worker
+
+
+def run_on_commit_callbacks(start=0):
+    """
+    Runs the on_commit callbacks that were registered after the first start callbacks
+    (a TestCase is never committed, so they would never run)
+    """
+    for savepoint_ids, func in connection.run_on_commit[start:]:
+        func()
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class PhenotypeListQueryCountTest(TestCase):
+    """
+    The phenotype list endpoints must issue the same number of queries
+    regardless of the number of phenotypes they return
+    """
+
+    def setUp(self):
+        self.species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.source = OntologySource.objects.create(acronym='PTO', name='Plant Trait Ontology', url='http://example.org/to')
+        self.to_term = OntologyTerm.objects.create(id='TO:0000001', name='flowering time', source=self.source)
+        self.accession = Accession.objects.create(name='Col-0', species=self.species)
+        self.study = Study.objects.create(name='flowering study', species=self.species)
+        self.obs_unit = ObservationUnit.objects.create(accession=self.accession, study=self.study)
+        self.add_phenotypes(1)
+        Submission.objects.create(study=self.study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def add_phenotypes(self, count):
+        phenotypes = []
+        for i in range(count):
+            phenotype = Phenotype.objects.create(name='flowering %s' % i, species=self.species, study=self.study,
+                                                 to_term=self.to_term if i % 2 == 0 else None)
+            PhenotypeValue.objects.create(phenotype=phenotype, obs_unit=self.obs_unit, value=float(i))
+            phenotypes.append(phenotype)
+        search.index_objects('phenotype', phenotypes)
+
+    def assertConstantQueries(self, url, data=None):
+        request = lambda: self.client.post(url, data, content_type='application/json') if data else self.client.get(url)
+        # the first request imports the url configuration, whose autocomplete fields query the phenotypes
+        request()
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        self.add_phenotypes(10)
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(request().status_code, 200)
+
+    def test_tuple_serializer_output(self):
+        phenotypes = Phenotype.objects.order_by('pk')
+        self.add_phenotypes(2)
+        expected = PhenotypeListSerializer(phenotypes, many=True).data
+        self.assertEqual(PhenotypeListTupleSerializer(phenotypes.with_list_infos(), many=True).data, expected)
+
+    def test_phenotype_list(self):
+        self.assertConstantQueries('/rest/phenotype/list.json')
+
+    def test_study_all_pheno(self):
+        self.assertConstantQueries('/rest/study/%s/phenotypes.json' % self.study.pk)
+
+    def test_accession_phenotypes(self):
+        self.assertConstantQueries('/rest/accession/%s/phenotypes.json' % self.accession.pk)
+
+    def test_accessions_phenotypes(self):
+        self.assertConstantQueries('/rest/accession/phenotypes.json', '[%s]' % self.accession.pk)
+
+    def test_search(self):
+        self.assertConstantQueries('/rest/search/flowering.json')
+
+    def test_search_page_study_table(self):
+        search.index_objects('study', [self.study])
+        response = self.client.get('/search_results/flowering/?sort=phenotypes')
+        self.assertEqual(response.status_code, 200)
+        row = response.context['study_table'].rows[0]
+        self.assertEqual((row.get_cell('phenotypes'), row.get_cell('accessions')), (1, 1))
+
+    def test_search_page_ranking(self):
+        # the name has the highest weight, so the phenotype with the query in its name is ranked first
+        phenotypes = [Phenotype.objects.create(name=name, scoring='flowering', species=self.species, study=self.study)
+                      for name in ('aaa', 'zzz')]
+        search.index_objects('phenotype', phenotypes)
+        response = self.client.get('/search_results/flowering/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['phenotype_table'].rows[0].record.name, 'flowering 0')
+
+    def test_raw_save(self):
+        # objects loaded from fixtures are indexed by the rebuild of the index
+        search.remove_objects('accession', [self.accession.pk])
+        post_save.send(sender=Accession, instance=self.accession, created=False, raw=True)
+        self.assertEqual(search.search_ids('accession', 'Col', 10), [])
+        self.accession.save()
+        self.assertEqual(search.search_ids('accession', 'Col', 10), [self.accession.pk])
+
+    def test_remove_objects(self):
+        phenotype = Phenotype.objects.get(name='flowering 0')
+        search.index_objects('phenotype', [phenotype])
+        self.assertEqual(search.search_ids('phenotype', 'flowering', 10), [phenotype.pk])
+        search.remove_objects('phenotype', [phenotype.pk])
+        self.assertEqual(search.search_ids('phenotype', 'flowering', 10), [])
+        cursor = connection.cursor()
+        cursor.execute("SELECT count(*) FROM %s WHERE entity = 'phenotype'" % search.SEARCH_KEY_TABLE)
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class KeysetPaginationTest(TestCase):
+    """
+    Walking through the pages with the cursors must return every row exactly once
+    and in the order of the queryset, also with ties and NULLs in the ordering column
+    """
+
+    def setUp(self):
+        self.species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        names = ['b', 'a', None, 'a', 'c', None, 'a', 'b', None]
+        countries = ['SWE', None, 'GER', 'SWE', None, 'SWE', 'GER', None, 'AUT']
+        for name, country in zip(names, countries):
+            Accession.objects.create(name=name, country=country, species=self.species)
+
+    def walk(self, queryset, per_page):
+        """
+        Returns the primary keys of the pages from the first to the last page and back
+        """
+        paginator = KeysetPaginator(queryset, per_page)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_page_number))
+        self.assertEqual([page.number for page in pages], list(range(1, len(pages) + 1)))
+        forward = [[accession.pk for accession in page.object_list] for page in pages]
+        backward = [forward[-1]]
+        page = pages[-1]
+        while page.has_previous():
+            page = paginator.page(page.previous_page_number)
+            backward.insert(0, [accession.pk for accession in page.object_list])
+        self.assertEqual(backward, forward)
+        return [pk for page in forward for pk in page]
+
+    def test_ties_and_nulls(self):
+        for ordering in ('name', '-name', 'country', '-country'):
+            queryset = Accession.objects.order_by(ordering)
+            tie_breaker = '-pk' if ordering.startswith('-') else 'pk'
+            expected = list(queryset.order_by(ordering, tie_breaker).values_list('pk', flat=True))
+            for per_page in (1, 2, 4, 20):
+                self.assertEqual(self.walk(queryset, per_page), expected)
+
+    def test_seek(self):
+        paginator = KeysetPaginator(Accession.objects.order_by('country'), 2)
+        cursor = paginator.page().next_page_number
+        with CaptureQueriesContext(connection) as queries:
+            page = paginator.page(cursor)
+        self.assertEqual(page.number, 2)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"country"', queries[0]['sql'].split('WHERE')[1])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+    def test_offset_fallback(self):
+        # orderings on related columns are paged with an offset
+        queryset = Accession.objects.order_by('species__genus', 'pk')
+        self.assertIsNone(KeysetPaginator(queryset, 2).ordering)
+        self.assertEqual(self.walk(queryset, 2), list(queryset.values_list('pk', flat=True)))
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(Accession.objects.order_by('name'), 2)
+        first = [accession.pk for accession in paginator.page().object_list]
+        other_ordering = KeysetPaginator(Accession.objects.order_by('country'), 2).page().next_page_number
+        for cursor in ('invalid', other_ordering):
+            page = paginator.page(cursor)
+            self.assertEqual((page.number, [accession.pk for accession in page.object_list]), (1, first))
+
+    def test_rest_links(self):
+        url = 'http://testserver/rest/accession/list.json?limit=4'
+        pks = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pks.extend(row['pk'] for row in json.loads(response.content))
+            links = dict((rel, link) for link, rel in re.findall(r'<([^>]*)>; rel="(\w+)"', response.get('Link', '')))
+            self.assertEqual('prev' in links, len(pks) > 4)
+            url = links.get('next')
+        self.assertEqual(pks, list(Accession.objects.order_by('pk').values_list('pk', flat=True)))
+        response = self.client.get('/rest/accession/list.json')
+        self.assertNotIn('Link', response)
+        self.assertEqual(len(json.loads(response.content)), Accession.objects.count())
+
+    def test_table_page_links(self):
+        for i in range(20):
+            Accession.objects.create(name='accession %s' % i, species=self.species)
+        response = self.client.get('/accessions/')
+        self.assertEqual(response.status_code, 200)
+        page = response.context['accession_table'].page
+        self.assertEqual((page.number, page.has_previous(), page.has_next()), (1, False, True))
+        self.assertContains(response, 'Page 1<')
+        self.assertNotContains(response, 'Page 1 of')
+        self.assertContains(response, '?%s"' % urlencode({'page': page.next_page_number}))
+        response = self.client.get('/accessions/', {'page': page.next_page_number})
+        page = response.context['accession_table'].page
+        self.assertEqual((page.number, len(page), page.has_previous(), page.has_next()), (2, 9, True, False))
+        self.assertContains(response, 'Page 2<')
+        self.assertContains(response, '?%s"' % urlencode({'page': page.previous_page_number}))
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class ConditionalGetTest(TestCase):
+    """
+    Published studies and phenotypes are answered with 304 if they did not change
+    """
+
+    def setUp(self):
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.study = Study.objects.create(name='flowering study', species=species)
+        self.phenotype = Phenotype.objects.create(name='flowering', species=species, study=self.study)
+        Submission.objects.create(study=self.study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def assertNotModified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.phenotype.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_study_values(self):
+        self.assertNotModified('/rest/study/%s/values.csv' % self.study.pk)
+
+    def test_phenotype_values(self):
+        self.assertNotModified('/rest/phenotype/%s/values.json' % self.phenotype.pk)
+
+    def test_phenotype_list(self):
+        self.assertNotModified('/rest/phenotype/list.json')
+
+    def test_phenotype_statistics(self):
+        self.assertNotModified('/rest/phenotype/%s/stats/' % self.phenotype.pk)
+
+    def test_update_dates(self):
+        self.assertTrue(timezone.is_aware(self.study.update_date))
+        self.assertTrue(timezone.is_aware(self.phenotype.update_date))
+
+
+class ResponseCacheTest(TestCase):
+    """
+    Responses of published studies are shared through the response cache until they are invalidated
+    """
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings = override_settings(RESPONSE_CACHE_PATH=os.path.join(self.cache_dir, 'cache.sqlite3'))
+        self.settings.enable()
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.study = Study.objects.create(name='flowering study', species=species)
+        Phenotype.objects.create(name='flowering', species=species, study=self.study)
+        Submission.objects.create(study=self.study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache(self):
+        url = '/rest/study/%s/phenotypes.csv' % self.study.pk
+        response = self.client.get(url)
+        # only the validators of the conditional GET are queried
+        with self.assertNumQueries(1):
+            cached_response = self.client.get(url)
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response['Content-Type'], response['Content-Type'])
+        response_cache.invalidate(['study:%s' % self.study.pk])
+        self.client.get(url)
+        stats = response_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 2, 1))
+        self.assertEqual(stats['size'], len(response.content))
+        response_cache.invalidate(['study:%s' % self.study.pk])
+        self.assertEqual(response_cache.get_stats()['size'], 0)
+
+    def test_streaming(self):
+        url = '/rest/phenotype/%s/values.plink' % self.study.phenotype_set.get().pk
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        # the content is stored once it was sent
+        self.assertEqual(response_cache.get_stats()['entries'], 0)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(self.client.get(url).content, content)
+        stats = response_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['entries'], stats['size']), (1, 1, len(content)))
+
+    @override_settings(RESPONSE_CACHE_MAX_ENTRY_SIZE=1)
+    def test_streaming_too_big(self):
+        response = self.client.get('/rest/phenotype/%s/values.plink' % self.study.phenotype_set.get().pk)
+        self.assertTrue(len(b''.join(response.streaming_content)) > 1)
+        self.assertEqual(response_cache.get_stats()['entries'], 0)
+
+    def test_geography(self):
+        url = '/rest/study/%s/geo/' % self.study.pk
+        self.assertEqual(json.loads(self.client.get(url).content.decode('utf-8'))['accession_count'], 0)
+        accession = Accession.objects.create(name='Col-0', species=self.study.species, country='DEU')
+        ObservationUnit.objects.create(accession=accession, study=self.study)
+        pending = len(connection.run_on_commit)
+        geographic_aggregates.update_study(self.study.pk)
+        run_on_commit_callbacks(pending)
+        self.assertEqual(json.loads(self.client.get(url).content.decode('utf-8'))['countries'], [['DEU', 1, None]])
+
+    def test_statistics(self):
+        phenotype = self.study.phenotype_set.get()
+        accession = Accession.objects.create(name='Col-0', species=self.study.species)
+        obs_unit = ObservationUnit.objects.create(accession=accession, study=self.study)
+        url = '/rest/phenotype/%s/chart/' % phenotype.pk
+        self.assertIsNone(json.loads(self.client.get(url).content.decode('utf-8'))['histogram'])
+        PhenotypeValue.objects.create(value=1.5, phenotype=phenotype, obs_unit=obs_unit)
+        pending = len(connection.run_on_commit)
+        phenotype_statistics.update_statistics([phenotype.pk])
+        run_on_commit_callbacks(pending)
+        self.assertEqual(sum(json.loads(self.client.get(url).content.decode('utf-8'))['histogram']['counts']), 1)
+
+    @override_settings(RESPONSE_CACHE_MAX_SIZE=1)
+    def test_eviction(self):
+        self.client.get('/rest/study/%s/phenotypes.csv' % self.study.pk)
+        self.assertEqual(response_cache.get_stats()['entries'], 0)
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class PhenotypeMatrixRendererTest(TestCase):
+    """
+    The study matrix is rendered column-wise with the same bytes as the per-row dicts
+    """
+
+    def setUp(self):
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.study = Study.objects.create(name='flowering study', species=species)
+        names = [u'Col-0', u'Ler, "1"', u'T\xfcb\u2028']
+        obs_units = [ObservationUnit.objects.create(accession=Accession.objects.create(name=name, species=species),
+                                                    study=self.study) for name in names]
+        for i, name in enumerate((u'flowering', u'height \xb5m', u'weight')):
+            phenotype = Phenotype.objects.create(name=name, species=species, study=self.study)
+            for obs_unit in obs_units[i:]:
+                PhenotypeValue.objects.create(phenotype=phenotype, obs_unit=obs_unit, value=0.1 * (i + obs_unit.pk))
+        Submission.objects.create(study=self.study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def test_render_matrix(self):
+        matrix = PhenotypeMatrix(['obs_unit_id', 'accession_id', 'accession_name', u'flowering', u'height \xb5m'],
+                                 [[1, 2, 3], [10, 20, 30], [u'Col-0', u'Ler, "1"', u'T\xfcb\u2028'],
+                                  [0.1, '', 1e-20], [1.0 / 3, 2.0, '']])
+        records = matrix.to_records()
+        self.assertEqual(PhenotypeMatrixRenderer().render(matrix, renderer_context={}),
+                         PhenotypeMatrixRenderer().render(records, renderer_context={}))
+        self.assertEqual(PhenotypeMatrixJSONRenderer().render(matrix), JSONRenderer().render(records))
+        self.assertEqual(PhenotypeMatrixJSONRenderer().render(matrix, 'application/json; indent=4'),
+                         JSONRenderer().render(records, 'application/json; indent=4'))
+        empty = PhenotypeMatrix(['obs_unit_id', 'accession_id', 'accession_name'], [[], [], []])
+        self.assertEqual(PhenotypeMatrixJSONRenderer().render(empty), JSONRenderer().render([]))
+
+    def test_study_matrix(self):
+        content = self.client.get('/rest/study/%s/values.json' % self.study.pk).content
+        records = json.loads(content.decode('utf-8'))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0][u'height \xb5m'], '')
+        self.assertEqual(JSONRenderer().render(records), content)
+        self.assertEqual(self.client.get('/rest/study/%s/values.csv' % self.study.pk).content,
+                         PhenotypeMatrixRenderer().render(records, renderer_context={}))
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class NPZExportTest(TestCase):
+    """
+    The study matrix and the phenotype values can be downloaded as typed numpy arrays
+    """
+
+    def setUp(self):
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.study = Study.objects.create(name='flowering study', species=species)
+        accessions = [Accession.objects.create(name='Col-%s' % i, species=species) for i in range(2)]
+        obs_units = [ObservationUnit.objects.create(accession=accession, study=self.study) for accession in accessions]
+        self.phenotype = Phenotype.objects.create(name='flowering', species=species, study=self.study)
+        other_phenotype = Phenotype.objects.create(name='height', species=species, study=self.study)
+        PhenotypeValue.objects.create(phenotype=self.phenotype, obs_unit=obs_units[0], value=1.5)
+        PhenotypeValue.objects.create(phenotype=self.phenotype, obs_unit=obs_units[1], value=2.5)
+        PhenotypeValue.objects.create(phenotype=other_phenotype, obs_unit=obs_units[1], value=10.0)
+        Submission.objects.create(study=self.study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def load(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return np.load(BytesIO(response.content))
+
+    def test_study_matrix(self):
+        data = self.load('/rest/study/%s/values.npz?dtype=float32' % self.study.pk)
+        self.assertEqual(data['values'].dtype, np.float32)
+        self.assertEqual(list(data['phenotype_name']), ['flowering', 'height'])
+        self.assertEqual(list(data['accession_name']), ['Col-0', 'Col-1'])
+        np.testing.assert_array_equal(data['values'], [[1.5, np.nan], [2.5, 10.0]])
+
+    def test_phenotype_values(self):
+        data = self.load('/rest/phenotype/%s/values.npz' % self.phenotype.pk)
+        self.assertEqual(data['phenotype_value'].dtype, np.float64)
+        np.testing.assert_array_equal(np.sort(data['phenotype_value']), [1.5, 2.5])
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class PLINKExportTest(TestCase):
+    """
+    PLINK files are streamed with the same escaping for single phenotypes and study matrices
+    """
+
+    def setUp(self):
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.study = Study.objects.create(name='flowering study', species=species)
+        self.accessions = [Accession.objects.create(name='Col-%s' % i, species=species) for i in range(2)]
+        self.obs_units = [ObservationUnit.objects.create(accession=accession, study=self.study)
+                          for accession in self.accessions]
+        self.phenotype = Phenotype.objects.create(name='flowering time', species=species, study=self.study)
+        other_phenotype = Phenotype.objects.create(name='plant "height"', species=species, study=self.study)
+        PhenotypeValue.objects.create(phenotype=self.phenotype, obs_unit=self.obs_units[0], value=1.5)
+        PhenotypeValue.objects.create(phenotype=self.phenotype, obs_unit=self.obs_units[1], value=0.1)
+        PhenotypeValue.objects.create(phenotype=other_phenotype, obs_unit=self.obs_units[1], value=10.0)
+        Submission.objects.create(study=self.study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+    def test_phenotype_values(self):
+        lines = self.download('/rest/phenotype/%s/values.plink' % self.phenotype.pk)
+        self.assertEqual(lines[0], 'FID IID flowering_time')
+        self.assertEqual(sorted(lines[1:]), sorted(['%s %s 1.5' % (self.accessions[0].pk, self.accessions[0].pk),
+                                                    '%s %s 0.1' % (self.accessions[1].pk, self.accessions[1].pk)]))
+
+    def test_study_matrix(self):
+        lines = self.download('/rest/study/%s/values.plink' % self.study.pk)
+        self.assertEqual(lines, ['FID IID flowering_time plant_height',
+                                 '%s %s 1.5 NA' % (self.accessions[0].pk, self.obs_units[0].pk),
+                                 '%s %s 0.1 10.0' % (self.accessions[1].pk, self.obs_units[1].pk)])
+        pmatrix, accession_ids, names = parse_plink_file(BytesIO('\n'.join(lines).encode('utf-8')))
+        self.assertEqual(names, ['flowering time', 'plant height'])
+        np.testing.assert_array_equal(pmatrix, [[1.5, np.nan], [0.1, 10.0]])
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class IsaTabExportTest(TestCase):
+    """
+    The ISA-TAB archive is streamed without temporary files
+    """
+
+    def setUp(self):
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.study = Study.objects.create(name='flowering study', species=species)
+        accessions = [Accession.objects.create(name='Col-%s' % i, species=species) for i in range(3)]
+        self.obs_units = [ObservationUnit.objects.create(accession=accession, study=self.study)
+                          for accession in accessions]
+        self.phenotypes = [Phenotype.objects.create(name='flowering', scoring='days\tto flowering', species=species,
+                                                    study=self.study),
+                           Phenotype.objects.create(name='height', scoring='', species=species, study=self.study)]
+        PhenotypeValue.objects.create(phenotype=self.phenotypes[0], obs_unit=self.obs_units[0], value=1.5)
+        PhenotypeValue.objects.create(phenotype=self.phenotypes[0], obs_unit=self.obs_units[1], value=0.1)
+        PhenotypeValue.objects.create(phenotype=self.phenotypes[1], obs_unit=self.obs_units[2], value=10.0)
+        Submission.objects.create(study=self.study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def download(self):
+        response = self.client.get('/rest/study/%s/isatab/' % self.study.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        return archive
+
+    def test_archive(self):
+        archive = self.download()
+        self.assertEqual(archive.namelist(), ['i_investigation.txt', 's_study%s.txt' % self.study.pk,
+                                              'a_study%s.txt' % self.study.pk, 'tdf.txt', 'd_data.txt'])
+        rows = archive.read('d_data.txt').decode('utf-8').split('\r\n')
+        self.assertEqual(rows[0], 'Assay Name\t%s\t%s' % (self.phenotypes[0].pk, self.phenotypes[1].pk))
+        self.assertEqual(rows[1:], ['assay%s\t1.5\t' % self.obs_units[0].pk, 'assay%s\t0.1\t' % self.obs_units[1].pk,
+                                    'assay%s\t\t10.0' % self.obs_units[2].pk, ''])
+        tdf = archive.read('tdf.txt').decode('utf-8')
+        self.assertIn('\t"days\tto flowering"\t', tdf)
+
+    def test_chunks(self):
+        chunk_size = isa_tab.ISATAB_CHUNK_SIZE
+        full = self.download()
+        isa_tab.ISATAB_CHUNK_SIZE = 2
+        try:
+            chunked = self.download()
+        finally:
+            isa_tab.ISATAB_CHUNK_SIZE = chunk_size
+        for name in full.namelist()[1:]:
+            self.assertEqual(full.read(name), chunked.read(name))
+
+
+class IsaTabParseTest(TestCase):
+    """
+    The files of ISA-TAB archives are read without extracting the archive
+    """
+    DERIVED_DATA = b'Assay Name\tflowering\theight\r\nassay1\t1.5\t\r\nassay2\t\t10\r\n'
+
+    def create_zip(self):
+        f = BytesIO()
+        with zipfile.ZipFile(f, 'w') as archive:
+            archive.writestr('study/d_data.txt', self.DERIVED_DATA)
+            archive.writestr('study/i_investigation.txt', b'')
+        f.seek(0)
+        return f
+
+    def create_tar(self):
+        f = BytesIO()
+        with tarfile.open(fileobj=f, mode='w:gz') as archive:
+            info = tarfile.TarInfo('study/d_data.txt')
+            info.size = len(self.DERIVED_DATA)
+            archive.addfile(info, BytesIO(self.DERIVED_DATA))
+        f.seek(0)
+        return f
+
+    def assert_derived_data(self, source):
+        with isa_tab._open_isatab(source) as (members, open_member):
+            self.assertIn('d_data.txt', members)
+            with open_member('d_data.txt') as f:
+                frame = isa_tab._parse_derived_data_file(f)
+        self.assertEqual(list(frame.index), ['assay1', 'assay2'])
+        self.assertEqual(list(frame.columns), ['flowering', 'height'])
+        self.assertEqual(list(frame.dtypes), [np.float64, np.float64])
+        np.testing.assert_array_equal(frame.values, [[1.5, np.nan], [np.nan, 10.0]])
+
+    def test_zip(self):
+        self.assert_derived_data(self.create_zip())
+
+    def test_tar(self):
+        self.assert_derived_data(self.create_tar())
+
+    def test_missing_file(self):
+        with isa_tab._open_isatab(self.create_zip()) as (members, open_member):
+            self.assertRaises(Exception, open_member, 'tdf.txt')
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class OntologyClosureTest(TestCase):
+    """
+    Descendants, ancestors and the phenotypes of a term are retrieved through the closure table
+    """
+
+    def setUp(self):
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        source = OntologySource.objects.create(acronym='PTO', name='Plant Trait Ontology', url='http://example.org/to')
+        self.terms = dict((term_id, OntologyTerm.objects.create(id=term_id, name=term_id, source=source))
+                          for term_id in ('TO:1', 'TO:2', 'TO:3', 'TO:4', 'TO:5'))
+        # TO:1 > TO:2 > TO:3 and TO:1 > TO:3 (shortest path), TO:4 > TO:5
+        self.terms['TO:1'].children.add(self.terms['TO:2'], self.terms['TO:3'])
+        self.terms['TO:2'].children.add(self.terms['TO:3'])
+        self.terms['TO:4'].children.add(self.terms['TO:5'])
+        ontology_closure.rebuild_hierarchy()
+        # the memoized trees are keyed by the closure ids, which are reused after the rollback of a test
+        cache.clear()
+        study = Study.objects.create(name='flowering study', species=species)
+        for term_id in ('TO:2', 'TO:3', 'TO:5'):
+            Phenotype.objects.create(name='phenotype %s' % term_id, species=species, study=study,
+                                     to_term=self.terms[term_id])
+        Submission.objects.create(study=study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def test_closure(self):
+        closure = dict(((ancestor_id, descendant_id), depth) for ancestor_id, descendant_id, depth
+                       in OntologyTermClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        self.assertEqual(closure[('TO:1', 'TO:1')], 0)
+        self.assertEqual(closure[('TO:1', 'TO:3')], 1)
+        self.assertEqual(closure[('TO:2', 'TO:3')], 1)
+        self.assertNotIn(('TO:1', 'TO:5'), closure)
+        self.assertEqual(len(closure), 9)
+
+    def test_descendants_and_ancestors(self):
+        self.assertEqual(sorted(OntologyTerm.objects.descendants_of('TO:1').values_list('pk', flat=True)),
+                         ['TO:1', 'TO:2', 'TO:3'])
+        response = self.client.get('/rest/terms/TO:3/ancestors/')
+        self.assertEqual([term['pk'] for term in response.data], ['TO:1', 'TO:2'])
+        self.assertEqual(self.client.get('/rest/terms/TO:9/descendants/').status_code, 404)
+
+    def test_phenotypes(self):
+        with self.assertNumQueries(2):
+            phenotypes = Phenotype.objects.published().with_ontology_term(self.terms['TO:1'])
+            self.assertEqual(phenotypes.count(), 2)
+            self.assertEqual(sorted(phenotypes.values_list('to_term_id', flat=True)), ['TO:2', 'TO:3'])
+        response = self.client.get('/rest/terms/TO:4/phenotypes/')
+        self.assertEqual([phenotype['to_term'] for phenotype in response.data], ['TO:5'])
+
+    def test_tree(self):
+        self.assertEqual(OntologyTerm.objects.get(pk='TO:1').child_count, 2)
+        with self.assertNumQueries(1):
+            response = self.client.get('/rest/terms/TO:1/')
+        self.assertEqual(response.data, [{'id': 'TO:2', 'text': 'TO:2', 'children': True},
+                                         {'id': 'TO:3', 'text': 'TO:3', 'children': False}])
+        roots = self.client.get('/rest/terms/PTO/').data
+        self.assertEqual([root['id'] for root in roots], ['TO:1', 'TO:4'])
+        tree = ontology_tree.get_tree_to_term(self.terms['TO:5'])
+        self.assertEqual(tree[1], {'id': 'TO:4', 'text': 'TO:4', 'state': {'opened': True},
+                                   'children': [{'id': 'TO:5', 'text': 'TO:5', 'children': False,
+                                                 'state': {'selected': True}}]})
+        # the siblings on the path have their own child counts
+        tree = ontology_tree.get_tree_to_term(self.terms['TO:3'])
+        self.assertEqual(tree[0]['children'][0], {'id': 'TO:2', 'text': 'TO:2', 'children': True})
+        with self.assertNumQueries(1):
+            ontology_tree.get_tree_to_term(self.terms['TO:3'])
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class AccessionSummaryTest(TestCase):
+    """
+    The numbers of phenotypes of the accessions are precomputed from the published studies
+    """
+
+    def setUp(self):
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        source = OntologySource.objects.create(acronym='PTO', name='Plant Trait Ontology', url='http://example.org/to')
+        term = OntologyTerm.objects.create(id='TO:1', name='flowering time', source=source)
+        self.accession = Accession.objects.create(name='Col-0', species=species)
+        Accession.objects.create(name='Ler-1', species=species)
+        self.studies = []
+        for name in ('study 1', 'study 2'):
+            study = Study.objects.create(name=name, species=species)
+            obs_unit = ObservationUnit.objects.create(accession=self.accession, study=study)
+            for phenotype_name in ('flowering time', 'leaf number'):
+                phenotype = Phenotype.objects.create(name=phenotype_name, species=species, study=study,
+                                                     to_term=term if phenotype_name == 'flowering time' else None)
+                PhenotypeValue.objects.create(value=1.0, phenotype=phenotype, obs_unit=obs_unit)
+            self.studies.append(study)
+        Submission.objects.create(study=self.studies[0], status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+        Submission.objects.create(study=self.studies[1], firstname='John', lastname='Doe', email='john.doe@example.org')
+        # the receivers update the summaries on commit, which never happens in a TestCase
+        accession_summary.rebuild_summaries()
+
+    def test_summary(self):
+        self.assertEqual(self.accession.summary.phenotype_count, 2)
+        self.assertEqual(self.accession.summary.study_count, 1)
+        self.assertEqual(Accession.objects.get(name='Ler-1').count_phenotypes, 0)
+        response = self.client.get('/accession/%s/' % self.accession.pk)
+        self.assertEqual(response.context['phenotype_count'], 2)
+        self.assertEqual(list(response.context['to_data']), [{'to_term__name': 'flowering time', 'count': 1}])
+
+    def test_publish(self):
+        submission = self.studies[1].submission
+        submission.status = PUBLISHED
+        submission.save()
+        accession_summary.update_summaries(accession_summary.get_study_accession_ids(self.studies[1].pk))
+        summary = Accession.objects.select_related('summary').get(pk=self.accession.pk).summary
+        self.assertEqual((summary.phenotype_count, summary.study_count), (4, 2))
+        self.assertEqual(self.accession.term_summaries.get(field='to_term').phenotype_count, 2)
+
+    def test_phenotype_table(self):
+        phenotype = Phenotype.objects.get(study=self.studies[0], name='flowering time')
+        obs_unit = ObservationUnit.objects.create(accession=self.accession, study=self.studies[0])
+        PhenotypeValue.objects.create(value=3.0, phenotype=phenotype, obs_unit=obs_unit)
+        with self.assertNumQueries(1):
+            phenotypes = list(Phenotype.objects.published().with_accession_values(self.accession.pk).order_by('-value_mean'))
+        self.assertEqual([p.pk for p in phenotypes], [phenotype.pk, phenotype.pk + 1])
+        self.assertEqual((phenotypes[0].value_mean, phenotypes[0].value_count), (2.0, 2))
+        self.assertEqual((phenotypes[0].value_min, phenotypes[0].value_max), (1.0, 3.0))
+        table = AccessionPhenotypeTable(phenotypes)
+        self.assertEqual(table.rows[0].get_cell('sd'), str(np.sqrt(2.0)))
+        self.assertEqual(table.rows[1].get_cell('sd'), 'N/A')
+
+    def test_study_counts(self):
+        study = Study.objects.with_counts().get(pk=self.studies[0].pk)
+        self.assertEqual((study.phenotype_count, study.obs_unit_count, study.value_count, study.accession_count),
+                         (2, 1, 2, 1))
+        with self.assertNumQueries(1):
+            data = StudyListSerializer(Study.objects.published().with_counts(), many=True).data
+        self.assertEqual(data, [{'name': 'study 1', 'description': None, 'phenotype_count': 2,
+                                 'obs_unit_count': 1, 'value_count': 2, 'accession_count': 1}])
+        self.assertEqual(self.client.get('/rest/study/list/').data, data)
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class PhenotypeStatisticsTest(TestCase):
+    """
+    The summary statistics of the phenotypes are precomputed for all phenotypes of a study at once
+    """
+
+    def setUp(self):
+        species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        study = Study.objects.create(name='flowering study', species=species)
+        self.phenotype = Phenotype.objects.create(name='flowering time', species=species, study=study)
+        self.constant = Phenotype.objects.create(name='leaf number', species=species, study=study)
+        for i, value in enumerate([1.0, 2.0, 2.0, 4.0, 8.0]):
+            accession = Accession.objects.create(name='accession %s' % i, species=species,
+                                                 country='SWE' if i % 2 else 'DEU')
+            obs_unit = ObservationUnit.objects.create(accession=accession, study=study)
+            PhenotypeValue.objects.create(value=value, phenotype=self.phenotype, obs_unit=obs_unit)
+            if i < 2:
+                PhenotypeValue.objects.create(value=3.0, phenotype=self.constant, obs_unit=obs_unit)
+        Submission.objects.create(study=study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+
+    def test_statistics(self):
+        phenotype_statistics.update_statistics([self.phenotype.pk, self.constant.pk])
+        values = [1.0, 2.0, 2.0, 4.0, 8.0]
+        statistics = self.phenotype.statistics
+        self.assertEqual((statistics.value_count, statistics.accession_count), (5, 5))
+        self.assertAlmostEqual(statistics.sd, np.std(values, ddof=1))
+        self.assertEqual((statistics.min, statistics.q1, statistics.median, statistics.q3, statistics.max),
+                         (1.0, 2.0, 2.0, 4.0, 8.0))
+        self.assertEqual(sum(statistics.get_histogram()['counts']), 5)
+        phenotype = Phenotype.objects.get(pk=self.phenotype.pk)
+        self.assertAlmostEqual(phenotype.shapiro_p_value, shapiro(values)[1])
+        constant = Phenotype.objects.get(pk=self.constant.pk)
+        self.assertEqual((constant.statistics.mean, constant.statistics.sd), (3.0, 0.0))
+        self.assertIsNone(constant.statistics.skewness)
+        self.assertIsNone(constant.shapiro_p_value)
+
+    def test_endpoint(self):
+        # missing statistics are computed on the first request
+        response = self.client.get('/rest/phenotype/%s/stats/' % self.phenotype.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['mean'], 3.4)
+        self.assertEqual(response.data['histogram']['edges'][0], 1.0)
+        self.assertTrue(PhenotypeStatistics.objects.filter(phenotype=self.phenotype).exists())
+        self.assertEqual(self.client.get('/rest/phenotype/999999/stats/').status_code, 404)
+
+    def test_chart_data(self):
+        accession = Accession.objects.get(name='accession 0')
+        obs_unit = ObservationUnit.objects.create(accession=accession, study=self.phenotype.study)
+        url = '/rest/phenotype/%s/chart/' % self.phenotype.pk
+        # the statistics are only read, they are computed by the receivers
+        self.assertIsNone(json.loads(self.client.get(url).content.decode('utf-8'))['histogram'])
+        self.assertFalse(PhenotypeStatistics.objects.filter(phenotype=self.phenotype).exists())
+        PhenotypeValue.objects.create(value=3.0, phenotype=self.phenotype, obs_unit=obs_unit)
+        # the phenotype is added to the update that was scheduled by the values of setUp
+        run_on_commit_callbacks()
+        data = json.loads(self.client.get(url).content.decode('utf-8'))
+        self.assertEqual(data['countries'], [['DEU', 3], ['SWE', 2]])
+        self.assertEqual(data['accessions'][0], [accession.pk, 'accession 0', None, None, 'DEU', 2.0, 2])
+        self.assertEqual(len(data['accessions']), 5)
+        self.assertEqual(sum(data['histogram']['counts']), 6)
+
+    def test_geography(self):
+        Accession.objects.filter(name='accession 0').update(latitude=52.5, longitude=13.4)
+        Accession.objects.filter(name='accession 1').update(latitude=59.3, longitude=18.1)
+        # missing aggregates are computed on the first request
+        data = self.client.get('/rest/phenotype/%s/geo/' % self.phenotype.pk).data
+        self.assertEqual((data['accession_count'], data['value_mean']), (5, 3.4))
+        self.assertEqual([country[:2] for country in data['countries']], [['DEU', 3], ['SWE', 2]])
+        self.assertAlmostEqual(data['countries'][0][2], 11.0 / 3)
+        self.assertEqual(data['grid'], [[50.0, 10.0, 1, 1.0], [55.0, 15.0, 1, 2.0]])
+        data = self.client.get('/rest/study/%s/geo/' % self.phenotype.study_id).data
+        self.assertEqual(data['countries'], [['DEU', 3, None], ['SWE', 2, None]])
+        self.assertEqual(len(data['grid']), 2)
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+@override_settings(RESPONSE_CACHE_PATH=None)
+class CorrelationTest(TestCase):
+    """
+    Pairwise-complete correlations match scipy on the accessions that have values for both phenotypes
+    """
+
+    def setUp(self):
+        self.species = Species.objects.create(ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.accessions = [Accession.objects.create(name='Col-%s' % i, species=self.species) for i in range(6)]
+
+    def assertCorrelations(self, matrix, pearson, spearman, overlap):
+        for i in range(matrix.shape[1]):
+            for j in range(matrix.shape[1]):
+                rows = ~np.isnan(matrix[:, i]) & ~np.isnan(matrix[:, j])
+                self.assertEqual(overlap[i, j], rows.sum())
+                self.assertAlmostEqual(pearson[i, j], pearsonr(matrix[rows, i], matrix[rows, j])[0])
+                self.assertAlmostEqual(spearman[i, j], spearmanr(matrix[rows, i], matrix[rows, j])[0])
+
+    def create_phenotype(self, study, name, values):
+        # values are (accession index, value), an accession can have replicates
+        phenotype = Phenotype.objects.create(name=name, species=self.species, study=study)
+        obs_units = {}
+        for i, value in values:
+            if i not in obs_units:
+                obs_units[i] = ObservationUnit.objects.create(accession=self.accessions[i], study=study)
+            PhenotypeValue.objects.create(phenotype=phenotype, obs_unit=obs_units[i], value=value)
+        return phenotype
+
+    def test_pairwise_complete_correlations(self):
+        matrix = np.random.RandomState(0).randint(0, 10, size=(40, 4)).astype(np.float64)
+        matrix[np.random.RandomState(1).rand(40, 4) < 0.3] = np.nan
+        pearson, spearman, overlap = correlation.pairwise_complete_correlations(matrix)
+        self.assertCorrelations(matrix, pearson, spearman, overlap)
+        # the selected columns against all columns
+        pearson, spearman, overlap = correlation.pairwise_complete_correlations(matrix, [2, 3])
+        np.testing.assert_allclose(pearson, correlation.pairwise_complete_correlations(matrix)[0][[2, 3]])
+        np.testing.assert_allclose(spearman, correlation.pairwise_complete_correlations(matrix)[1][[2, 3]])
+
+    def test_too_small_overlap(self):
+        matrix = np.array([[1.0, np.nan, 1.0], [2.0, 3.0, 1.0], [3.0, np.nan, 1.0]])
+        pearson, spearman, overlap = correlation.pairwise_complete_correlations(matrix)
+        self.assertEqual(overlap[0, 1], 1)
+        # less than 2 overlapping values or no variance
+        self.assertTrue(np.isnan(pearson[0, 1]) and np.isnan(spearman[0, 1]))
+        self.assertTrue(np.isnan(pearson[0, 2]) and np.isnan(spearman[0, 2]))
+
+    def test_endpoint(self):
+        study = Study.objects.create(name='flowering study', species=self.species)
+        # the replicates of accession 0 are averaged, accession 5 only has a value for flowering
+        flowering = self.create_phenotype(study, 'flowering', [(0, 1.0), (0, 3.0), (1, 5.0), (2, 4.0), (3, 8.0), (5, 1.0)])
+        height = self.create_phenotype(study, 'height', [(0, 1.0), (1, 2.0), (2, 7.0), (3, 3.0), (4, 9.0)])
+        Submission.objects.create(study=study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+        data = self.client.get('/rest/correlation/%s,%s/' % (flowering.pk, height.pk)).data
+        means = np.array([[2.0, 1.0], [5.0, 2.0], [4.0, 7.0], [8.0, 3.0], [np.nan, 9.0], [1.0, np.nan]])
+        pearson, spearman, overlap = correlation.pairwise_complete_correlations(means)
+        self.assertCorrelations(means, pearson, spearman, overlap)
+        self.assertAlmostEqual(data['corr_mat'][0][1], pearson[0, 1])
+        self.assertAlmostEqual(data['spear_mat'][0][1], spearman[0, 1])
+        self.assertEqual([data['sample_data'][0][key] for key in ('A', 'B', 'C')], [5, 5, 4])
+        self.assertEqual(dict(zip(data['scatter_data'][0]['samples'], data['scatter_data'][0]['values']))[self.accessions[0].pk], 2.0)
+
+    def publish_study(self, name, phenotypes):
+        study = Study.objects.create(name=name, species=self.species)
+        phenotypes = [self.create_phenotype(study, phenotype_name, values) for phenotype_name, values in phenotypes]
+        Submission.objects.create(study=study, status=PUBLISHED, firstname='John', lastname='Doe',
+                                  email='john.doe@example.org')
+        return phenotypes
+
+    def assertStoredCorrelations(self, phenotypes):
+        pks = [phenotype.pk for phenotype in phenotypes]
+        stored = correlation.get_stored_correlations(pks)
+        self.assertIsNotNone(stored)
+        expected = correlation.pairwise_complete_correlations(correlation.load_phenotype_matrix(pks).values)
+        for stored_matrix, expected_matrix in zip(stored, expected):
+            np.testing.assert_allclose(stored_matrix, expected_matrix)
+
+    def test_correlation_store(self):
+        phenotypes = self.publish_study('study 1', [('flowering', [(0, 1.0), (0, 3.0), (1, 5.0), (2, 4.0), (3, 8.0)]),
+                                                    ('height', [(0, 1.0), (1, 2.0), (2, 7.0), (4, 9.0)])])
+        # the correlations are computed by the submission worker, not when the study is published
+        self.assertIsNone(correlation.get_stored_correlations([phenotype.pk for phenotype in phenotypes]))
+        run_worker(once=True)
+        self.assertStoredCorrelations(phenotypes)
+        # only the phenotypes of the new study are computed, with the values of its accessions
+        phenotypes += self.publish_study('study 2', [('leaf', [(1, 2.0), (2, 1.0), (3, 6.0), (5, 3.0)]),
+                                                     ('empty', [])])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(correlation.update_missing_correlations(), 1)
+        accession_filter = 'FROM "phenotypedb_observationunit" U0 WHERE U0."study_id" = %s' % phenotypes[2].study_id
+        self.assertTrue(any(accession_filter in query['sql'] for query in queries.captured_queries))
+        self.assertStoredCorrelations(phenotypes)
+        self.assertEqual(correlation.update_missing_correlations(), 0)
+
+
+class SavePlinkTest(TestCase):
+    """
+    PLINK submissions are saved with bulk inserts
+    """
+
+    def setUp(self):
+        species = Species.objects.create(pk=1, ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.accessions = [Accession.objects.create(name='Col-%s' % i, species=species) for i in range(3)]
+
+    def test_save_plink(self):
+        accession_ids = np.array([str(accession.pk) for accession in self.accessions])
+        pmatrix = np.array([[1.0, np.nan], [2.0, 3.0], [np.nan, 4.0]])
+        study = save_plink([pmatrix, accession_ids, ['flowering', 'height']], 'plink study')
+        self.assertEqual(study.observationunit_set.count(), 3)
+        values = PhenotypeValue.objects.filter(phenotype__study=study)
+        self.assertEqual(sorted(values.values_list('obs_unit__accession_id', 'phenotype__name', 'value')),
+                         sorted([(self.accessions[0].pk, 'flowering', 1.0), (self.accessions[1].pk, 'flowering', 2.0),
+                                 (self.accessions[1].pk, 'height', 3.0), (self.accessions[2].pk, 'height', 4.0)]))
+
+    def test_unknown_accessions(self):
+        accession_ids = np.array([str(self.accessions[0].pk), '999998', '999999'])
+        with self.assertRaises(Accession.DoesNotExist) as context:
+            save_plink([np.ones((3, 1)), accession_ids, ['flowering']], 'plink study')
+        self.assertEqual(context.exception.args[-1], '999998, 999999')
+        self.assertFalse(Study.objects.filter(name='plink study').exists())
+
+
+class IsaTabNode(object):
+    """
+    Stands in for the nodes and metadata objects of a parsed ISA-TAB archive
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class SaveIsaTabTest(TestCase):
+    """
+    ISA-TAB submissions are saved with prefetched lookups and bulk inserts
+    """
+
+    def setUp(self):
+        species = Species.objects.create(pk=1, ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        source = OntologySource.objects.create(pk=1, acronym='TO', name='Trait Ontology', url='http://example.org/to')
+        OntologyTerm.objects.create(id='TO:0000344', name='flowering time', source=source)
+        self.accessions = [Accession.objects.create(name='Col-%s' % i, species=species) for i in range(4)]
+
+    def create_isatab(self, accession_ids, to_term='TO:0000344'):
+        """
+        Returns a parsed ISA-TAB study with a sample per accession and the traits flowering (1) and height (2)
+        """
+        samples = dict(('sample-%s' % i, IsaTabNode(metadata={'Characteristics[Infraspecific name]': [
+            IsaTabNode(Term_Accession_Number=str(accession_id))]})) for i, accession_id in enumerate(accession_ids))
+        nodes = dict(samples, **{'source-0': IsaTabNode(metadata={})})
+        assay_nodes = dict(('sample-%s' % i, IsaTabNode(metadata={
+            'Derived Data File': ['d_data.txt'],
+            'Parameter Value[Trait Definition File]': [IsaTabNode(Trait_Definition_File='tdf.txt')],
+            'Assay Name': [IsaTabNode(Assay_Name='assay%s' % i)]})) for i in range(len(accession_ids)))
+        # flowering is missing for the odd and height for the even samples
+        values = [[float(i) if i % 2 == 0 else np.nan, float(i) if i % 2 == 1 else np.nan] for i in range(len(accession_ids))]
+        frame = pd.DataFrame(values, columns=['1', '2'], index=['assay%s' % i for i in range(len(accession_ids))])
+        study = IsaTabNode(metadata={'Study Title': 'isatab study'}, design_descriptors=[], publications=[], nodes=nodes,
+                           trait_def_map={'tdf.txt': {'1': {'Trait': 'flowering', 'Method': 'days', 'TO': to_term,
+                                                            'EO': None, 'UO': None},
+                                                      '2': {'Trait': 'height', 'Method': 'cm', 'TO': None,
+                                                            'EO': None, 'UO': None}}},
+                           assays=[IsaTabNode(metadata={'Study Assay Measurement Type Term Accession Number': '23'},
+                                              nodes=assay_nodes)],
+                           derived_data_map={'d_data.txt': frame})
+        return IsaTabNode(studies=[study], publications=[])
+
+    def test_save_isatab(self):
+        accession_ids = [accession.pk for accession in self.accessions[:2]]
+        study = save_isatab(self.create_isatab(accession_ids))[0]
+        self.assertEqual(study.name, 'isatab study')
+        self.assertEqual(sorted(study.observationunit_set.values_list('accession_id', flat=True)), accession_ids)
+        self.assertEqual(dict(study.phenotype_set.values_list('name', 'to_term_id')),
+                         {'flowering': 'TO:0000344', 'height': None})
+        values = PhenotypeValue.objects.filter(phenotype__study=study)
+        self.assertEqual(sorted(values.values_list('obs_unit__accession_id', 'phenotype__name', 'value')),
+                         [(accession_ids[0], 'flowering', 0.0), (accession_ids[1], 'height', 1.0)])
+
+    def test_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            save_isatab(self.create_isatab([accession.pk for accession in self.accessions[:2]]))
+        with self.assertNumQueries(len(queries)):
+            save_isatab(self.create_isatab([accession.pk for accession in self.accessions]))
+
+    def test_unknown_accessions(self):
+        with self.assertRaises(Accession.DoesNotExist) as context:
+            save_isatab(self.create_isatab([self.accessions[0].pk, 999998, 999999]))
+        self.assertEqual(context.exception.args[-1], '999998, 999999')
+        self.assertFalse(Study.objects.exists())
+
+    def test_unknown_ontology_term(self):
+        # unknown ontology ids are saved as phenotypes without a term
+        study = save_isatab(self.create_isatab([self.accessions[0].pk], to_term='TO:9999999'))[0]
+        self.assertIsNone(study.phenotype_set.get(name='flowering').to_term)
+
+
+class ParsePlinkFileTest(TestCase):
+    """
+    PLINK files are parsed into a float64 matrix independent of the delimiter
+    """
+
+    def test_delimiters(self):
+        for delimiter in (' ', '\t', ','):
+            content = delimiter.join(['FID', 'IID', 'flowering_time', 'height']) + '\n'
+            content += delimiter.join(['6909', '6909', '1.5', '']) + '\n'
+            content += delimiter.join(['6910', '6910', '', '3']) + '\n'
+            pmatrix, accession_ids, names = parse_plink_file(BytesIO(content.encode('utf-8')), chunksize=1)
+            self.assertEqual(pmatrix.dtype, np.float64)
+            self.assertEqual(list(accession_ids), ['6909', '6910'])
+            self.assertEqual(names, ['flowering time', 'height'])
+            np.testing.assert_array_equal(pmatrix, [[1.5, np.nan], [np.nan, 3.0]])
+
+
+@override_settings(RESPONSE_CACHE_PATH=None)
+class SubmissionQueueTest(TestCase):
+    """
+    Uploads are accepted immediately and imported by the worker
+    """
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.settings = override_settings(SUBMISSION_UPLOAD_DIR=self.upload_dir)
+        self.settings.enable()
+        species = Species.objects.create(pk=1, ncbi_id=3702, genus='Arabidopsis', species='thaliana')
+        self.accession = Accession.objects.create(name='Col-0', species=species)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.upload_dir)
+
+    def submit(self, content):
+        upload = SimpleUploadedFile('flowering.csv', content.encode('utf-8'))
+        response = self.client.post('/rest/submission/', {'firstname': 'John', 'lastname': 'Doe',
+                                                          'email': 'john.doe@example.org', 'file': upload})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'Queued')
+        run_worker(once=True)
+        return self.client.get('/rest/submission/%s/' % response.data['pk'])
+
+    def test_import(self):
+        response = self.submit('FID IID flowering_time\n%s %s 1.5\n' % (self.accession.pk, self.accession.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['study']['name'], 'flowering')
+        self.assertEqual(SubmissionJob.objects.get().status, JOB_FINISHED)
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_unknown_accession(self):
+        response = self.submit('FID IID flowering_time\n999999 999999 1.5\n')
+        self.assertEqual(response.data['status'], 'Failed')
+        self.assertEqual(response.data['message'], 'Unknown accession with ID: 999999')
+        self.assertFalse(Study.objects.exists())
+
+    def test_stale_job(self):
+        path = os.path.join(self.upload_dir, 'stale.csv')
+        open(path, 'w').close()
+        stale = SubmissionJob.objects.create(firstname='John', lastname='Doe', email='john.doe@example.org',
+                                             filename='stale.csv', path=path, status=JOB_RUNNING,
+                                             start_date=timezone.now() - timedelta(days=1))
+        running = SubmissionJob.objects.create(firstname='John', lastname='Doe', email='john.doe@example.org',
+                                               filename='running.csv', path=os.path.join(self.upload_dir, 'running.csv'),
+                                               status=JOB_RUNNING,
+                                               start_date=timezone.now())
+        self.assertIsNone(claim_next_job())
+        stale.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual(stale.status, JOB_FAILED)
+        self.assertIsNotNone(stale.end_date)
+        self.assertEqual(running.status, JOB_RUNNING)
+        self.assertFalse(os.path.exists(path))
@@ -1,8 +1,6 @@
 """
 View definitions for AraPheno
 """
-from django.conf import settings
-from django.core.mail import EmailMessage
 from django.core.urlresolvers import reverse, reverse_lazy
 from django.db.models import Count
 from django.http import HttpResponseRedirect
@@ -14,11 +12,13 @@ from django_tables2 import RequestConfig
 from phenotypedb.forms import (CorrelationWizardForm, PhenotypeUpdateForm,
                                StudyUpdateForm, UploadFileForm)
 from phenotypedb.models import (Accession, OntologyTerm, Phenotype, Study,
-                                Submission, OntologySource)
+                                Submission, SubmissionJob, OntologySource, JOB_FINISHED)
+from phenotypedb.pagination import KeysetRequestConfig
 from phenotypedb.tables import (AccessionTable, CurationPhenotypeTable,
                                 PhenotypeTable, ReducedPhenotypeTable,
                                 StudyTable, AccessionPhenotypeTable)
-from scipy.stats import shapiro
+from utils import ontology_tree
+from utils.accession_summary import TERM_FIELDS
 import json, itertools
 
 
@@ -29,7 +29,7 @@ def list_phenotypes(request):
     Displays table of all published phenotypes
     """
     table = PhenotypeTable(Phenotype.objects.published(), order_by="-name")
-    RequestConfig(request, paginate={"per_page":20}).configure(table)
+    KeysetRequestConfig(request, paginate={"per_page":20}).configure(table)
     return render(request, 'phenotypedb/phenotype_list.html', {"phenotype_table":table})
 
 
@@ -41,18 +41,17 @@ class PhenotypeDetail(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super(PhenotypeDetail, self).get_context_data(**kwargs)
-        context['pheno_acc_infos'] = self.object.phenotypevalue_set.select_related('obs_unit__accession')
-        context['geo_chart_data'] = Accession.objects.filter(observationunit__phenotypevalue__phenotype_id=1).values('country').annotate(count=Count('country'))
-        context['values'] = self.object.phenotypevalue_set.all().values_list("value", flat=True)
-        context['shapiro'] = "%.2e"%shapiro(context['values'])[1]
+        # the chart data is loaded from rest.phenotype_chart_data, the test is precomputed by utils.phenotype_statistics
+        p_value = self.object.shapiro_p_value
+        context['shapiro'] = "-" if p_value is None else "%.2e" % p_value
         return context
 
 def list_studies(request):
     """
     Displays table of all published studies
     """
-    table = StudyTable(Study.objects.published(), order_by="-name")
-    RequestConfig(request, paginate={"per_page":20}).configure(table)
+    table = StudyTable(Study.objects.published().with_counts(), order_by="-name")
+    KeysetRequestConfig(request, paginate={"per_page":20}).configure(table)
     return render(request, 'phenotypedb/study_list.html', {"study_table":table})
 
 
@@ -92,8 +91,8 @@ def list_accessions(request):
     """
     Displays table with all accessions
     """
-    table = AccessionTable(Accession.objects.all(), order_by="-name")
-    RequestConfig(request, paginate={"per_page":20}).configure(table)
+    table = AccessionTable(Accession.objects.select_related('summary'), order_by="-name")
+    KeysetRequestConfig(request, paginate={"per_page":20}).configure(table)
     return render(request, 'phenotypedb/accession_list.html', {"accession_table":table})
 
 
@@ -101,56 +100,37 @@ def detail_accession(request, pk=None):
     """
     Detailed view of a single accession
     """
-    accession = Accession.objects.get(id=pk)
-    phenotype_table = AccessionPhenotypeTable(pk,Phenotype.objects.published().filter(phenotypevalue__obs_unit__accession_id=pk), order_by="-id")
+    accession = Accession.objects.select_related('summary').get(id=pk)
+    phenotypes = Phenotype.objects.published().with_accession_values(pk).select_related('study', 'to_term', 'eo_term', 'uo_term')
+    phenotype_table = AccessionPhenotypeTable(phenotypes, order_by="-id")
     RequestConfig(request, paginate={"per_page":20}).configure(phenotype_table)
     variable_dict = {}
     variable_dict["phenotype_table"] = phenotype_table
     variable_dict["object"] = accession
-    phenotypes = Phenotype.objects.published().filter(phenotypevalue__obs_unit__accession_id=pk)
-    variable_dict['phenotype_count'] = phenotypes.count()
-    variable_dict['to_data'] = phenotypes.values('to_term__name').annotate(count=Count('to_term__name'))
-    variable_dict['eo_data'] = phenotypes.values('eo_term__name').annotate(count=Count('eo_term__name'))
-    variable_dict['uo_data'] = phenotypes.values('uo_term__name').annotate(count=Count('uo_term__name'))
+    summary = accession.get_summary()
+    variable_dict['phenotype_count'] = summary.phenotype_count
+    variable_dict['study_count'] = summary.study_count
+    term_data = dict((field, []) for field in TERM_FIELDS)
+    for field, name, count in accession.term_summaries.order_by('term__name').values_list('field', 'term__name', 'phenotype_count'):
+        term_data[field].append({'%s__name' % field: name, 'count': count})
+    variable_dict['to_data'] = term_data['to_term']
+    variable_dict['eo_data'] = term_data['eo_term']
+    variable_dict['uo_data'] = term_data['uo_term']
     return render(request, 'phenotypedb/accession_detail.html', variable_dict)
 
 
-def _get_ontology_terms(term,ids = None):
-    if not ids:
-        ids = [term.id]
-    for t in term.children.all():
-        ids.append(t.id)
-        _get_ontology_terms(t,ids)
-    return ids
-
-def _get_db_field_from_source(source):
-    if source.acronym == 'PECO':
-        return 'eo_term'
-    elif source.acronym == 'PTO':
-        return 'to_term'
-    elif source.acronym == 'UO':
-        return 'uo_term'
-    else:
-        raise Exception('term %s unknown' % source.acronym)
-
-
 def detail_ontology_term(request,pk=None):
     """
     Detailed view of Ontology
     """
     variable_dict = {}
-    phenotypes = []
+    phenotypes = Phenotype.objects.none()
     if pk is not None:
-        term = OntologyTerm.objects.get(pk=pk)
+        term = OntologyTerm.objects.select_related('source').get(pk=pk)
         variable_dict["object"] = term
-        db_field = _get_db_field_from_source(term.source) + '_id__in'
-        ids = _get_ontology_terms(term)
-        #necessary because sqlite has a limit of 999 SQL variables
-        ids = [ ids[i:i+500] for i in range(0, len(ids), 500) ]
-        for sub in ids:
-            kwargs = {db_field:sub}
-            phenotypes.extend(Phenotype.objects.published().filter(**kwargs))
-    variable_dict['phenotype_count'] = len(phenotypes)
+        # the term and all its descendants are joined through the closure table
+        phenotypes = Phenotype.objects.published().with_ontology_term(term).select_related('study', 'to_term', 'eo_term', 'uo_term')
+    variable_dict['phenotype_count'] = phenotypes.count()
     phenotype_table = PhenotypeTable(phenotypes, order_by="-name")
     RequestConfig(request, paginate={"per_page":20}).configure(phenotype_table)
     variable_dict["phenotype_table"] = phenotype_table
@@ -171,43 +151,15 @@ def detail_ontology_source(request,acronym,term_id=None):
     variable_dict = {}
     source = OntologySource.objects.get(acronym=acronym)
     variable_dict['object']  = source
-    root_nodes = source.ontologyterm_set.filter(parents=None)
-    tree = None
     if term_id is not None:
-        tree = []
         term = OntologyTerm.objects.get(pk=term_id)
-        tree = _get_tree_to_root(term,root_nodes)
+        tree = ontology_tree.get_tree_to_term(term)
     else:
-        tree = [{'id':term.pk,'text':term.name,'children':True if term.children.count() > 0 else False} for term in root_nodes]
+        tree = ontology_tree.get_root_nodes(source.pk)
     variable_dict['tree'] = json.dumps(tree)
     return render(request, 'phenotypedb/ontologysource_detail.html', variable_dict)
 
 
-def _get_tree_to_root(term,root_nodes):
-    tree = []
-    term_obj = {'id':term.id,'text':term.name,'state':{'selected':True},'children':True if term.children.count() > 0 else False}
-    parents = term.parents.all()
-
-    while len(parents) > 0:
-        parent = parents[0]
-        p_obj = {'id':parent.id,'text':parent.name,'children': [term_obj],'state':{'opened':True}}
-        for t in parent.children.all():
-            if t.id != term_obj['id']:
-                p_obj['children'].append({'id':t.id,'text':t.name,'children':True if term.children.count() > 0 else False})
-        parents = parent.parents.all()
-        term = parent
-        term_obj = p_obj
-
-    for t in root_nodes:
-        if t.id == term.id:
-            tree.append(term_obj)
-        else:
-            tree.append({'id':t.id,'text':t.name,'children':True if t.children.count() > 0 else False})
-    return tree
-
-
-
-
 class SubmissionStudyDeleteView(DeleteView):
     """
     Confirm view for deleting a submission
@@ -246,6 +198,13 @@ class SubmissionStudyResult(UpdateView):
     def get_object(self, queryset=None):
         return Study.objects.in_submission().get(submission__id=self.kwargs[self.pk_url_kwarg])
 
+    def get(self, request, *args, **kwargs):
+        # the study of a queued submission is not imported yet
+        job = SubmissionJob.objects.exclude(status=JOB_FINISHED).filter(pk=self.kwargs[self.pk_url_kwarg]).first()
+        if job is not None:
+            return render(request, 'phenotypedb/submission_job.html', {'job': job})
+        return super(SubmissionStudyResult, self).get(request, *args, **kwargs)
+
 
 class SubmissionPhenotypeResult(UpdateView):
     """
@@ -279,19 +238,8 @@ def upload_file(request):
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
             try:
-                submission = form.save()
-                email = EmailMessage(
-                    'Study submitted to AraPheno',
-                    submission.get_email_text(),
-                    'uemit.seren@gmi.oeaw.ac.at',
-                    [submission.email],
-                    [settings.ADMINS[0][1]],
-                    reply_to=['uemit.seren@gmi.oeaw.ac.at']
-                )
-                email.send(True)
-                return HttpResponseRedirect('/submission/%s/' % submission.id)
-            except Accession.DoesNotExist as err:
-                form.add_error(None, 'Unknown accession with ID: %s' % err.args[-1])
+                job = form.save()
+                return HttpResponseRedirect('/submission/%s/' % job.id)
             except Exception as err:
                 form.add_error(None, str(err))
     else:
@@ -2,9 +2,7 @@
 Some general IO related functions
 """
 import os
-import tempfile
 import uuid
-import zipfile
 import numpy as np
 
 from django.db import transaction
@@ -14,11 +12,16 @@ from utils.data_io import parse_plink_file
 from utils.isa_tab import parse_isatab, save_isatab
 
 
-def import_study(fhandle):
+def import_study(fhandle, filename=None):
     """
     Imports a study into the database using a file handle or filename
+    The study name and the format are taken from filename (default: the name of the file handle)
     """
-    name, extension = os.path.splitext(fhandle.name)
+    filename = filename or fhandle.name
+    if filename.endswith('.tar.gz'):
+        name, extension = filename[:-len('.tar.gz')], '.tar.gz'
+    else:
+        name, extension = os.path.splitext(filename)
     if extension in ('.zip', '.tar.gz'):
         study = import_isatab(fhandle)
     elif extension in ('.plink', '.csv'):
@@ -32,13 +35,9 @@ def import_study(fhandle):
 
 def import_isatab(fhandle):
     """
-    Imports an ISA-TAB archive into the database using a file handle or filename
+    Imports an ISA-TAB archive (zip or tar.gz) into the database using a file handle or filename
     """
-    work_dir = tempfile.mkdtemp()
-    # unzip to temporary folder
-    with zipfile.ZipFile(fhandle, "r") as zhandle:
-        zhandle.extractall(work_dir)
-    isatab = parse_isatab(work_dir)
+    isatab = parse_isatab(fhandle)
     if len(isatab.studies) > 1:
         raise Exception('Only 1 study per submission supported. ISA-TAB archive contains %s studies' % len(isatab.studies))
     studies = save_isatab(isatab)
@@ -59,24 +58,48 @@ def save_plink(plink_data, name):
     """
     # TODO don't harcode species
     pmatrix, accession_ids, names = plink_data
+    accession_pks = _get_accession_pks(accession_ids)
     study = Study(name=name, species=Species.objects.get(pk=1))
     study.save()
-    phenotypes = []
+    phenotype_ids = []
     for name in names:
         phenotype = Phenotype(name=name, scoring='', study=study, species=study.species)
         phenotype.save()
-        phenotypes.append(phenotype)
+        phenotype_ids.append(phenotype.id)
 
-    for acc_ix, accession_id in enumerate(accession_ids):
-        try:
-            obs_unit = ObservationUnit(study=study, accession=Accession.objects.get(pk=accession_id))
-        except Accession.DoesNotExist as err:
-            err.args += (accession_id,)
-            raise err
-        obs_unit.save()
-        for i, name in enumerate(names):
-            value = pmatrix[acc_ix][i]
-            if not np.isnan(value):
-                phenotype_value = PhenotypeValue(value=value, phenotype=phenotypes[i], obs_unit=obs_unit)
-                phenotype_value.save()
+    ObservationUnit.objects.bulk_create([ObservationUnit(study=study, accession_id=accession_pks[accession_id])
+                                         for accession_id in accession_ids], batch_size=500)
+    # bulk_create doesn't set the primary keys, the obs units are read back in the order of insertion
+    obs_unit_ids = list(study.observationunit_set.order_by('pk').values_list('pk', flat=True))
+    pmatrix = np.asarray(pmatrix, dtype=np.float64).reshape(len(obs_unit_ids), len(phenotype_ids))
+    rows, columns = np.nonzero(~np.isnan(pmatrix))
+    PhenotypeValue.objects.bulk_create([PhenotypeValue(value=value, phenotype_id=phenotype_ids[column],
+                                                       obs_unit_id=obs_unit_ids[row])
+                                        for row, column, value in zip(rows.tolist(), columns.tolist(),
+                                                                      pmatrix[rows, columns].tolist())],
+                                       batch_size=500)
     return study
+
+
+def _get_accession_pks(accession_ids):
+    """
+    Returns the primary keys of the accessions for the ids of the PLINK file.
+    Raises Accession.DoesNotExist with all unknown ids
+    """
+    pks = {}
+    for accession_id in set(accession_ids):
+        try:
+            pks[accession_id] = int(accession_id)
+        except ValueError:
+            pks[accession_id] = None
+    valid_pks = [pk for pk in set(pks.values()) if pk is not None]
+    existing_pks = set()
+    # necessary because sqlite has a limit of 999 SQL variables
+    for i in range(0, len(valid_pks), 500):
+        existing_pks.update(Accession.objects.filter(pk__in=valid_pks[i:i + 500]).values_list('pk', flat=True))
+    missing = sorted(accession_id for accession_id, pk in pks.items() if pk not in existing_pks)
+    if missing:
+        err = Accession.DoesNotExist('Accession matching query does not exist.')
+        err.args += (', '.join(missing),)
+        raise err
+    return pks
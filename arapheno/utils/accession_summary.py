@@ -0,0 +1,95 @@
+"""
+Functions to maintain the precomputed accession summaries (AccessionSummary and AccessionTermSummary)
+The summaries only count published phenotypes and are recomputed for the accessions of a study
+when it is published, unpublished or deleted.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Count
+
+from phenotypedb.models import PUBLISHED
+
+logger = logging.getLogger(__name__)
+
+TERM_FIELDS = ('to_term', 'eo_term', 'uo_term')
+
+
+def update_summaries(accession_ids, apps=None):
+    """
+    Recomputes the summaries of the accessions from the published phenotype values
+    The models are looked up in apps for data migrations
+    """
+    models = _get_models(apps)
+    accession_ids = list(set(accession_ids))
+    with transaction.atomic():
+        # necessary because sqlite has a limit of 999 SQL variables
+        for i in range(0, len(accession_ids), 500):
+            _update_summaries(models, accession_ids[i:i + 500])
+
+
+def rebuild_summaries(apps=None):
+    """
+    Recomputes the summaries of all accessions
+    """
+    models = _get_models(apps)
+    with transaction.atomic():
+        models['AccessionSummary'].objects.all().delete()
+        models['AccessionTermSummary'].objects.all().delete()
+        update_summaries(models['Accession'].objects.values_list('pk', flat=True), apps)
+    logger.info('Rebuilt the accession summaries')
+
+
+def get_study_accession_ids(study_id):
+    """
+    Returns the ids of the accessions with observation units in a study
+    """
+    from phenotypedb.models import ObservationUnit
+    return list(ObservationUnit.objects.filter(study_id=study_id).values_list('accession_id', flat=True).distinct())
+
+
+def get_phenotype_accession_ids(phenotype_id):
+    """
+    Returns the ids of the accessions with values of a phenotype
+    """
+    from phenotypedb.models import PhenotypeValue
+    return list(PhenotypeValue.objects.filter(phenotype_id=phenotype_id).values_list(
+        'obs_unit__accession_id', flat=True).distinct())
+
+
+def schedule_update(accession_ids):
+    """
+    Updates the summaries of the accessions after the current transaction is committed
+    """
+    if accession_ids:
+        transaction.on_commit(lambda: update_summaries(accession_ids))
+
+
+def _update_summaries(models, accession_ids):
+    values = models['PhenotypeValue'].objects.filter(phenotype__study__submission__status=PUBLISHED,
+                                                     obs_unit__accession_id__in=accession_ids)
+    summaries = values.values('obs_unit__accession_id').annotate(
+        phenotype_count=Count('phenotype_id', distinct=True), study_count=Count('phenotype__study_id', distinct=True))
+    term_summaries = []
+    for field in TERM_FIELDS:
+        counts = values.filter(**{'phenotype__%s__isnull' % field: False}).values(
+            'obs_unit__accession_id', 'phenotype__%s_id' % field).annotate(phenotype_count=Count('phenotype_id', distinct=True))
+        term_summaries.extend(models['AccessionTermSummary'](accession_id=row['obs_unit__accession_id'], field=field,
+                                                             term_id=row['phenotype__%s_id' % field],
+                                                             phenotype_count=row['phenotype_count'])
+                              for row in counts)
+    models['AccessionSummary'].objects.filter(accession_id__in=accession_ids).delete()
+    models['AccessionTermSummary'].objects.filter(accession_id__in=accession_ids).delete()
+    models['AccessionSummary'].objects.bulk_create([models['AccessionSummary'](accession_id=row['obs_unit__accession_id'],
+                                                                               phenotype_count=row['phenotype_count'],
+                                                                               study_count=row['study_count'])
+                                                    for row in summaries], batch_size=500)
+    models['AccessionTermSummary'].objects.bulk_create(term_summaries, batch_size=500)
+
+
+def _get_models(apps=None):
+    names = ('Accession', 'AccessionSummary', 'AccessionTermSummary', 'PhenotypeValue')
+    if apps is None:
+        from phenotypedb import models
+        return dict((name, getattr(models, name)) for name in names)
+    return dict((name, apps.get_model('phenotypedb', name)) for name in names)
@@ -0,0 +1,260 @@
+"""
+Functions to compute pairwise-complete phenotype correlations
+The replicates of an accession are averaged, so every accession is one observation of a phenotype.
+The correlations of two phenotypes are computed over the accessions that have values for both phenotypes
+and the Spearman ranks are computed over these accessions only (as scipy.stats.spearmanr on the overlap).
+"""
+import logging
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from django.db import connections, transaction
+from django.db.models import F
+from phenotypedb.models import ObservationUnit, Phenotype, PhenotypeCorrelation, PhenotypeValue
+
+logger = logging.getLogger(__name__)
+
+# matrix shared with the worker processes of the pool (inherited on fork)
+_shared_data = {}
+
+
+def load_phenotype_matrix(phenotype_ids, values=None):
+    """
+    Loads the values of the phenotypes with one query and returns an accession x phenotype
+    DataFrame (replicates are averaged, missing values are NaN).
+    The columns are in the order of phenotype_ids
+    """
+    if values is None:
+        values = PhenotypeValue.objects.filter(phenotype_id__in=set(phenotype_ids))
+    values = values.values_list('obs_unit__accession_id', 'phenotype_id', 'value')
+    data = pd.DataFrame.from_records(list(values), columns=['accession_id', 'phenotype_id', 'value'])
+    if data.empty:
+        return pd.DataFrame(columns=list(phenotype_ids), dtype=np.float64)
+    matrix = data.groupby(['accession_id', 'phenotype_id'])['value'].mean().unstack()
+    return matrix.reindex(columns=list(phenotype_ids))
+
+
+def rank_columns(matrix):
+    """
+    Ranks the values of every column of the matrix (average ranks for ties, NaN stays NaN)
+    """
+    return pd.DataFrame(matrix).rank(axis=0).values
+
+
+def pairwise_complete_pearson(x, y=None):
+    """
+    Computes the Pearson correlation between all columns of x and y (defaults to x)
+    using for every pair only the rows in which both columns have a value.
+    Returns the correlation matrix and the number of overlapping rows
+    (NaN for pairs with less than 2 overlapping rows or no variance)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = x if y is None else np.asarray(y, dtype=np.float64)
+    mask_x = ~np.isnan(x)
+    mask_y = ~np.isnan(y)
+    # center the columns to reduce cancellation errors (doesn't change the correlation)
+    x = np.where(mask_x, x - _column_means(x, mask_x), 0.0)
+    y = np.where(mask_y, y - _column_means(y, mask_y), 0.0)
+    mask_x = mask_x.astype(np.float64)
+    mask_y = mask_y.astype(np.float64)
+
+    n = mask_x.T.dot(mask_y)
+    sum_x = x.T.dot(mask_y)
+    sum_y = mask_x.T.dot(y)
+    sum_xx = (x * x).T.dot(mask_y)
+    sum_yy = mask_x.T.dot(y * y)
+    sum_xy = x.T.dot(y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x * sum_x / n
+        var_y = sum_yy - sum_y * sum_y / n
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(n < 2) | (var_x <= 0) | (var_y <= 0)] = np.nan
+    return np.clip(corr, -1.0, 1.0), n.astype(np.int64)
+
+
+def pairwise_complete_spearman(x, y):
+    """
+    Computes the Spearman correlation between all columns of x and y
+    ranking both columns of every pair over the rows in which both have a value
+    (NaN for pairs with less than 2 overlapping rows or no variance)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    mask_y = ~np.isnan(y)
+    spearman = np.empty((x.shape[1], y.shape[1]))
+    for i in range(x.shape[1]):
+        rows = ~np.isnan(x[:, i])
+        # column j of x_i only keeps the values of the rows in which column j of y has a value
+        x_i = np.where(mask_y[rows], x[rows, i][:, np.newaxis], np.nan)
+        spearman[i] = _columnwise_pearson(rank_columns(x_i), rank_columns(y[rows]))
+    return spearman
+
+
+def pairwise_complete_correlations(matrix, columns=None):
+    """
+    Computes the pairwise-complete Pearson and Spearman correlations between
+    the columns of the matrix (or between the selected columns and all columns).
+    Returns the pearson matrix, the spearman matrix and the overlap counts
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    selected = matrix if columns is None else matrix[:, columns]
+    pearson, n = pairwise_complete_pearson(selected, matrix)
+    return pearson, pairwise_complete_spearman(selected, matrix), n
+
+
+def get_stored_correlations(phenotype_ids):
+    """
+    Returns the pearson matrix, spearman matrix and overlap counts for the phenotypes
+    from the correlation store or None if not all phenotypes are in the store
+    """
+    positions = {}
+    for i, phenotype_id in enumerate(phenotype_ids):
+        positions.setdefault(phenotype_id, []).append(i)
+    rows = PhenotypeCorrelation.objects.filter(phenotype_a_id__in=positions.keys(),
+                                               phenotype_b_id__in=positions.keys()).values_list(
+                                                   'phenotype_a_id', 'phenotype_b_id', 'pearson', 'spearman', 'overlap')
+    size = len(phenotype_ids)
+    pearson = np.empty((size, size))
+    pearson.fill(np.nan)
+    spearman = pearson.copy()
+    overlap = np.zeros((size, size), dtype=np.int64)
+    stored = set()
+    for phenotype_a, phenotype_b, r, rho, n in rows:
+        if phenotype_a == phenotype_b:
+            stored.add(phenotype_a)
+        for i in positions[phenotype_a]:
+            for j in positions[phenotype_b]:
+                pearson[i, j] = pearson[j, i] = np.nan if r is None else r
+                spearman[i, j] = spearman[j, i] = np.nan if rho is None else rho
+                overlap[i, j] = overlap[j, i] = n
+    if len(stored) != len(positions):
+        return None
+    return pearson, spearman, overlap
+
+
+def update_correlation_store(phenotype_ids=None, processes=1, block_size=100, accession_ids=None):
+    """
+    Computes the correlations of the phenotypes (default: published phenotypes that are not in the store yet)
+    with all published phenotypes and saves them in the correlation store.
+    The phenotypes are split into blocks of block_size columns that are computed by a pool of processes.
+    If the phenotypes only have values for accession_ids (a list or a values queryset), only the values of
+    these accessions are loaded.
+    Returns the number of stored correlations
+    """
+    published = Phenotype.objects.published()
+    published_ids = list(published.order_by('pk').values_list('pk', flat=True))
+    if phenotype_ids is None:
+        stored_ids = set(PhenotypeCorrelation.objects.filter(phenotype_a=F('phenotype_b')).values_list('phenotype_a_id', flat=True))
+        phenotype_ids = [phenotype_id for phenotype_id in published_ids if phenotype_id not in stored_ids]
+    published_positions = dict((phenotype_id, i) for i, phenotype_id in enumerate(published_ids))
+    columns = sorted(published_positions[phenotype_id] for phenotype_id in set(phenotype_ids)
+                     if phenotype_id in published_positions)
+    if len(columns) == 0:
+        return 0
+
+    values = PhenotypeValue.objects.filter(phenotype__in=published)
+    if accession_ids is not None:
+        values = values.filter(obs_unit__accession_id__in=accession_ids)
+    matrix = load_phenotype_matrix(published_ids, values).values
+    _shared_data['matrix'] = matrix
+    blocks = [columns[i:i + block_size] for i in range(0, len(columns), block_size)]
+    try:
+        if processes > 1 and len(blocks) > 1:
+            # forked workers must not share the database connections of the parent
+            connections.close_all()
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_compute_block, blocks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_compute_block(block) for block in blocks]
+    finally:
+        _shared_data.clear()
+
+    columns = set(columns)
+    correlations = []
+    for block, (pearson, spearman, overlap) in zip(blocks, results):
+        for i, column in enumerate(block):
+            # the diagonal marks the phenotype as stored even if it has no values
+            partners = set(overlap[i].nonzero()[0].tolist())
+            partners.add(column)
+            for j in partners:
+                # pairs of two updated phenotypes are only stored once
+                if j in columns and j < column:
+                    continue
+                phenotype_a, phenotype_b = sorted((published_ids[column], published_ids[j]))
+                correlations.append(PhenotypeCorrelation(phenotype_a_id=phenotype_a, phenotype_b_id=phenotype_b,
+                                                         pearson=_to_float(pearson[i, j]),
+                                                         spearman=_to_float(spearman[i, j]),
+                                                         overlap=int(overlap[i, j])))
+    with transaction.atomic():
+        new_ids = [published_ids[column] for column in columns]
+        for i in range(0, len(new_ids), 400):
+            PhenotypeCorrelation.objects.filter(phenotype_a_id__in=new_ids[i:i + 400]).delete()
+            PhenotypeCorrelation.objects.filter(phenotype_b_id__in=new_ids[i:i + 400]).delete()
+        PhenotypeCorrelation.objects.bulk_create(correlations, batch_size=500)
+    return len(correlations)
+
+
+def update_study_correlations(study_id, processes=1):
+    """
+    Computes the correlations of the phenotypes of a published study with all published phenotypes
+    (only the values of the accessions of the study are loaded)
+    """
+    phenotype_ids = list(Phenotype.objects.published().filter(study_id=study_id).values_list('pk', flat=True))
+    accession_ids = ObservationUnit.objects.filter(study_id=study_id).values('accession_id')
+    return update_correlation_store(phenotype_ids, processes, accession_ids=accession_ids)
+
+
+def update_missing_correlations():
+    """
+    Computes the correlations of the published studies with phenotypes that are not in the store yet
+    (e.g. newly published studies), one study at a time. Returns the number of updated studies
+    """
+    stored_ids = PhenotypeCorrelation.objects.filter(phenotype_a=F('phenotype_b')).values('phenotype_a_id')
+    study_ids = list(Phenotype.objects.published().exclude(pk__in=stored_ids).order_by('study_id').values_list(
+        'study_id', flat=True).distinct())
+    for study_id in study_ids:
+        count = update_study_correlations(study_id)
+        logger.info('Stored %s correlations of study %s', count, study_id)
+    return len(study_ids)
+
+
+def to_json_matrix(matrix):
+    """
+    Converts a numpy matrix to nested lists replacing NaN with None
+    """
+    return [[None if np.isnan(value) else value for value in row] for row in matrix.tolist()]
+
+
+def _compute_block(columns):
+    return pairwise_complete_correlations(_shared_data['matrix'], columns)
+
+
+def _to_float(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _columnwise_pearson(x, y):
+    # correlation between the columns x[:, j] and y[:, j] that have their values in the same rows
+    mask = ~np.isnan(x)
+    n = mask.sum(axis=0)
+    x = np.where(mask, x - _column_means(x, mask), 0.0)
+    y = np.where(mask, y - _column_means(y, mask), 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var_x = (x * x).sum(axis=0)
+        var_y = (y * y).sum(axis=0)
+        corr = (x * y).sum(axis=0) / np.sqrt(var_x * var_y)
+    corr[(n < 2) | (var_x <= 0) | (var_y <= 0)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _column_means(x, mask):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(mask, x, 0.0).sum(axis=0) / mask.sum(axis=0)
+    return np.nan_to_num(means)
@@ -1,8 +1,13 @@
 from datetime import datetime
 import csv
 import ontology_parser
+import numpy as np
+import pandas as pd
 import scipy as sp
 
+# number of rows of a PLINK file that are converted at once
+PLINK_CHUNK_SIZE = 10000
+
 '''
 Accession Class
 '''
@@ -87,43 +92,49 @@ def convertAccessionsToJson(accessions,country_map = {}):
     return accession_dict
 
 '''
-Parse Phenotype File in PLINK format
-Input: filename: filename of phenotype file
-Output: phenotype_matrix: accession_ids x phenotypes (or replicates)
+Parse Phenotype File in PLINK format (space, tab or comma separated)
+Input: filename: filename or file handle of phenotype file
+       chunksize: number of rows that are converted at once
+Output: phenotype_matrix: accession_ids x phenotypes (or replicates) float64 matrix (NaN for missing values)
         accession_ids: scipy array of accession ids
         names: phenotype or replicate names
 '''
-def parse_plink_file(f):
-    #Parse file
+def parse_plink_file(f, chunksize=PLINK_CHUNK_SIZE):
     if not hasattr(f, 'read'):
-        f = codecs.open(f,'rU',encoding='utf-8')
+        f = open(f,'rb')
     try:
+        header = f.readline()
+        if isinstance(header, bytes):
+            header = header.decode('utf-8')
+        header = header.lstrip(u'\ufeff').rstrip(u'\r\n')
+        delimiter = _sniff_plink_delimiter(header)
+        columns = header.split(delimiter)
+        if len(columns) < 3:
+            raise Exception("Wrong file format")
+        names = [name.strip('"').replace("_"," ") for name in columns[2:]]
+        dtype = dict((i, np.float64) for i in range(2, len(columns)))
+        dtype.update({0: object, 1: object})
         accession_ids = []
-        pmatrix = []
-        names = None
-        split_delimiter = " "
-        reader = csv.reader(f,delimiter=split_delimiter)
-        for i,line in enumerate(reader):
-            if i==0:
-                if len(line)==1:
-                    reader = csv.reader(f,delimiter='\t')
-                    line = next(reader)
-                    if len(line)==1:
-                        raise Exception("Wrong file format")
-                names = map(lambda s: s.replace("_"," "),line[2:])
-            else:
-                accession_ids.append(line[0].strip())
-                pmatrix.append(map(lambda x: sp.nan if x == '' else float(x),line[2:]))
-        accession_ids = sp.array(accession_ids)
-        pmatrix = sp.array(pmatrix)
-        return [pmatrix,accession_ids,names]
-    except Exception as error:
-        raise error
+        chunks = []
+        reader = pd.read_csv(f, sep=delimiter, header=None, names=range(len(columns)), dtype=dtype,
+                             engine='c', skip_blank_lines=True, chunksize=chunksize)
+        for chunk in reader:
+            accession_ids.extend(chunk[0].astype(str).str.strip().tolist())
+            chunks.append(chunk.iloc[:, 2:].values.astype(np.float64, copy=False))
+        pmatrix = np.vstack(chunks) if chunks else np.empty((0, len(names)), dtype=np.float64)
+        return [pmatrix,sp.array(accession_ids),names]
     finally:
         if f is not None:
             f.close()
 
 
+def _sniff_plink_delimiter(header):
+    for delimiter in ('\t', ',', ' '):
+        if delimiter in header:
+            return delimiter
+    raise Exception("Wrong file format")
+
+
 '''
 Parse an Ontology file as a dictionary
 Input: filename: filename of the ontology file
@@ -0,0 +1,176 @@
+"""
+Functions to precompute the geographic distribution of the phenotypes and studies (GeographicAggregate)
+The values are averaged per accession first, so replicates don't change the number of accessions or the means.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from django.db import transaction
+from phenotypedb.models import (GeographicAggregate, ObservationUnit, Phenotype, PhenotypeValue, Study,
+                                GEO_COUNTRY, GEO_GRID, GEO_TOTAL)
+from utils import response_cache
+
+logger = logging.getLogger(__name__)
+
+# size of the grid cells in degrees
+GRID_SIZE = 5.0
+
+
+def aggregate_accessions(accessions):
+    """
+    Returns the country and the grid cell aggregates for a DataFrame with one row per accession
+    (country, latitude, longitude and optionally value) as lists of
+    (country, accession_count, value_mean) and (latitude, longitude, accession_count, value_mean)
+    """
+    if 'value' not in accessions:
+        accessions = accessions.assign(value=np.nan)
+    countries = accessions[accessions['country'].notnull() & (accessions['country'] != '')]
+    countries = countries.groupby('country')['value'].agg(['size', 'mean'])
+    located = accessions.dropna(subset=['latitude', 'longitude'])
+    cells = pd.DataFrame({'latitude': np.floor(located['latitude'] / GRID_SIZE) * GRID_SIZE,
+                          'longitude': np.floor(located['longitude'] / GRID_SIZE) * GRID_SIZE,
+                          'value': located['value']})
+    cells = cells.groupby(['latitude', 'longitude'])['value'].agg(['size', 'mean'])
+    return ([(country, int(row['size']), _to_float(row['mean'])) for country, row in countries.iterrows()],
+            [(latitude, longitude, int(row['size']), _to_float(row['mean']))
+             for (latitude, longitude), row in cells.iterrows()])
+
+
+def update_phenotype_aggregates(phenotype_ids):
+    """
+    Recomputes the aggregates of the phenotypes from the mean value of every accession
+    """
+    phenotype_ids = sorted(set(phenotype_ids))
+    # necessary because sqlite has a limit of 999 SQL variables
+    for i in range(0, len(phenotype_ids), 500):
+        chunk = phenotype_ids[i:i + 500]
+        values = PhenotypeValue.objects.filter(phenotype_id__in=chunk).values_list(
+            'phenotype_id', 'obs_unit__accession_id', 'obs_unit__accession__country',
+            'obs_unit__accession__latitude', 'obs_unit__accession__longitude', 'value')
+        data = pd.DataFrame.from_records(list(values), columns=['phenotype_id', 'accession_id', 'country',
+                                                                'latitude', 'longitude', 'value'])
+        _save_aggregates('phenotype', chunk, _mean_per_accession(data).groupby('phenotype_id'))
+
+
+def update_study_aggregates(study_ids):
+    """
+    Recomputes the aggregates of the accessions of the studies
+    """
+    study_ids = sorted(set(study_ids))
+    # necessary because sqlite has a limit of 999 SQL variables
+    for i in range(0, len(study_ids), 500):
+        chunk = study_ids[i:i + 500]
+        obs_units = ObservationUnit.objects.filter(study_id__in=chunk).values_list(
+            'study_id', 'accession_id', 'accession__country', 'accession__latitude', 'accession__longitude').distinct()
+        accessions = pd.DataFrame.from_records(list(obs_units), columns=['study_id', 'accession_id', 'country',
+                                                                         'latitude', 'longitude'])
+        _save_aggregates('study', chunk, accessions.groupby('study_id'))
+
+
+def update_study(study_id):
+    """
+    Recomputes the aggregates of a study and of its phenotypes
+    """
+    with transaction.atomic():
+        update_study_aggregates([study_id])
+        update_phenotype_aggregates(Phenotype.objects.filter(study_id=study_id).values_list('pk', flat=True))
+
+
+def update_all_aggregates():
+    """
+    Recomputes the aggregates of all published studies and phenotypes
+    """
+    with transaction.atomic():
+        GeographicAggregate.objects.all().delete()
+        study_ids = list(Study.objects.published().values_list('pk', flat=True))
+        update_study_aggregates(study_ids)
+        update_phenotype_aggregates(Phenotype.objects.published().values_list('pk', flat=True))
+    logger.info('Computed the geographic aggregates of %s studies', len(study_ids))
+    return len(study_ids)
+
+
+def get_geography(phenotype=None, study=None):
+    """
+    Returns the aggregates of a phenotype or study in the format of the REST endpoints
+    The aggregates are computed if they are missing (e.g. studies published before the aggregates existed)
+    """
+    if phenotype is not None:
+        aggregates = GeographicAggregate.objects.filter(phenotype=phenotype)
+        update = lambda: update_phenotype_aggregates([phenotype.pk])
+    else:
+        aggregates = GeographicAggregate.objects.filter(study=study)
+        update = lambda: update_study_aggregates([study.pk])
+    aggregates = aggregates.order_by('kind', 'country', 'latitude', 'longitude').values_list(
+        'kind', 'country', 'latitude', 'longitude', 'accession_count', 'value_mean')
+    rows = list(aggregates)
+    if not rows:
+        update()
+        # all() because the result cache of the queryset contains the empty rows
+        rows = list(aggregates.all())
+    geography = {'grid_size': GRID_SIZE, 'accession_count': 0, 'value_mean': None, 'countries': [], 'grid': []}
+    for kind, country, latitude, longitude, accession_count, value_mean in rows:
+        if kind == GEO_COUNTRY:
+            geography['countries'].append([country, accession_count, value_mean])
+        elif kind == GEO_GRID:
+            geography['grid'].append([latitude, longitude, accession_count, value_mean])
+        else:
+            geography['accession_count'] = accession_count
+            geography['value_mean'] = value_mean
+    return geography
+
+
+def schedule_update(study_id):
+    """
+    Recomputes the aggregates of a study after the current transaction is committed
+    """
+    def _update():
+        try:
+            update_study(study_id)
+        except Exception:
+            logger.exception('Updating the geographic aggregates of study %s failed', study_id)
+    transaction.on_commit(_update)
+
+
+def _mean_per_accession(data):
+    # the accession fields are the same for all values of an accession (NaN can't be grouped on)
+    if data.empty:
+        return data
+    grouped = data.groupby(['phenotype_id', 'accession_id'])
+    accessions = grouped[['country', 'latitude', 'longitude']].first()
+    accessions['value'] = grouped['value'].mean()
+    return accessions.reset_index()
+
+
+def _save_aggregates(field, object_ids, groups):
+    # numpy integers can't be passed to sqlite
+    groups = dict((int(object_id), accessions) for object_id, accessions in groups)
+    aggregates = []
+    for object_id in object_ids:
+        # the total row marks the object as computed, even if it has no accessions
+        accessions = groups.get(object_id)
+        if accessions is None:
+            aggregates.append(GeographicAggregate(kind=GEO_TOTAL, **{'%s_id' % field: object_id}))
+            continue
+        value_mean = _to_float(accessions['value'].mean()) if 'value' in accessions else None
+        aggregates.append(GeographicAggregate(kind=GEO_TOTAL, accession_count=len(accessions), value_mean=value_mean,
+                                              **{'%s_id' % field: object_id}))
+        countries, cells = aggregate_accessions(accessions)
+        aggregates.extend(GeographicAggregate(kind=GEO_COUNTRY, country=country, accession_count=accession_count,
+                                              value_mean=value_mean, **{'%s_id' % field: object_id})
+                          for country, accession_count, value_mean in countries)
+        aggregates.extend(GeographicAggregate(kind=GEO_GRID, latitude=latitude, longitude=longitude,
+                                              accession_count=accession_count, value_mean=value_mean,
+                                              **{'%s_id' % field: object_id})
+                          for latitude, longitude, accession_count, value_mean in cells)
+    with transaction.atomic():
+        GeographicAggregate.objects.filter(**{'%s_id__in' % field: object_ids}).delete()
+        GeographicAggregate.objects.bulk_create(aggregates, batch_size=500)
+    # the cached responses contain the aggregates, but their validators don't change
+    tags = ['%s:%s' % (field, object_id) for object_id in object_ids]
+    transaction.on_commit(lambda: response_cache.invalidate(tags))
+
+
+def _to_float(value):
+    return None if pd.isnull(value) else float(value)
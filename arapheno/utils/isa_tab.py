@@ -1,62 +1,110 @@
 import logging
 import os
 import zipfile
+import tarfile
 import tempfile
 import csv
 import shutil
 import codecs
 import pdb
+from contextlib import closing, contextmanager
+import numpy as np
+import pandas as pd
+from six import string_types, text_type
 from phenotypedb.models import Study,Phenotype,PhenotypeValue,Publication, Accession, Species, Author, ObservationUnit, OntologyTerm
 from django.db import transaction
+from django.utils import timezone
 import datetime
 import codecs
 
 from phenotypedb.renderer import IsaTabStudyRenderer, IsaTabAssayRenderer,IsaTabDerivedDataFileRenderer,IsaTabTraitDefinitionRenderer
+from utils.zip_stream import ZipStream
 
 logger = logging.getLogger(__name__)
 
-def parse_isatab(filename):
-    """Parses either an isa-tab zip or folder"""
+# number of observation units that are exported at once
+ISATAB_CHUNK_SIZE = 1000
+
+def parse_isatab(source):
+    """
+    Parses an isa-tab folder or a zip or tar.gz archive (filename or file handle)
+    The trait definition and derived data files are read directly from the archive.
+    Only the investigation, study and assay files are extracted (to a temporary folder that is removed afterwards),
+    because they are parsed by bcbio from a folder.
+    """
 
     from bcbio import isatab
 
-    # check if filename is a folder or a zip
-    if not os.path.exists(filename):
-        raise Exception('File or folder %s does not exist',filename)
+    if isinstance(source, string_types) and not os.path.exists(source):
+        raise Exception('File or folder %s does not exist' % source)
+
+    with _open_isatab(source) as (members, open_member):
+        if isinstance(source, string_types) and os.path.isdir(source):
+            rec = isatab.parse(source)
+        else:
+            work_dir = tempfile.mkdtemp()
+            try:
+                for name in members:
+                    if _is_metadata_file(name):
+                        with open_member(name) as member, open(os.path.join(work_dir, name), 'wb') as f:
+                            shutil.copyfileobj(member, f)
+                rec = isatab.parse(work_dir)
+            finally:
+                shutil.rmtree(work_dir)
+        # parse trait def file and raw data file
+        for s in rec.studies:
+            s.trait_def_map = {}
+            s.derived_data_map = {}
+            for assay in s.assays:
+                if (assay.metadata['Study Assay Measurement Type Term Accession Number'] not in ('23','0000023')):
+                    continue
+                for sample_id,assay_data in assay.nodes.items():
+                    derived_data_file = assay_data.metadata['Derived Data File'][0]
+                    trait_def_file = assay_data.metadata['Parameter Value[Trait Definition File]'][0].Trait_Definition_File
+
+                    # check if we already loaded the trait def file
+                    if trait_def_file not in s.trait_def_map:
+                        with open_member(trait_def_file) as f:
+                            s.trait_def_map[trait_def_file] = _parse_trait_def_file(f)
+
+                    # check if we already loaded the derived data matrix
+                    if derived_data_file not in s.derived_data_map:
+                        with open_member(derived_data_file) as f:
+                            s.derived_data_map[derived_data_file] = _parse_derived_data_file(f)
+    return rec
 
-    if not os.path.isdir(filename):
-        work_dir = tempfile.mkdtemp()
-        # unzip to temporary folder
-        with zipfile.ZipFile(filename, "r") as z:
-            z.extractall(work_dir)
+
+@contextmanager
+def _open_isatab(source):
+    """
+    Yields the file names of an isa-tab folder, zip or tar.gz archive and a function that opens a file by its name
+    Files in sub folders of an archive are opened by their base name
+    """
+    if isinstance(source, string_types) and os.path.isdir(source):
+        yield os.listdir(source), lambda name: open(os.path.join(source, name), 'rb')
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source, 'r') as archive:
+            members = dict((os.path.basename(info.filename), info) for info in archive.infolist()
+                           if not info.filename.endswith('/'))
+            yield list(members), lambda name: closing(archive.open(_get_member(members, name)))
     else:
-        work_dir = filename
-
-    # parse
-    rec = isatab.parse(work_dir)
-    # parse trait def file and raw data file
-    for s in rec.studies:
-        s.trait_def_map = {}
-        s.derived_data_map = {}
-        for assay in s.assays:
-            if (assay.metadata['Study Assay Measurement Type Term Accession Number'] not in ('23','0000023')):
-                continue
-            for sample_id,assay_data in assay.nodes.items():
-                derived_data_file = assay_data.metadata['Derived Data File'][0]
-                trait_def_file = assay_data.metadata['Parameter Value[Trait Definition File]'][0].Trait_Definition_File
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        archive = tarfile.open(name=source, mode='r:*') if isinstance(source, string_types) else tarfile.open(fileobj=source, mode='r:*')
+        with closing(archive):
+            members = dict((os.path.basename(info.name), info) for info in archive.getmembers() if info.isfile())
+            yield list(members), lambda name: closing(archive.extractfile(_get_member(members, name)))
 
-                # check if we already loaded the trait def file
-                if trait_def_file not in s.trait_def_map:
-                    s.trait_def_map[trait_def_file] = _parse_trait_def_file(trait_def_file,work_dir)
 
-                # check if we already loaded the derived data matrix
-                if derived_data_file not in s.derived_data_map:
-                    s.derived_data_map[derived_data_file] = _parse_derived_data_file(derived_data_file,work_dir)
-    # remove temporary folder
+def _get_member(members, name):
+    try:
+        return members[os.path.basename(name)]
+    except KeyError:
+        raise Exception('File %s is missing in the ISA-TAB archive' % name)
 
-    if filename != work_dir:
-        shutil.rmtree(work_dir)
-    return rec
+
+def _is_metadata_file(name):
+    return name.endswith('.txt') and (name.startswith(('i_', 's_', 'a_')) or name.endswith('.idf.txt'))
 
 
 def _create_publication(isatab_pub,type):
@@ -71,109 +119,95 @@ def _get_accession_map(study):
     pass
 
 
-def _parse_trait_def_file(trait_def_file,work_dir):
+def _parse_trait_def_file(f):
     trait_def_map = {}
 
-    with codecs.open(os.path.join(work_dir,trait_def_file),'rb','utf-8') as f:
-        reader = csv.reader(f,dialect="excel-tab")
-        header = next(reader)
-        method_ix = header.index('Method')
-        trait_ix = header.index('Trait')
-        eo_ix, to_ix, uo_ix  = [-1,-1,-1]
-        for row in reader:
-            if eo_ix == -1:
-                try:
-                    eo_ix = row.index('EO')
-                except ValueError:
-                    pass
-            if to_ix == -1:
-                try:
-                    to_ix = row.index('TO')
-                except ValueError:
-                    pass
-            if uo_ix == -1:
-                try:
-                    uo_ix = row.index('UO')
-                except ValueError:
-                    pass
-            tr = {'Trait':row[trait_ix],'Method':row[method_ix],'EO':None,'TO':None,'UO':None}
-            if (eo_ix > 0): tr['EO'] = row[eo_ix+1]
-            if (to_ix > 0): tr['TO'] = row[to_ix+1]
-            if (uo_ix > 0): tr['UO'] = row[uo_ix+1]
-            trait_def_map[row[0]] = tr
+    reader = csv.reader(codecs.getreader('utf-8')(f),dialect="excel-tab")
+    header = next(reader)
+    method_ix = header.index('Method')
+    trait_ix = header.index('Trait')
+    eo_ix, to_ix, uo_ix  = [-1,-1,-1]
+    for row in reader:
+        if eo_ix == -1:
+            try:
+                eo_ix = row.index('EO')
+            except ValueError:
+                pass
+        if to_ix == -1:
+            try:
+                to_ix = row.index('TO')
+            except ValueError:
+                pass
+        if uo_ix == -1:
+            try:
+                uo_ix = row.index('UO')
+            except ValueError:
+                pass
+        tr = {'Trait':row[trait_ix],'Method':row[method_ix],'EO':None,'TO':None,'UO':None}
+        if (eo_ix > 0): tr['EO'] = row[eo_ix+1]
+        if (to_ix > 0): tr['TO'] = row[to_ix+1]
+        if (uo_ix > 0): tr['UO'] = row[uo_ix+1]
+        trait_def_map[row[0]] = tr
     return trait_def_map
 
 def _get_index_for_term(row,term):
     return row.index(term)
 
-def _parse_derived_data_file(derived_data_file,work_dir):
-    derived_data_map = {}
-    with codecs.open(os.path.join(work_dir,derived_data_file),'rb','utf-8') as f:
-        reader = csv.DictReader(f,dialect="excel-tab")
-        for row in reader:
-            assay_name = row['Assay Name']
-            del row['Assay Name']
-            derived_data_map[assay_name] = row
-    return derived_data_map
+def _parse_derived_data_file(f):
+    """
+    Parses a derived data file into a float64 frame indexed by the assay name with a column per trait id
+    """
+    header = f.readline().decode('utf-8').lstrip(u'\ufeff').rstrip(u'\r\n')
+    columns = next(csv.reader([header.encode('utf-8')], dialect='excel-tab'))
+    columns = [column.decode('utf-8') for column in columns]
+    if 'Assay Name' not in columns:
+        raise Exception('Derived data file must contain an "Assay Name" column')
+    dtype = dict((column, np.float64) for column in columns if column != 'Assay Name')
+    dtype['Assay Name'] = object
+    frame = pd.read_csv(f, sep='\t', header=None, names=columns, dtype=dtype, engine='c', skip_blank_lines=True)
+    return frame.set_index('Assay Name')
 
 
 @transaction.atomic
 def save_isatab(isatab):
     """Converts isatab to db objects"""
     studies = []
+    species = Species.objects.get(pk=1)
+    publications = _get_publications(isatab)
+    ontology_terms = _get_ontology_terms(isatab)
+    _check_accessions(isatab)
     for s in isatab.studies:
         # Initialize Publication
         study = Study()
         study.name = s.metadata['Study Title']
         if len(s.design_descriptors) > 0:
             study.description = s.design_descriptors[0]['Study Design Type']
-        study.species = Species.objects.get(pk=1)
+        study.species = species
         study.save()
         studies.append(study)
         # initialize publications
-        pubs = {}
-        for p in isatab.publications + s.publications:
-            type = 'Investigation'
-            if 'Study Publication DOI' in p:
-                type = 'Study'
-            doi_to_check = p['%s Publication DOI' % type]
-            publication = pubs.get(doi_to_check,None)
-            if publication is None:
-                try:
-                    publication = Publication.objects.get(doi=doi_to_check)
-                except Publication.DoesNotExist:
-                    publication = _create_publication(p,type)
-                    publication.save();
-                pubs[doi_to_check] = publication
-            study.publications.add(publication)
-        accession_map = s.nodes
-        obs_map = {}
-        phenotype_map  = {}
-        # create the phenotype map
+        study.publications.add(*set(publications[_get_publication_doi(p)] for p in isatab.publications + s.publications))
+        # create the phenotypes (bulk_create doesn't set the primary keys, they are read back in the order of insertion)
+        phenotype_keys = []
+        phenotypes = []
+        update_date = timezone.now()
         for trait_def_file,trait_def_data in s.trait_def_map.items():
-            pheno_map = {}
             for trait_id,trait in trait_def_data.items():
-                to_term = None
-                eo_term = None
-                uo_term = None
-                if 'TO' in trait:
-                    to_term = OntologyTerm.objects.filter(id=trait['TO'],source_id=1).first()
-                if 'EO' in trait:
-                    eo_term = OntologyTerm.objects.filter(id=trait['EO'],source_id=2).first()
-                if 'UO' in trait:
-                    uo_term = OntologyTerm.objects.filter(id=trait['UO'],source_id=3).first()
-                phenotype = Phenotype(name=trait['Trait'],scoring=trait['Method'],to_term = to_term,eo_term=eo_term,uo_term=uo_term,study=study,species=study.species)
-                phenotype.save()
-                pheno_map[trait_id] = phenotype
-            phenotype_map[trait_def_file] = pheno_map
-        for sample_id,sample in s.nodes.items():
-            # avoid duplicates because nodes will also contain source- entries
-            if not sample_id.startswith('sample-'):
-                continue
-            accession_id = int(sample.metadata['Characteristics[Infraspecific name]'][0].Term_Accession_Number)
-            obs_unit = ObservationUnit(study=study,accession=Accession.objects.get(pk=accession_id))
-            obs_unit.save()
-            obs_map[sample_id] = obs_unit
+                phenotype_keys.append((trait_def_file,trait_id))
+                phenotypes.append(Phenotype(name=trait['Trait'],scoring=trait['Method'],
+                                            to_term=ontology_terms.get((trait.get('TO'),1)),
+                                            eo_term=ontology_terms.get((trait.get('EO'),2)),
+                                            uo_term=ontology_terms.get((trait.get('UO'),3)),
+                                            study=study,species=species,update_date=update_date))
+        Phenotype.objects.bulk_create(phenotypes,batch_size=500)
+        phenotype_map = dict(zip(phenotype_keys,study.phenotype_set.order_by('pk').values_list('pk',flat=True)))
+        # create the observation units
+        sample_ids = [sample_id for sample_id in s.nodes.keys() if sample_id.startswith('sample-')]
+        ObservationUnit.objects.bulk_create([ObservationUnit(study=study,accession_id=_get_sample_accession_id(s.nodes[sample_id]))
+                                             for sample_id in sample_ids],batch_size=500)
+        obs_map = dict(zip(sample_ids,study.observationunit_set.order_by('pk').values_list('pk',flat=True)))
+        # group the observation units of the assays by their derived data file
+        assays = {}
         for a in s.assays:
             # ignore if it's not a phenotyping assay
             if (a.metadata['Study Assay Measurement Type Term Accession Number'] not in ('23','0000023')):
@@ -184,44 +218,134 @@ def save_isatab(isatab):
                     continue
                 derived_data_file = assay_data.metadata['Derived Data File'][0]
                 trait_def_file = assay_data.metadata['Parameter Value[Trait Definition File]'][0].Trait_Definition_File
-                assay_id = assay_data.metadata['Assay Name'][0].Assay_Name
-                phen_row = {k:float(v) for k,v in s.derived_data_map[derived_data_file][assay_id].iteritems() if v != ''}
-                obs_unit = obs_map[sample_id]
-                for phenotype_id, value in phen_row.iteritems():
-                    phenotype = phenotype_map[trait_def_file][phenotype_id]
-                    phenotype_value = PhenotypeValue(value=value,phenotype=phenotype,obs_unit = obs_unit)
-                    phenotype_value.save()
+                assay_ids, obs_unit_ids = assays.setdefault((derived_data_file,trait_def_file),([],[]))
+                assay_ids.append(assay_data.metadata['Assay Name'][0].Assay_Name)
+                obs_unit_ids.append(obs_map[sample_id])
+        values = []
+        for (derived_data_file,trait_def_file),(assay_ids,obs_unit_ids) in assays.items():
+            frame = s.derived_data_map[derived_data_file]
+            missing = set(assay_ids) - set(frame.index)
+            if missing:
+                raise Exception('Assays %s are missing in %s' % (', '.join(sorted(missing)),derived_data_file))
+            phenotype_ids = [phenotype_map[(trait_def_file,trait_id)] for trait_id in frame.columns]
+            matrix = frame.loc[assay_ids].values
+            rows,columns = np.nonzero(~np.isnan(matrix))
+            values.extend(PhenotypeValue(value=value,phenotype_id=phenotype_ids[column],obs_unit_id=obs_unit_ids[row])
+                          for row,column,value in zip(rows.tolist(),columns.tolist(),matrix[rows,columns].tolist()))
+        PhenotypeValue.objects.bulk_create(values,batch_size=500)
     return studies
 
 
+def _get_publication_type(isatab_pub):
+    return 'Study' if 'Study Publication DOI' in isatab_pub else 'Investigation'
 
-def export_isatab(study):
-    # create temorary folder
-    folder = tempfile.mkdtemp()
-    isatab_filename = tempfile.mkstemp()[1]
-
-    # create the isatab files
-    _create_isatab_files(study,folder)
-
-    # zip it
-    output_filename = shutil.make_archive(isatab_filename,"zip",folder)
 
-    # remove temporary folder
-    shutil.rmtree(folder)
-    os.unlink(isatab_filename)
-    return output_filename
+def _get_publication_doi(isatab_pub):
+    return isatab_pub['%s Publication DOI' % _get_publication_type(isatab_pub)]
 
 
-def _create_isatab_files(study,folder):
-    df,df_pivot = study.get_matrix_and_accession_map(column='phenotype_id')
-    _create_investigation_file(study,folder)
-    _create_study_file(study,df,df_pivot,folder)
-    _create_assay_file(study,df,folder)
-    _create_tdf_file(study,folder)
-    _create_data_file(df_pivot,folder)
-    pass
-
-def _create_investigation_file(study,folder):
+def _get_publications(isatab):
+    """Returns the existing and newly created publications of the isatab by their DOI"""
+    isatab_pubs = {}
+    for s in isatab.studies:
+        for p in isatab.publications + s.publications:
+            isatab_pubs.setdefault(_get_publication_doi(p),p)
+    publications = dict((publication.doi,publication) for publication in Publication.objects.filter(doi__in=isatab_pubs.keys()))
+    for doi,p in isatab_pubs.items():
+        if doi not in publications:
+            publication = _create_publication(p,_get_publication_type(p))
+            publication.save()
+            publications[doi] = publication
+    return publications
+
+
+def _get_ontology_terms(isatab):
+    """Returns the ontology terms that are referenced by the traits by their id and source id"""
+    term_ids = set()
+    for s in isatab.studies:
+        for trait_def_data in s.trait_def_map.values():
+            for trait in trait_def_data.values():
+                term_ids.update(trait.get(source) for source in ('TO','EO','UO'))
+    term_ids.discard(None)
+    term_ids = list(term_ids)
+    ontology_terms = {}
+    # necessary because sqlite has a limit of 999 SQL variables
+    for i in range(0,len(term_ids),500):
+        for term in OntologyTerm.objects.filter(id__in=term_ids[i:i+500]):
+            ontology_terms[(term.id,term.source_id)] = term
+    return ontology_terms
+
+
+def _get_sample_accession_id(sample):
+    return int(sample.metadata['Characteristics[Infraspecific name]'][0].Term_Accession_Number)
+
+
+def _check_accessions(isatab):
+    """Checks that the accessions of all samples exist (raises Accession.DoesNotExist with all unknown ids)"""
+    accession_ids = set()
+    for s in isatab.studies:
+        accession_ids.update(_get_sample_accession_id(sample) for sample_id,sample in s.nodes.items() if sample_id.startswith('sample-'))
+    accession_ids = list(accession_ids)
+    existing_ids = set()
+    # necessary because sqlite has a limit of 999 SQL variables
+    for i in range(0,len(accession_ids),500):
+        existing_ids.update(Accession.objects.filter(pk__in=accession_ids[i:i+500]).values_list('pk',flat=True))
+    missing = sorted(set(accession_ids) - existing_ids)
+    if missing:
+        err = Accession.DoesNotExist('Accession matching query does not exist.')
+        err.args += (', '.join(map(str,missing)),)
+        raise err
+
+
+
+def export_isatab(study, filename=None):
+    """
+    Writes the ISA-TAB archive of a study to filename (default: a temporary file) and returns the filename
+    """
+    if filename is None:
+        fd, filename = tempfile.mkstemp(suffix='.zip')
+        os.close(fd)
+    with open(filename, 'wb') as f:
+        for chunk in stream_isatab(study):
+            f.write(chunk)
+    return filename
+
+
+def stream_isatab(study):
+    """
+    Generates the ISA-TAB archive of a study as chunks of the zip file
+    The tables are built column-wise for ISATAB_CHUNK_SIZE observation units at a time,
+    so neither the archive nor the phenotype matrix of the study is kept in memory
+    """
+    obs_units = _get_obs_units(study)
+    phenotypes = list(study.phenotype_set.select_related('to_term__source', 'uo_term__source').order_by('pk'))
+    archive = ZipStream()
+    members = [('i_investigation.txt', [_get_investigation_content(study).encode('utf-8')]),
+               ('s_study%s.txt' % study.id, _iter_study_file(study, obs_units)),
+               ('a_study%s.txt' % study.id, _iter_assay_file(obs_units)),
+               ('tdf.txt', _iter_tdf_file(phenotypes)),
+               ('d_data.txt', _iter_data_file(study, obs_units, phenotypes))]
+    for name, chunks in members:
+        for chunk in archive.write_iter(name, chunks):
+            yield chunk
+    for chunk in archive.close():
+        yield chunk
+
+
+def _get_obs_units(study):
+    """
+    Returns the ids, accession ids and accession names of the observation units with values, ordered by id
+    """
+    obs_units = ObservationUnit.objects.filter(phenotypevalue__phenotype__study=study).distinct().order_by('pk')
+    return list(obs_units.values_list('pk', 'accession_id', 'accession__name'))
+
+
+def _iter_chunks(obs_units):
+    for start in range(0, len(obs_units), ISATAB_CHUNK_SIZE):
+        yield obs_units[start:start + ISATAB_CHUNK_SIZE]
+
+
+def _get_investigation_content(study):
 
     ontology_reference = """ONTOLOGY SOURCE REFERENCE
 Term Source Name	OBI	EFO	UO	NCBITaxon	PO	GMI_accessions
@@ -358,86 +482,103 @@ Study Person Roles Term Accession Number
 Study Person Roles Term Source REF
 """ % {'study_id':study.id}
 
-    investigation_content = ontology_reference + investigation + investigation_publications + investigation_contacts + study_info + study_publications + assays
-    investigation_filename = os.path.join(folder,'i_investigation.txt')
-    with open(investigation_filename,'w') as f:
-        f.write(investigation_content.encode('utf-8'))
-    return investigation_filename
-
-
-def _create_study_file(study,df,df_pivot,folder):
-    renderer = IsaTabStudyRenderer()
-    organism = '%s %s' % (study.species.genus,study.species.species)
-    ncbi_id = study.species.ncbi_id
-
-    data = []
-    for obs_unit_id,row in df_pivot.iterrows():
-        info = df.ix[obs_unit_id]
-        accession_id = info.accession_id
-        accession_name = info.accession_name
-        csv_row = {'source':'source%s' % accession_id ,'organism':organism,'organism_ref':'NCBITaxon','ncbi_id':ncbi_id,
-        'accession_name':accession_name,'accession_ref':'GMI_accessions','accession_id':accession_id,
-        'sample':'sample%s' % obs_unit_id}
-        data.append(csv_row)
-    content = renderer.render(data)
-
-    study_filename = os.path.join(folder,'s_study%s.txt' % study.id)
-    with open(study_filename,'w') as f:
-        f.write(content)
-    return study_filename
-
-def _create_assay_file(study,df,folder):
-    renderer = IsaTabAssayRenderer()
-    data = []
-    for obs_unit_id,row in df.iterrows():
-        csv_row = {'sample':'sample%s' % obs_unit_id ,'assay':'assay%s' % obs_unit_id,
-        'protocol_ref':'Data transformation','trait_def_file':'tdf.txt','derived_data_file':'d_data.txt'}
-        data.append(csv_row)
-    content = renderer.render(data)
-
-    assay_filename = os.path.join(folder,'a_study%s.txt' % study.id)
-    with open(assay_filename,'w') as f:
-        f.write(content)
-    return assay_filename
-
-
-
-def _create_tdf_file(study,folder):
-    renderer = IsaTabTraitDefinitionRenderer()
-    data = []
-    for phenotype in study.phenotype_set.all():
-        row = {'variable_id':phenotype.id,'trait':phenotype.name,'method':phenotype.scoring}
-        if phenotype.to_term:
-            row['to_term_ref'] = phenotype.to_term.source.acronym
-            row['to_term_id'] = phenotype.to_term.id
-        if phenotype.uo_term:
-            row['scale'] = phenotype.uo_term.name
-            row['scale_ref'] = phenotype.uo_term.source.acronym
-            row['scale_id'] = phenotype.uo_term.id
-
-        data.append(row)
-
-    content = renderer.render(data)
-
-    tdf_filename = os.path.join(folder,'tdf.txt')
-    with open(tdf_filename,'w') as f:
-        f.write(content)
-    return tdf_filename
-
-def _create_data_file(df_pivot,folder):
-    df_empty = df_pivot.fillna('')
-    renderer = IsaTabDerivedDataFileRenderer()
-    data = []
-    headers = map(str,df_empty.columns.tolist())
-    for obs_unit_id,row in df_empty.iterrows():
-        csv_row = {'assay':'assay%s'% obs_unit_id}
-        for i,value in enumerate(row.values):
-            csv_row[headers[i]] = value
-        data.append(csv_row)
-
-    content = renderer.render(data)
-
-    data_filename = os.path.join(folder,'d_data.txt')
-    with open(data_filename,'w') as f:
-        f.write(content)
-    return data_filename
+    return ontology_reference + investigation + investigation_publications + investigation_contacts + study_info + study_publications + assays
+
+
+def _iter_study_file(study, obs_units):
+    organism = u'%s %s' % (study.species.genus, study.species.species)
+    ncbi_id = text_type(study.species.ncbi_id)
+    yield _render_header(IsaTabStudyRenderer)
+    for chunk in _iter_chunks(obs_units):
+        obs_unit_ids, accession_ids, accession_names = zip(*chunk)
+        size = len(chunk)
+        yield _render_rows(IsaTabStudyRenderer, size, {
+            'source': [u'source%s' % accession_id for accession_id in accession_ids],
+            'organism': [organism] * size, 'organism_ref': [u'NCBITaxon'] * size, 'ncbi_id': [ncbi_id] * size,
+            'accession_name': _quote(accession_names), 'accession_ref': [u'GMI_accessions'] * size,
+            'accession_id': [text_type(accession_id) for accession_id in accession_ids],
+            'sample': [u'sample%s' % obs_unit_id for obs_unit_id in obs_unit_ids]})
+
+
+def _iter_assay_file(obs_units):
+    yield _render_header(IsaTabAssayRenderer)
+    for chunk in _iter_chunks(obs_units):
+        obs_unit_ids = [obs_unit[0] for obs_unit in chunk]
+        size = len(chunk)
+        yield _render_rows(IsaTabAssayRenderer, size, {
+            'sample': [u'sample%s' % obs_unit_id for obs_unit_id in obs_unit_ids],
+            'assay': [u'assay%s' % obs_unit_id for obs_unit_id in obs_unit_ids],
+            'protocol_ref': [u'Data transformation'] * size, 'trait_def_file': [u'tdf.txt'] * size,
+            'derived_data_file': [u'd_data.txt'] * size})
+
+
+def _iter_tdf_file(phenotypes):
+    yield _render_header(IsaTabTraitDefinitionRenderer)
+    if not phenotypes:
+        return
+    to_terms = [phenotype.to_term for phenotype in phenotypes]
+    uo_terms = [phenotype.uo_term for phenotype in phenotypes]
+    yield _render_rows(IsaTabTraitDefinitionRenderer, len(phenotypes), {
+        'variable_id': [text_type(phenotype.id) for phenotype in phenotypes],
+        'trait': _quote(phenotype.name for phenotype in phenotypes),
+        'method': _quote(phenotype.scoring for phenotype in phenotypes),
+        'to_term_ref': _quote(term.source.acronym if term else None for term in to_terms),
+        'to_term_id': _quote(term.id if term else None for term in to_terms),
+        'scale': _quote(term.name if term else None for term in uo_terms),
+        'scale_ref': _quote(term.source.acronym if term else None for term in uo_terms),
+        'scale_id': _quote(term.id if term else None for term in uo_terms)})
+
+
+def _iter_data_file(study, obs_units, phenotypes):
+    phenotype_ids = np.array([phenotype.id for phenotype in phenotypes], dtype=np.int64)
+    yield _render_header(IsaTabDerivedDataFileRenderer, ['assay'] + [str(pk) for pk in phenotype_ids.tolist()])
+    for chunk in _iter_chunks(obs_units):
+        obs_unit_ids = np.array([obs_unit[0] for obs_unit in chunk], dtype=np.int64)
+        # the observation units are ordered, so the chunk is selected by its id range
+        values = list(PhenotypeValue.objects.filter(phenotype__study=study, obs_unit_id__gte=int(obs_unit_ids[0]),
+                                                    obs_unit_id__lte=int(obs_unit_ids[-1]))
+                      .values_list('obs_unit_id', 'phenotype_id', 'value'))
+        matrix = np.full((len(obs_unit_ids), len(phenotype_ids)), np.nan)
+        if values:
+            value_obs_unit_ids, value_phenotype_ids, values = zip(*values)
+            matrix[np.searchsorted(obs_unit_ids, value_obs_unit_ids),
+                   np.searchsorted(phenotype_ids, value_phenotype_ids)] = np.array(values, dtype=np.float64)
+        columns = [[u'assay%s' % obs_unit_id for obs_unit_id in obs_unit_ids.tolist()]]
+        columns.extend(_format_values(matrix[:, i]) for i in range(matrix.shape[1]))
+        yield _join_rows(columns)
+
+
+def _render_header(renderer, header=None):
+    return _join_rows([[renderer.labels.get(column, column)] for column in header or renderer.header])
+
+
+def _render_rows(renderer, size, columns):
+    """
+    Joins the columns in the order of the header of the renderer, missing columns are left empty
+    """
+    empty = [u''] * size
+    return _join_rows([columns.get(column, empty) for column in renderer.header])
+
+
+def _join_rows(columns):
+    return u''.join(u'\t'.join(row) + u'\r\n' for row in zip(*columns)).encode('utf-8')
+
+
+def _format_values(values):
+    # repr keeps the full precision like the csv module, missing values are empty
+    text = np.array([repr(value) for value in values.tolist()], dtype=object)
+    text[np.isnan(values)] = u''
+    return text.tolist()
+
+
+def _quote(values):
+    """
+    Converts the values to text and quotes them like the csv module if they contain a delimiter, quote or newline
+    """
+    quoted = []
+    for value in values:
+        value = u'' if value is None else text_type(value)
+        if any(char in value for char in u'\t"\r\n'):
+            value = u'"%s"' % value.replace(u'"', u'""')
+        quoted.append(value)
+    return quoted
@@ -0,0 +1,87 @@
+"""
+Functions to maintain the closure table (OntologyTermClosure) and the child counts of the ontology term hierarchy
+"""
+import logging
+from collections import Counter, defaultdict, deque
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def compute_closure(term_ids, edges):
+    """
+    Returns (ancestor_id, descendant_id, depth) for every term and each of its descendants
+    (including the term itself with depth 0) for a list of (parent_id, child_id) edges.
+    depth is the length of the shortest path, cycles are ignored
+    """
+    children = defaultdict(list)
+    for parent_id, child_id in edges:
+        children[parent_id].append(child_id)
+    for term_id in term_ids:
+        depths = {term_id: 0}
+        queue = deque([term_id])
+        while queue:
+            node = queue.popleft()
+            for child_id in children[node]:
+                if child_id not in depths:
+                    depths[child_id] = depths[node] + 1
+                    queue.append(child_id)
+        for descendant_id, depth in depths.items():
+            yield term_id, descendant_id, depth
+
+
+def rebuild_closure(term_model=None, closure_model=None):
+    """
+    Rebuilds the closure table from OntologyTerm.children
+    The models can be passed for data migrations
+    """
+    if term_model is None:
+        from phenotypedb.models import OntologyTerm as term_model, OntologyTermClosure as closure_model
+    term_ids = list(term_model.objects.values_list('pk', flat=True))
+    edges = term_model.children.through.objects.values_list('from_ontologyterm_id', 'to_ontologyterm_id')
+    with transaction.atomic():
+        closure_model.objects.all().delete()
+        closure_model.objects.bulk_create((closure_model(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+                                           for ancestor_id, descendant_id, depth in compute_closure(term_ids, list(edges))),
+                                          batch_size=500)
+    logger.info('Rebuilt the ontology closure of %s terms', len(term_ids))
+
+
+def update_child_counts(term_model=None):
+    """
+    Updates OntologyTerm.child_count from OntologyTerm.children
+    The model can be passed for data migrations
+    """
+    if term_model is None:
+        from phenotypedb.models import OntologyTerm as term_model
+    counts = Counter(term_model.children.through.objects.values_list('from_ontologyterm_id', flat=True))
+    changed = defaultdict(list)
+    for term_id, child_count in term_model.objects.values_list('pk', 'child_count'):
+        if counts[term_id] != child_count:
+            changed[counts[term_id]].append(term_id)
+    with transaction.atomic():
+        for child_count, term_ids in changed.items():
+            # necessary because sqlite has a limit of 999 SQL variables
+            for i in range(0, len(term_ids), 500):
+                term_model.objects.filter(pk__in=term_ids[i:i + 500]).update(child_count=child_count)
+
+
+def rebuild_hierarchy():
+    """
+    Rebuilds the closure table and the child counts
+    """
+    with transaction.atomic():
+        rebuild_closure()
+        update_child_counts()
+
+
+def schedule_rebuild():
+    """
+    Rebuilds the closure table and the child counts after the current transaction is committed
+    Loading an ontology changes the children of every term, so the rebuild is only scheduled once per transaction
+    """
+    connection = transaction.get_connection()
+    if any(func is rebuild_hierarchy for savepoint_ids, func in connection.run_on_commit):
+        return
+    transaction.on_commit(rebuild_hierarchy)
@@ -0,0 +1,77 @@
+"""
+Nodes of the ontology trees for jsTree
+The nodes are built from the precomputed OntologyTerm.child_count, so expanding a node is a single indexed query.
+The root nodes and the trees to a selected term are memoized in the cache. The cache keys contain the latest
+id of the closure table, which changes whenever the hierarchy is rebuilt (ids are not reused), so all worker
+processes see the new trees without explicit invalidation.
+"""
+from django.core.cache import cache
+from django.db.models import Max
+
+from phenotypedb.models import OntologyTerm, OntologyTermClosure
+
+TREE_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_root_nodes(source_id):
+    """
+    Returns the nodes of the terms of an ontology source without parents
+    """
+    return _memoize('roots:%s' % source_id, lambda: _get_root_nodes(source_id))
+
+
+def get_child_nodes(term_id):
+    """
+    Returns the nodes of the children of a term
+    """
+    children = OntologyTerm.children.through.objects.filter(from_ontologyterm_id=term_id).order_by('to_ontologyterm_id')
+    return [_to_node(*child) for child in children.values_list('to_ontologyterm_id', 'to_ontologyterm__name',
+                                                               'to_ontologyterm__child_count')]
+
+
+def get_tree_to_term(term):
+    """
+    Returns the root nodes of the source of the term with the path to the term opened and the term selected
+    (the first parent is followed if a term has several parents)
+    """
+    return _memoize('path:%s' % term.pk, lambda: _get_tree_to_term(term))
+
+
+def _get_root_nodes(source_id):
+    roots = OntologyTerm.objects.filter(source_id=source_id, parents=None).order_by('pk')
+    return [_to_node(*root) for root in roots.values_list('pk', 'name', 'child_count')]
+
+
+def _get_tree_to_term(term):
+    names = dict(OntologyTerm.objects.ancestors_of(term.pk).values_list('pk', 'name'))
+    # children of all ancestors with a single query (contains the parents of every term on the path)
+    children = {}
+    parents = {}
+    edges = OntologyTerm.children.through.objects.filter(from_ontologyterm_id__in=list(names)).order_by(
+        'from_ontologyterm_id', 'to_ontologyterm_id')
+    for parent_id, child_id, name, child_count in edges.values_list('from_ontologyterm_id', 'to_ontologyterm_id',
+                                                                     'to_ontologyterm__name',
+                                                                     'to_ontologyterm__child_count'):
+        children.setdefault(parent_id, []).append(_to_node(child_id, name, child_count))
+        parents.setdefault(child_id, parent_id)
+    node = _to_node(term.pk, term.name, term.child_count)
+    node['state'] = {'selected': True}
+    while node['id'] in parents:
+        parent_id = parents[node['id']]
+        siblings = [node if child['id'] == node['id'] else child for child in children[parent_id]]
+        node = {'id': parent_id, 'text': names[parent_id], 'children': siblings, 'state': {'opened': True}}
+    return [node if root['id'] == node['id'] else root for root in get_root_nodes(term.source_id)]
+
+
+def _to_node(term_id, name, child_count):
+    return {'id': term_id, 'text': name, 'children': child_count > 0}
+
+
+def _memoize(key, compute):
+    version = OntologyTermClosure.objects.aggregate(version=Max('pk'))['version']
+    key = 'ontology_tree:%s:%s' % (version, key)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, TREE_CACHE_TIMEOUT)
+    return value
@@ -0,0 +1,128 @@
+"""
+Functions to precompute the summary statistics of the phenotype values (PhenotypeStatistics)
+The values of many phenotypes are loaded with one query and split into the phenotypes on the sorted ids,
+so the statistics of a whole study are computed in a single pass.
+"""
+import json
+import logging
+
+import numpy as np
+from scipy.stats import shapiro, skew
+
+from django.db import transaction
+from phenotypedb.models import Phenotype, PhenotypeStatistics, PhenotypeValue
+from utils import response_cache
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BINS = 20
+
+
+def compute_statistics(values, accession_ids):
+    """
+    Returns the summary statistics and the Shapiro-Wilk test (test statistic, p-value)
+    of the values of a phenotype. Statistics that are undefined for the values are None
+    """
+    values = np.asarray(values, dtype=np.float64)
+    statistics = {'value_count': len(values), 'accession_count': len(np.unique(accession_ids)),
+                  'mean': None, 'sd': None, 'min': None, 'q1': None, 'median': None, 'q3': None, 'max': None,
+                  'skewness': None, 'histogram': ''}
+    if len(values) == 0:
+        return statistics, (None, None)
+    statistics['mean'] = float(values.mean())
+    (statistics['min'], statistics['q1'], statistics['median'],
+     statistics['q3'], statistics['max']) = [float(q) for q in np.percentile(values, [0, 25, 50, 75, 100])]
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    statistics['histogram'] = json.dumps({'edges': edges.tolist(), 'counts': counts.tolist()})
+    if len(values) > 1:
+        statistics['sd'] = float(values.std(ddof=1))
+    # the skewness and the Shapiro-Wilk test are undefined for constant values
+    if len(values) < 3 or statistics['max'] == statistics['min']:
+        return statistics, (None, None)
+    statistics['skewness'] = float(skew(values))
+    test_statistic, p_value = shapiro(values)
+    return statistics, (float(test_statistic), float(p_value))
+
+
+def update_statistics(phenotype_ids):
+    """
+    Recomputes the statistics of the phenotypes
+    """
+    phenotype_ids = sorted(set(phenotype_ids))
+    # necessary because sqlite has a limit of 999 SQL variables
+    for i in range(0, len(phenotype_ids), 500):
+        _update_statistics(phenotype_ids[i:i + 500])
+    return len(phenotype_ids)
+
+
+def update_all_statistics(missing_only=False):
+    """
+    Computes the statistics of all published phenotypes (or only of those without statistics)
+    """
+    phenotypes = Phenotype.objects.published()
+    if missing_only:
+        phenotypes = phenotypes.filter(statistics=None)
+    count = update_statistics(phenotypes.values_list('pk', flat=True))
+    logger.info('Computed the statistics of %s phenotypes', count)
+    return count
+
+
+def get_statistics(phenotype):
+    """
+    Returns the statistics of the phenotype and computes them if they are missing
+    """
+    try:
+        return PhenotypeStatistics.objects.get(phenotype=phenotype)
+    except PhenotypeStatistics.DoesNotExist:
+        update_statistics([phenotype.pk])
+        return PhenotypeStatistics.objects.get(phenotype=phenotype)
+
+
+def schedule_update(phenotype_ids):
+    """
+    Recomputes the statistics of the phenotypes after the current transaction is committed
+    The phenotypes are added to an update that is already scheduled in the transaction
+    """
+    connection = transaction.get_connection()
+    for savepoint_ids, func in connection.run_on_commit:
+        if isinstance(func, _ScheduledUpdate):
+            func.phenotype_ids.update(phenotype_ids)
+            return
+    transaction.on_commit(_ScheduledUpdate(phenotype_ids))
+
+
+class _ScheduledUpdate(object):
+
+    def __init__(self, phenotype_ids):
+        self.phenotype_ids = set(phenotype_ids)
+
+    def __call__(self):
+        try:
+            update_statistics(self.phenotype_ids)
+        except Exception:
+            logger.exception('Updating the statistics of %s phenotypes failed', len(self.phenotype_ids))
+
+
+def _update_statistics(phenotype_ids):
+    phenotypes = list(Phenotype.objects.filter(pk__in=phenotype_ids).order_by('pk').values_list('pk', 'study_id'))
+    phenotype_ids = [phenotype_id for phenotype_id, study_id in phenotypes]
+    values = PhenotypeValue.objects.filter(phenotype_id__in=phenotype_ids).order_by('phenotype_id').values_list(
+        'phenotype_id', 'obs_unit__accession_id', 'value')
+    data = np.array(list(values), dtype=np.float64).reshape(-1, 3)
+    # the rows of a phenotype are between its first index and the first index of the next phenotype
+    starts = np.searchsorted(data[:, 0], phenotype_ids, side='left')
+    ends = np.searchsorted(data[:, 0], phenotype_ids, side='right')
+    statistics = []
+    with transaction.atomic():
+        for phenotype_id, start, end in zip(phenotype_ids, starts, ends):
+            fields, (test_statistic, p_value) = compute_statistics(data[start:end, 2], data[start:end, 1])
+            statistics.append(PhenotypeStatistics(phenotype_id=phenotype_id, **fields))
+            # update() doesn't change Phenotype.update_date and sends no signals
+            Phenotype.objects.filter(pk=phenotype_id).update(shapiro_test_statistic=test_statistic,
+                                                             shapiro_p_value=p_value)
+        PhenotypeStatistics.objects.filter(phenotype_id__in=phenotype_ids).delete()
+        PhenotypeStatistics.objects.bulk_create(statistics, batch_size=500)
+    # the cached responses contain the statistics, but update() doesn't change their validators
+    tags = set(['phenotype:%s' % phenotype_id for phenotype_id, study_id in phenotypes] +
+               ['study:%s' % study_id for phenotype_id, study_id in phenotypes])
+    transaction.on_commit(lambda: response_cache.invalidate(tags))
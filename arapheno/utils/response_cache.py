@@ -0,0 +1,277 @@
+"""
+Cache for the rendered REST responses that is shared between the worker processes
+The responses are stored in a SQLite database (settings.RESPONSE_CACHE_PATH) and the least recently used
+responses are evicted when the cache gets bigger than settings.RESPONSE_CACHE_MAX_SIZE bytes.
+Every response is tagged (e.g. study:1, phenotype:2 or list) and invalidated by its tags.
+Hits are read without a write lock, their access times and the counters are written in batches.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+DEFAULT_MAX_ENTRY_SIZE = 32 * 1024 * 1024
+
+# seconds between the writes of the access times and the counters
+FLUSH_INTERVAL = 10
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, headers TEXT NOT NULL, content BLOB NOT NULL, '
+    'size INTEGER NOT NULL, accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)',
+    'CREATE TABLE IF NOT EXISTS response_tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))',
+    'CREATE INDEX IF NOT EXISTS response_tags_key ON response_tags (key)',
+    'CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    "INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0)",
+    # running total of the response sizes
+    "INSERT OR IGNORE INTO counters (name, value) SELECT 'size', COALESCE(SUM(size), 0) FROM responses",
+)
+
+_local = threading.local()
+
+
+def is_enabled():
+    """
+    Checks if the response cache is configured
+    """
+    return bool(getattr(settings, 'RESPONSE_CACHE_PATH', None))
+
+
+def _get_connection():
+    path = settings.RESPONSE_CACHE_PATH
+    # sqlite connections can't be shared between threads and forked processes
+    key = (path, os.getpid())
+    if getattr(_local, 'key', None) != key:
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        for statement in _SCHEMA:
+            connection.execute(statement)
+        _local.key = key
+        _local.connection = connection
+    return _local.connection
+
+
+def _write(function, *args):
+    connection = _get_connection()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        result = function(connection, *args)
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+    return result
+
+
+def _get(key):
+    # a single SELECT is its own read transaction, in WAL mode it doesn't wait for the writers
+    row = _get_connection().execute('SELECT headers, content FROM responses WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        _record_access('misses')
+        return None
+    _record_access('hits', key)
+    return json.loads(row[0]), bytes(row[1])
+
+
+def _record_access(counter, key=None):
+    pending = _get_pending()
+    pending[counter] += 1
+    if key is not None:
+        pending['accessed'][key] = time.time()
+    if time.time() - pending['flushed'] >= FLUSH_INTERVAL:
+        _flush()
+
+
+def _get_pending():
+    if getattr(_local, 'pending_key', None) != _local.key:
+        _local.pending_key = _local.key
+        _local.pending = {'hits': 0, 'misses': 0, 'accessed': {}, 'flushed': time.time()}
+    return _local.pending
+
+
+def _flush():
+    pending = _get_pending()
+    try:
+        _write(_update_access, pending['hits'], pending['misses'], list(pending['accessed'].items()))
+    except sqlite3.Error:
+        logger.exception('Writing the response cache counters failed')
+    pending.update(hits=0, misses=0, accessed={}, flushed=time.time())
+
+
+def _update_access(connection, hits, misses, accessed):
+    connection.executemany('UPDATE counters SET value = value + ? WHERE name = ?', [(hits, 'hits'), (misses, 'misses')])
+    connection.executemany('UPDATE responses SET accessed = ? WHERE key = ?', [(t, key) for key, t in accessed])
+
+
+def _set(connection, key, tags, headers, content, max_size):
+    old_size = connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+    connection.execute('INSERT OR REPLACE INTO responses (key, headers, content, size, accessed) VALUES (?, ?, ?, ?, ?)',
+                       (key, json.dumps(headers), sqlite3.Binary(content), len(content), time.time()))
+    connection.executemany('INSERT OR IGNORE INTO response_tags (tag, key) VALUES (?, ?)', [(tag, key) for tag in tags])
+    size = _add_size(connection, len(content) - (old_size[0] if old_size else 0))
+    if size <= max_size:
+        return
+    evicted = []
+    for old_key, old_size in connection.execute('SELECT key, size FROM responses ORDER BY accessed'):
+        if size <= max_size:
+            break
+        evicted.append((old_key,))
+        size -= old_size
+    connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+    connection.executemany('DELETE FROM response_tags WHERE key = ?', evicted)
+    connection.execute("UPDATE counters SET value = ? WHERE name = 'size'", (size,))
+
+
+def _add_size(connection, difference):
+    connection.execute("UPDATE counters SET value = value + ? WHERE name = 'size'", (difference,))
+    return connection.execute("SELECT value FROM counters WHERE name = 'size'").fetchone()[0]
+
+
+def _invalidate(connection, tags):
+    for tag in tags:
+        size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses WHERE key IN '
+                                  '(SELECT key FROM response_tags WHERE tag = ?)', (tag,)).fetchone()[0]
+        keys = connection.execute('SELECT key FROM response_tags WHERE tag = ?', (tag,)).fetchall()
+        connection.executemany('DELETE FROM responses WHERE key = ?', keys)
+        connection.executemany('DELETE FROM response_tags WHERE key = ?', keys)
+        _add_size(connection, -size)
+
+
+def _clear(connection):
+    connection.execute('DELETE FROM responses')
+    connection.execute('DELETE FROM response_tags')
+    connection.execute('UPDATE counters SET value = 0')
+
+
+def get_response(key):
+    """
+    Returns the cached response for the key or None
+    """
+    try:
+        cached = _get(key)
+    except sqlite3.Error:
+        logger.exception('Reading the response cache failed')
+        return None
+    if cached is None:
+        return None
+    headers, content = cached
+    response = HttpResponse(content)
+    for header, value in headers:
+        response[header] = value
+    return response
+
+
+def set_response(key, tags, response):
+    """
+    Stores a rendered response with its tags (responses bigger than RESPONSE_CACHE_MAX_ENTRY_SIZE are not stored)
+    Streaming responses are stored after they were sent, their content is only kept up to the size limit
+    """
+    if response.streaming:
+        response.streaming_content = _tee_content(key, tags, list(response.items()), response.streaming_content)
+        return response
+    _store(key, tags, list(response.items()), response.content)
+    return response
+
+
+def _tee_content(key, tags, headers, streaming_content):
+    chunks = []
+    size = 0
+    max_entry_size = _get_max_entry_size()
+    for chunk in streaming_content:
+        if chunks is not None:
+            size += len(chunk)
+            # stop collecting as soon as the response is too big to be stored
+            if size <= max_entry_size:
+                chunks.append(chunk)
+            else:
+                chunks = None
+        yield chunk
+    # not reached if the client disconnects, so incomplete responses are never stored
+    if chunks is not None:
+        _store(key, tags, headers, b''.join(chunks))
+
+
+def _store(key, tags, headers, content):
+    max_size = getattr(settings, 'RESPONSE_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE)
+    if len(content) > _get_max_entry_size():
+        return
+    try:
+        _write(_set, key, tags, headers, content, max_size)
+    except sqlite3.Error:
+        logger.exception('Writing the response cache failed')
+
+
+def _get_max_entry_size():
+    return min(getattr(settings, 'RESPONSE_CACHE_MAX_ENTRY_SIZE', DEFAULT_MAX_ENTRY_SIZE),
+               getattr(settings, 'RESPONSE_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE))
+
+
+def invalidate(tags):
+    """
+    Removes all responses with one of the tags
+    """
+    if not is_enabled():
+        return
+    try:
+        _write(_invalidate, list(tags))
+    except sqlite3.Error:
+        logger.exception('Invalidating the response cache failed')
+
+
+def clear():
+    """
+    Removes all responses and resets the counters
+    """
+    if not is_enabled():
+        return
+    _write(_clear)
+    _get_pending().update(hits=0, misses=0, accessed={}, flushed=time.time())
+
+
+def get_stats():
+    """
+    Returns the hit and miss counters, the number of responses and their size in bytes
+    """
+    if not is_enabled():
+        return None
+    connection = _get_connection()
+    # the counters of the other processes are included after their next flush
+    _flush()
+    stats = dict(connection.execute('SELECT name, value FROM counters').fetchall())
+    stats['entries'] = connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+    return stats
+
+
+def cached_response(get_tags):
+    """
+    Returns a decorator for REST views that caches successful GET responses.
+    The responses are keyed by the path (endpoint, object id and format suffix), the query string and the Accept header.
+    get_tags is called with the arguments of the view and returns the tags of the response or None if it can't be cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def _wrapped_view(request, *args, **kwargs):
+            tags = get_tags(*args, **kwargs) if is_enabled() and request.method == 'GET' else None
+            if tags is None:
+                return view(request, *args, **kwargs)
+            key = '|'.join([request.path, request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', '')])
+            response = get_response(key)
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            return set_response(key, tags, response)
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,226 @@
+"""
+Full-text search index for phenotypes, studies, accessions and ontology terms
+The index is a SQLite FTS5 table that only contains published phenotypes and studies.
+The rowids of the objects are stored in a separate table, because the entity and object_id columns can't be indexed.
+If the table is not available (e.g. other database backends) the icontains lookups are used.
+"""
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from phenotypedb.models import Accession, OntologyTerm, Phenotype, Study
+
+SEARCH_TABLE = 'phenotypedb_searchindex'
+SEARCH_KEY_TABLE = 'phenotypedb_searchindexkey'
+
+# weights of the name, terms and text columns for the bm25 ranking
+RANKING = 'bm25(%s, 0, 0, 10.0, 5.0, 1.0)' % SEARCH_TABLE
+
+# number of matches that are ordered by relevance in filter_queryset (sqlite has a limit of 999 SQL variables)
+RANKED_RESULTS = 200
+
+ENTITIES = ('phenotype', 'study', 'accession', 'ontology')
+
+_LEGACY_FILTERS = {
+    'phenotype': lambda query: Q(name__icontains=query) | Q(to_term__id__icontains=query) | Q(to_term__name__icontains=query),
+    'study': lambda query: Q(name__icontains=query),
+    'accession': lambda query: Q(name__icontains=query),
+    'ontology': lambda query: Q(name__icontains=query),
+}
+
+_index_available = None
+
+
+def is_index_available():
+    """
+    Checks if the search index table exists
+    """
+    global _index_available
+    if _index_available is None:
+        _index_available = SEARCH_TABLE in connection.introspection.table_names()
+    return _index_available
+
+
+def get_queryset(entity):
+    """
+    Returns the searchable objects of an entity
+    """
+    if entity == 'phenotype':
+        return Phenotype.objects.published()
+    elif entity == 'study':
+        return Study.objects.published()
+    elif entity == 'accession':
+        return Accession.objects.all()
+    elif entity == 'ontology':
+        return OntologyTerm.objects.all()
+    raise ValueError('Entity %s not supported' % entity)
+
+
+def filter_queryset(entity, queryset, query):
+    """
+    Restricts the queryset to the objects that match the query
+    The RANKED_RESULTS best matches are ordered by relevance and followed by the other matches ordered by name
+    (all objects are ordered by name if there is no query or no search index)
+    """
+    if not query:
+        return queryset.order_by('name')
+    if not is_index_available():
+        return queryset.filter(_LEGACY_FILTERS[entity](query)).order_by('name')
+    match = _to_match_expression(query)
+    if match is None:
+        return queryset.none()
+    pk_column = '%s.%s' % (queryset.model._meta.db_table, queryset.model._meta.pk.column)
+    queryset = queryset.extra(where=['%s IN (SELECT object_id FROM %s WHERE %s MATCH %%s AND entity = %%s)' %
+                                     (pk_column, SEARCH_TABLE, SEARCH_TABLE)], params=[match, entity])
+    # the ranking is computed in a separate query, because bm25 can't be used in the subquery of count()
+    ids = search_ids(entity, query, RANKED_RESULTS)
+    ranking = Case(*[When(pk=pk, then=Value(rank)) for rank, pk in enumerate(ids)],
+                   default=Value(len(ids)), output_field=IntegerField())
+    return queryset.annotate(search_rank=ranking).order_by('search_rank', 'name')
+
+
+def search(entity, query, limit, offset=0):
+    """
+    Returns a page of objects that match the query ordered by relevance
+    """
+    ids = search_ids(entity, query, limit, offset)
+    queryset = get_queryset(entity)
+    if entity == 'study':
+        # the search results contain the counts of StudyListSerializer
+        queryset = queryset.with_counts()
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def search_ids(entity, query, limit, offset=0):
+    """
+    Returns the primary keys of a page of objects that match the query ordered by relevance
+    """
+    queryset = get_queryset(entity)
+    if not query:
+        return list(queryset.order_by('name', 'pk').values_list('pk', flat=True)[offset:offset + limit])
+    if not is_index_available():
+        return list(filter_queryset(entity, queryset, query).order_by('name', 'pk').values_list('pk', flat=True)[offset:offset + limit])
+    match = _to_match_expression(query)
+    if match is None:
+        return []
+    cursor = connection.cursor()
+    cursor.execute('SELECT object_id FROM %s WHERE %s MATCH %%s AND entity = %%s ORDER BY %s LIMIT %%s OFFSET %%s' %
+                   (SEARCH_TABLE, SEARCH_TABLE, RANKING), [match, entity, limit, offset])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def count(query):
+    """
+    Returns the number of matches for every entity
+    """
+    counts = dict((entity, 0) for entity in ENTITIES)
+    if not query or not is_index_available():
+        for entity in ENTITIES:
+            counts[entity] = filter_queryset(entity, get_queryset(entity), query).count()
+        return counts
+    match = _to_match_expression(query)
+    if match is None:
+        return counts
+    cursor = connection.cursor()
+    cursor.execute('SELECT entity, count(*) FROM %s WHERE %s MATCH %%s GROUP BY entity' %
+                   (SEARCH_TABLE, SEARCH_TABLE), [match])
+    counts.update(cursor.fetchall())
+    return counts
+
+
+def index_objects(entity, objects):
+    """
+    Adds or replaces the objects in the search index
+    """
+    if not is_index_available():
+        return
+    objects = list(objects)
+    remove_objects(entity, [obj.pk for obj in objects])
+    cursor = connection.cursor()
+    # sqlite has a limit of 999 SQL variables
+    for i in range(0, len(objects), 500):
+        chunk = objects[i:i + 500]
+        cursor.executemany('INSERT INTO %s (entity, object_id) VALUES (%%s, %%s)' % SEARCH_KEY_TABLE,
+                           [(entity, obj.pk) for obj in chunk])
+        rowids = dict((object_id, rowid) for rowid, object_id in _get_rowids(cursor, entity, [obj.pk for obj in chunk]))
+        cursor.executemany('INSERT INTO %s (rowid, entity, object_id, name, terms, text) VALUES (%%s, %%s, %%s, %%s, %%s, %%s)' % SEARCH_TABLE,
+                           [(rowids[obj.pk], entity, obj.pk) + _get_document(entity, obj) for obj in chunk])
+
+
+def remove_objects(entity, ids):
+    """
+    Removes the objects from the search index
+    """
+    if not is_index_available():
+        return
+    ids = list(ids)
+    cursor = connection.cursor()
+    # sqlite has a limit of 999 SQL variables
+    for i in range(0, len(ids), 500):
+        rowids = [(rowid,) for rowid, object_id in _get_rowids(cursor, entity, ids[i:i + 500])]
+        # deleting by rowid doesn't scan the whole index
+        cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % SEARCH_TABLE, rowids)
+        cursor.executemany('DELETE FROM %s WHERE id = %%s' % SEARCH_KEY_TABLE, rowids)
+
+
+def rebuild_index():
+    """
+    Recreates the content of the search index
+    """
+    if not is_index_available():
+        raise Exception('Search index table %s does not exist' % SEARCH_TABLE)
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+    cursor.execute('DELETE FROM %s' % SEARCH_KEY_TABLE)
+    for entity in ENTITIES:
+        queryset = get_queryset(entity)
+        if entity == 'phenotype':
+            queryset = queryset.select_related('to_term', 'eo_term', 'uo_term')
+        index_objects(entity, queryset.iterator())
+    cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (SEARCH_TABLE, SEARCH_TABLE))
+
+
+def _get_rowids(cursor, entity, ids):
+    """
+    Returns the (rowid, object_id) of the indexed objects
+    """
+    if len(ids) == 0:
+        return []
+    cursor.execute('SELECT id, object_id FROM %s WHERE entity = %%s AND object_id IN (%s)' %
+                   (SEARCH_KEY_TABLE, ','.join(['%s'] * len(ids))), [entity] + list(ids))
+    return cursor.fetchall()
+
+
+def _get_document(entity, obj):
+    """
+    Returns the name, terms and text columns of an object
+    """
+    if entity == 'phenotype':
+        terms = []
+        for term in (obj.to_term, obj.eo_term, obj.uo_term):
+            if term is not None:
+                terms.extend([term.id, term.name])
+        return (obj.name, ' '.join(terms), _join(obj.scoring, obj.growth_conditions, obj.source, obj.type))
+    elif entity == 'study':
+        return (obj.name, '', _join(obj.description))
+    elif entity == 'accession':
+        return (obj.name, _join(obj.country, obj.cs_number), _join(obj.sitename, obj.collector))
+    elif entity == 'ontology':
+        return (obj.name, obj.id, _join(obj.definition, obj.comment))
+    raise ValueError('Entity %s not supported' % entity)
+
+
+def _join(*values):
+    return ' '.join(value for value in values if value)
+
+
+def _to_match_expression(query):
+    """
+    Converts a user query into a FTS5 expression
+    every word is matched as a (quoted) prefix and all words have to match
+    """
+    words = [word.replace('"', '""') for word in query.split()]
+    words = [word for word in words if any(c.isalnum() for c in word)]
+    if len(words) == 0:
+        return None
+    return ' '.join('"%s"*' % word for word in words)
@@ -0,0 +1,151 @@
+"""
+Database backed queue for study submissions
+Uploads are stored as SubmissionJob and imported by the process_submissions worker,
+so that the web workers don't parse and save large studies inside the request.
+"""
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.utils import timezone
+
+from phenotypedb.models import (Accession, Submission, SubmissionJob, JOB_QUEUED, JOB_RUNNING,
+                                JOB_FINISHED, JOB_FAILED)
+from utils import import_study
+from utils.correlation import update_missing_correlations
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_submission(upload, firstname, lastname, email):
+    """
+    Stores the uploaded file and creates the job that imports it
+    """
+    job_id = uuid.uuid4()
+    upload_dir = settings.SUBMISSION_UPLOAD_DIR
+    if not os.path.exists(upload_dir):
+        os.makedirs(upload_dir)
+    path = os.path.join(upload_dir, '%s_%s' % (job_id, os.path.basename(upload.name)))
+    with open(path, 'wb') as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    return SubmissionJob.objects.create(id=job_id, firstname=firstname, lastname=lastname, email=email,
+                                        filename=upload.name, path=path, message='Waiting to be imported')
+
+
+def claim_next_job():
+    """
+    Marks the oldest queued job as running and returns it (None if there is no job).
+    The status is changed with a conditional update, so that several workers don't import the same job
+    """
+    fail_stale_jobs()
+    while True:
+        job = SubmissionJob.objects.filter(status=JOB_QUEUED).order_by('submission_date').first()
+        if job is None:
+            return None
+        claimed = SubmissionJob.objects.filter(pk=job.pk, status=JOB_QUEUED).update(
+            status=JOB_RUNNING, start_date=timezone.now(), message='Importing study')
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def fail_stale_jobs(timeout=None):
+    """
+    Marks the jobs that are running for longer than the timeout (SUBMISSION_JOB_TIMEOUT seconds) as failed.
+    Their worker was stopped during the import, so they would otherwise stay running forever.
+    The jobs are failed instead of requeued, so that a study that kills the worker isn't imported again and again
+    """
+    if timeout is None:
+        timeout = settings.SUBMISSION_JOB_TIMEOUT
+    stale_jobs = SubmissionJob.objects.filter(status=JOB_RUNNING,
+                                              start_date__lt=timezone.now() - timedelta(seconds=timeout))
+    failed = 0
+    for job in stale_jobs:
+        # conditional update, because the job could be finished or failed by another worker in the meantime
+        if SubmissionJob.objects.filter(pk=job.pk, status=JOB_RUNNING).update(
+                status=JOB_FAILED, end_date=timezone.now(), message='Import was interrupted. Please submit the study again'):
+            logger.warning('Submission %s was running since %s and is marked as failed', job.pk, job.start_date)
+            _remove_upload(job)
+            failed += 1
+    return failed
+
+
+def process_job(job):
+    """
+    Imports the study of the job, creates the submission and sends the confirmation email
+    """
+    try:
+        with transaction.atomic(), open(job.path, 'rb') as fhandle:
+            study = import_study(fhandle, job.filename)
+            submission = Submission(id=job.id, study=study, firstname=job.firstname,
+                                    lastname=job.lastname, email=job.email)
+            submission.save()
+    except Accession.DoesNotExist as err:
+        _finish_job(job, JOB_FAILED, 'Unknown accession with ID: %s' % err.args[-1])
+        return None
+    except Exception as err:
+        logger.exception('Importing submission %s failed', job.pk)
+        _finish_job(job, JOB_FAILED, str(err))
+        return None
+    _finish_job(job, JOB_FINISHED, 'Study imported')
+    try:
+        send_submission_email(submission)
+    except Exception:
+        logger.exception('Sending the email for submission %s failed', submission.pk)
+    return submission
+
+
+def run_worker(interval=5, once=False):
+    """
+    Imports the queued jobs (until the queue is empty if once is True)
+    The correlations of newly published studies are computed when the queue is empty
+    """
+    while True:
+        job = claim_next_job()
+        if job is not None:
+            process_job(job)
+            continue
+        try:
+            update_missing_correlations()
+        except Exception:
+            logger.exception('Updating the correlations failed')
+        if once:
+            return
+        time.sleep(interval)
+
+
+def send_submission_email(submission):
+    """
+    Sends the confirmation email of a submission
+    """
+    email = EmailMessage(
+        'Study submitted to AraPheno',
+        submission.get_email_text(),
+        'uemit.seren@gmi.oeaw.ac.at',
+        [submission.email],
+        [settings.ADMINS[0][1]],
+        reply_to=['uemit.seren@gmi.oeaw.ac.at']
+    )
+    email.send(True)
+
+
+def _finish_job(job, status, message):
+    job.status = status
+    job.message = message
+    job.end_date = timezone.now()
+    job.save()
+    _remove_upload(job)
+
+
+def _remove_upload(job):
+    try:
+        os.unlink(job.path)
+    except OSError:
+        pass
+
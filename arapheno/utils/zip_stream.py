@@ -0,0 +1,84 @@
+"""
+Writer for zip archives that are generated as a stream of byte chunks
+zipfile.ZipFile needs a seekable file to write the sizes of a member into its header,
+so the members are written with data descriptors instead (the sizes follow the compressed data).
+The archive is never stored completely in memory or on disk. Zip64 is not supported (members and archive < 4 GB).
+"""
+import struct
+import time
+import zlib
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+
+_VERSION = 20
+# bit 3: crc and sizes are stored in the data descriptor, bit 11: utf-8 file names
+_FLAGS = 0x0008 | 0x0800
+
+
+class ZipStream(object):
+    """
+    Generates a zip archive member by member
+    Usage: for each member iterate over write_iter(name, chunks), then iterate over close()
+    """
+
+    def __init__(self, compresslevel=6):
+        self.compresslevel = compresslevel
+        self._entries = []
+        self._offset = 0
+
+    def write_iter(self, name, chunks):
+        """
+        Yields the compressed member for an iterable of byte chunks
+        """
+        name = name.encode('utf-8')
+        dos_time, dos_date = _get_dos_date_time()
+        header_offset = self._offset
+        header = _LOCAL_HEADER.pack(0x04034b50, _VERSION, _FLAGS, zlib.DEFLATED, dos_time, dos_date,
+                                    0, 0, 0, len(name), 0) + name
+        yield self._count(header)
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc = 0
+        size = 0
+        compressed_size = 0
+        for chunk in chunks:
+            if not chunk:
+                continue
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield self._count(data)
+        data = compressor.flush()
+        compressed_size += len(data)
+        crc &= 0xffffffff
+        yield self._count(data + _DATA_DESCRIPTOR.pack(0x08074b50, crc, compressed_size, size))
+        self._entries.append((name, dos_time, dos_date, crc, compressed_size, size, header_offset))
+
+    def close(self):
+        """
+        Yields the central directory that ends the archive
+        """
+        directory_offset = self._offset
+        directory = []
+        for name, dos_time, dos_date, crc, compressed_size, size, header_offset in self._entries:
+            directory.append(_CENTRAL_HEADER.pack(0x02014b50, _VERSION, _VERSION, _FLAGS, zlib.DEFLATED, dos_time,
+                                                  dos_date, crc, compressed_size, size, len(name), 0, 0, 0, 0,
+                                                  0o644 << 16, header_offset) + name)
+        directory = b''.join(directory)
+        yield self._count(directory + _END_OF_CENTRAL_DIRECTORY.pack(
+            0x06054b50, 0, 0, len(self._entries), len(self._entries), len(directory), directory_offset, 0))
+
+    def _count(self, data):
+        self._offset += len(data)
+        return data
+
+
+def _get_dos_date_time():
+    now = time.localtime()
+    dos_time = (now.tm_hour << 11) | (now.tm_min << 5) | (now.tm_sec // 2)
+    dos_date = ((now.tm_year - 1980) << 9) | (now.tm_mon << 5) | now.tm_mday
+    return dos_time, dos_date
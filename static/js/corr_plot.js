@@ -62,8 +62,6 @@ function corrPlot() {
 		//PREPARE DATA
         var pheno_ids = [];
         __mapping = {};
-        __data_matrix = JSON.parse(__data_matrix)
-        __spear_matrix = JSON.parse(__spear_matrix)
         for (var i=0; i<__axes_data.length; i++) {
             pheno_ids.push(__axes_data[i].pheno_id);
             //if(!__axes_data[i].pheno_id in __mapping) {
@@ -71,7 +69,7 @@ function corrPlot() {
             //}
             for (var j=0; j<__axes_data.length;j++){
                 if(i==j) continue;
-                if(isNaN(__data_matrix[__axes_data[i].index][__axes_data[j].index])) continue;
+                if(__data_matrix[__axes_data[i].index][__axes_data[j].index] === null) continue;
                 __data.push({"i":i,
                              "j":j,
                              "x_pheno_id":__axes_data[i].pheno_id, 